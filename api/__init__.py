@@ -1,21 +1,91 @@
-from flask import Flask, send_from_directory
+from flask import Flask, Response, abort, g, request, send_from_directory
+from werkzeug.security import safe_join
+import hmac
+import mimetypes
 from flask_cors import CORS
 import os
+import time
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+# Uploaded files are never modified in place, so browsers may cache them for a year
+UPLOAD_MAX_AGE = 365 * 24 * 3600
+
+# Process-wide hooks point at the services of the most recently created app.
+# They are registered once per process; registering them in every create_app
+# would run each handler once per app (tests and benchmarks create several).
+_process_hooks = {}
+
+def bind_process_hooks(services):
+    """Route this process's write events and metrics samples to services, registering the hooks on first use"""
+    from services.events import events
+    from services.metrics import metrics
+    
+    first = not _process_hooks
+    _process_hooks['services'] = services
+    if first:
+        # Queue push notifications for write events; the dispatcher process sends them
+        events.subscribe(lambda topic, **fields: _process_hooks['services'].notifications.on_event(topic, **fields))
+        # Log them for the event stream server, which replays from the log
+        events.subscribe(lambda topic, **fields: _process_hooks['services'].event_log.on_event(topic, **fields))
+        # JWT cache samples for the metrics snapshot
+        metrics.register_collector(lambda: _process_hooks['services'].collect_metrics())
+
 def create_app():
     app = Flask(__name__)
     
     # Configuration
     app.config['SECRET_KEY'] = os.getenv('SECRET_KEY', 'your-secret-key-here')
-    app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
+    # Werkzeug stops reading any body past this size, chunked ones included, so an
+    # oversized upload is refused before it is spooled; the upload form is the largest body
+    from api.upload import MULTIPART_OVERHEAD
+    app.config['MAX_CONTENT_LENGTH'] = int(os.getenv('MAX_FILE_SIZE', 5 * 1024 * 1024)) + MULTIPART_OVERHEAD
     
     # Enable CORS
     CORS(app)
     
+    # One set of services per app, shared by every blueprint; each is built on first use
+    from services.container import ServiceContainer
+    app.extensions['services'] = ServiceContainer()
+    
+    # Queue push notifications for write events, log them for the event stream
+    # and report service metrics; the dispatcher, stream server and scrapes take
+    # it from there
+    bind_process_hooks(app.extensions['services'])
+    
+    # Request duration per route and status. Handlers turn failures into 500
+    # responses, so errors show up here under their status code.
+    from services.metrics import metrics
+    
+    @app.before_request
+    def start_timer():
+        g.request_started = time.perf_counter()
+    
+    @app.after_request
+    def record_duration(response):
+        started = g.pop('request_started', None)
+        if started is not None:
+            metrics.observe('http_request_duration_seconds', time.perf_counter() - started,
+                            method=request.method, status=response.status_code,
+                            route=request.url_rule.rule if request.url_rule else 'unmatched')
+        return response
+    
+    # Prometheus scrape endpoint, covering every worker process. Port 8000 is
+    # published directly, so it needs a bearer token (METRICS_TOKEN) and is
+    # disabled without one; nginx additionally limits it to private networks.
+    @app.route('/metrics')
+    def prometheus_metrics():
+        expected = os.getenv('METRICS_TOKEN')
+        if not expected:
+            abort(404)
+        supplied = request.headers.get('Authorization', '')
+        if not hmac.compare_digest(supplied.encode(), f'Bearer {expected}'.encode()):
+            return Response('Metrics token required\n', status=401, mimetype='text/plain',
+                            headers={'WWW-Authenticate': 'Bearer'})
+        return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+    
     # Import blueprints here to avoid circular imports
     from .auth import auth_bp
     from .tasks import tasks_bp
@@ -23,6 +93,7 @@ def create_app():
     from .upload import upload_bp
     from .notifications import notifications_bp
     from .users import users_bp
+    from .admin import admin_bp
     
     # Register blueprints
     app.register_blueprint(auth_bp, url_prefix='/api')
@@ -31,12 +102,38 @@ def create_app():
     app.register_blueprint(upload_bp, url_prefix='/api/upload')
     app.register_blueprint(notifications_bp, url_prefix='/api/notifications')
     app.register_blueprint(users_bp, url_prefix='/api/users')
+    app.register_blueprint(admin_bp, url_prefix='/api/admin')
     
-    # Serve uploaded files
+    # Serve uploaded files, picking a size variant from ?size= and WebP when accepted.
+    # Stored files never change, so they are cached as immutable. With
+    # UPLOAD_ACCEL_PREFIX set, nginx sends the bytes via X-Accel-Redirect.
     @app.route('/uploads/<filename>')
     def uploaded_file(filename):
+        from services.upload import IMAGE_VARIANTS, resolve_variant
+        
         upload_folder = os.getenv('UPLOAD_FOLDER', '/app/uploads')
-        return send_from_directory(upload_folder, filename)
+        size = request.args.get('size', 'full')
+        if size not in IMAGE_VARIANTS:
+            return {'error': f"size must be one of: {', '.join(IMAGE_VARIANTS)}"}, 400
+        
+        webp = 'image/webp' in request.headers.get('Accept', '')
+        path = resolve_variant(upload_folder, filename, size, webp)
+        if safe_join(upload_folder, path) is None:
+            abort(404)
+        
+        accel_prefix = os.getenv('UPLOAD_ACCEL_PREFIX')
+        if accel_prefix:
+            # nginx handles ETag, Range and conditional requests for the internal location
+            response = Response(mimetype=mimetypes.guess_type(path)[0] or 'application/octet-stream')
+            response.headers['X-Accel-Redirect'] = accel_prefix.rstrip('/') + '/' + path
+        else:
+            # Filenames are content hashes (or unique IDs), so the name is a strong validator
+            response = send_from_directory(upload_folder, path, etag=os.path.basename(path),
+                                           max_age=UPLOAD_MAX_AGE)
+        
+        response.headers['Cache-Control'] = f'public, max-age={UPLOAD_MAX_AGE}, immutable'
+        response.vary.add('Accept')
+        return response
     
     # Health check endpoint
     @app.route('/api/health')
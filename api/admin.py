@@ -0,0 +1,36 @@
+import hmac
+import os
+
+from flask import Blueprint, request, jsonify
+from services.querylog import SORT_KEYS, query_log, top_statements
+
+admin_bp = Blueprint('admin', __name__)
+
+def is_admin_request():
+    """Check the X-Admin-Token header against ADMIN_TOKEN; without one, admin routes are disabled"""
+    expected = os.getenv('ADMIN_TOKEN')
+    supplied = request.headers.get('X-Admin-Token', '')
+    return bool(expected) and hmac.compare_digest(supplied.encode(), expected.encode())
+
+@admin_bp.route('/queries', methods=['GET'])
+def get_query_stats():
+    """Most expensive SQL statements across all workers, with plans of slow ones"""
+    try:
+        if not os.getenv('ADMIN_TOKEN'):
+            return jsonify({'error': 'Not found'}), 404
+        if not is_admin_request():
+            return jsonify({'error': 'Admin token required'}), 401
+        
+        sort = request.args.get('sort', 'total_ms')
+        if sort not in SORT_KEYS:
+            return jsonify({'error': f"sort must be one of: {', '.join(SORT_KEYS)}"}), 400
+        limit = max(1, min(request.args.get('limit', default=20, type=int), 100))
+        
+        return jsonify({
+            'slow_query_ms': query_log.threshold * 1000,
+            'sort': sort,
+            'statements': top_statements(limit, sort)
+        }), 200
+    
+    except Exception as e:
+        return jsonify({'error': 'Internal server error'}), 500 
\ No newline at end of file
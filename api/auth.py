@@ -1,14 +1,9 @@
 from flask import Blueprint, request, jsonify
-from services.database import DatabaseService
-from services.auth import AuthService
-import os
+from services.container import db, auth_service
+from services.auth import AuthServiceBusy
 
 auth_bp = Blueprint('auth', __name__)
 
-# Initialize services
-db = DatabaseService()
-auth_service = AuthService(os.getenv('JWT_SECRET', 'your-secret-key'))
-
 @auth_bp.route('/signup', methods=['POST'])
 def signup():
     """Create new user account with 200 starting coins"""
@@ -51,6 +46,8 @@ def signup():
             }
         }), 201
         
+    except AuthServiceBusy:
+        return jsonify({'error': 'Server busy, please retry'}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
@@ -77,6 +74,14 @@ def login():
         if not auth_service.verify_password(password, user['password_hash']):
             return jsonify({'error': 'Invalid credentials'}), 401
         
+        # Transparently upgrade hashes made with an older work factor; best effort,
+        # since the password already checked out and the next login can retry
+        if auth_service.needs_rehash(user['password_hash']):
+            try:
+                db.update_user_password_hash(user['id'], auth_service.hash_password(password))
+            except AuthServiceBusy:
+                pass
+        
         # Generate token
         token = auth_service.generate_token(user['id'], user['username'])
         
@@ -91,6 +96,8 @@ def login():
             }
         }), 200
         
+    except AuthServiceBusy:
+        return jsonify({'error': 'Server busy, please retry'}), 503, {'Retry-After': '1'}
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
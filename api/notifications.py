@@ -1,14 +1,8 @@
 from flask import Blueprint, request, jsonify
-from services.database import DatabaseService
-from services.auth import AuthService
-import os
+from services.container import db, auth_service
 
 notifications_bp = Blueprint('notifications', __name__)
 
-# Initialize services
-db = DatabaseService()
-auth_service = AuthService(os.getenv('JWT_SECRET', 'your-secret-key'))
-
 def get_user_from_request():
     """Helper function to get user from Authorization header"""
     auth_header = request.headers.get('Authorization')
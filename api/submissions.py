@@ -1,14 +1,9 @@
 from flask import Blueprint, request, jsonify
-from services.database import DatabaseService
-from services.auth import AuthService
-import os
+from services.container import db, auth_service
+from services.pagination import parse_page_args
 
 submissions_bp = Blueprint('submissions', __name__)
 
-# Initialize services
-db = DatabaseService()
-auth_service = AuthService(os.getenv('JWT_SECRET', 'your-secret-key'))
-
 def get_user_from_request():
     """Helper function to get user from Authorization header"""
     auth_header = request.headers.get('Authorization')
@@ -18,6 +13,12 @@ def get_user_from_request():
     token = auth_header.split(' ')[1]
     return auth_service.get_user_from_token(token)
 
+def thumbnail_url(image_url):
+    """URL of the thumbnail variant for images served from /uploads, else the image URL itself"""
+    if image_url and '/uploads/' in image_url and '?' not in image_url:
+        return f"{image_url}?size=thumb"
+    return image_url
+
 @submissions_bp.route('/<int:task_id>/submit', methods=['POST'])
 def submit_task(task_id):
     """Submit proof for task completion"""
@@ -61,13 +62,13 @@ def submit_task(task_id):
             }), 201
         else:
             return jsonify({'error': 'Failed to create submission'}), 500
-        
+    
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
 @submissions_bp.route('/<int:task_id>/submissions', methods=['GET'])
 def get_task_submissions(task_id):
-    """Get all submissions for a task (owner only)"""
+    """Get a page of submissions for a task (owner only)"""
     try:
         # Authenticate user
         user_data = get_user_from_request()
@@ -83,19 +84,25 @@ def get_task_submissions(task_id):
         if task['creator_id'] != user_data['user_id']:
             return jsonify({'error': 'Not authorized to view submissions'}), 403
         
-        submissions = db.get_task_submissions(task_id)
+        try:
+            limit, cursor = parse_page_args(request.args)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        
+        submissions, next_cursor = db.get_task_submissions(task_id, limit=limit, after=cursor)
         
         return jsonify({
             'submissions': submissions,
-            'count': len(submissions)
+            'count': len(submissions),
+            'next_cursor': next_cursor
         }), 200
-        
+    
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
 @submissions_bp.route('/<int:task_id>/images', methods=['GET'])
 def get_task_images(task_id):
-    """Get all uploaded images for a task with submission IDs (owner only)"""
+    """Get a page of uploaded images for a task with submission IDs (owner only)"""
     try:
         # Authenticate user
         user_data = get_user_from_request()
@@ -111,8 +118,13 @@ def get_task_images(task_id):
         if task['creator_id'] != user_data['user_id']:
             return jsonify({'error': 'Not authorized to view task images'}), 403
         
-        # Get all submissions for this task
-        submissions = db.get_task_submissions(task_id)
+        try:
+            limit, cursor = parse_page_args(request.args)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        
+        # Get one page of submissions for this task
+        submissions, next_cursor = db.get_task_submissions(task_id, limit=limit, after=cursor)
         
         # Extract image information
         images = []
@@ -120,6 +132,7 @@ def get_task_images(task_id):
             images.append({
                 'submission_id': submission['id'],
                 'image_url': submission['image_url'],
+                'thumbnail_url': thumbnail_url(submission['image_url']),
                 'submitter_id': submission['submitter_id'],
                 'submitter_username': submission['submitter_username'],
                 'status': submission['status'],
@@ -131,9 +144,10 @@ def get_task_images(task_id):
             'task_id': task_id,
             'task_title': task['title'],
             'images': images,
-            'count': len(images)
+            'count': len(images),
+            'next_cursor': next_cursor
         }), 200
-        
+    
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
@@ -156,7 +170,7 @@ def accept_submission(task_id, submission_id):
             return jsonify({'error': 'Not authorized to accept submissions'}), 403
         
         # Accept submission
-        success = db.accept_submission(submission_id)
+        success = db.accept_submission(submission_id, task_id)
         
         if success:
             return jsonify({
@@ -165,6 +179,6 @@ def accept_submission(task_id, submission_id):
             }), 200
         else:
             return jsonify({'error': 'Failed to accept submission or insufficient coins'}), 400
-        
+    
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500 
\ No newline at end of file
@@ -1,13 +1,12 @@
 from flask import Blueprint, request, jsonify
-from services.database import DatabaseService
-from services.auth import AuthService
-import os
+from services.container import db, auth_service
+from services.pagination import parse_page_args
+from services.cache import cached_response
 
 tasks_bp = Blueprint('tasks', __name__)
 
-# Initialize services
-db = DatabaseService()
-auth_service = AuthService(os.getenv('JWT_SECRET', 'your-secret-key'))
+# Most tasks accepted by POST /bulk or looked up by GET ?ids= in one request
+MAX_BATCH_SIZE = 100
 
 def get_user_from_request():
     """Helper function to get user from Authorization header"""
@@ -18,6 +17,23 @@ def get_user_from_request():
     token = auth_header.split(' ')[1]
     return auth_service.get_user_from_token(token)
 
+def validate_task_data(data):
+    """Check the fields of a new task; returns an error message or None"""
+    if not isinstance(data, dict):
+        return 'Task must be an object'
+    
+    # Validate required fields
+    required_fields = ['title', 'description', 'completion_criteria', 'bounty_amount', 'latitude', 'longitude']
+    if not all(field in data for field in required_fields):
+        return 'Missing required fields'
+    
+    # Validate bounty amount
+    bounty_amount = data['bounty_amount']
+    if not isinstance(bounty_amount, int) or bounty_amount <= 0:
+        return 'Bounty amount must be a positive integer'
+    
+    return None
+
 @tasks_bp.route('', methods=['POST'])
 def create_task():
     """Create a new task"""
@@ -29,22 +45,12 @@ def create_task():
         
         data = request.get_json()
         
-        # Validate required fields
-        required_fields = ['title', 'description', 'completion_criteria', 'bounty_amount', 'latitude', 'longitude']
-        if not all(field in data for field in required_fields):
-            return jsonify({'error': 'Missing required fields'}), 400
-        
-        # Validate bounty amount
+        error = validate_task_data(data)
+        if error:
+            return jsonify({'error': error}), 400
         bounty_amount = data['bounty_amount']
-        if not isinstance(bounty_amount, int) or bounty_amount <= 0:
-            return jsonify({'error': 'Bounty amount must be a positive integer'}), 400
         
-        # Check if user has enough coins
-        user = db.get_user_by_id(user_data['user_id'])
-        if user['coin_balance'] < bounty_amount:
-            return jsonify({'error': 'Insufficient coins for bounty'}), 400
-        
-        # Create task
+        # Create task; the bounty is moved into escrow if the user can cover it
         task_id = db.create_task(
             creator_id=user_data['user_id'],
             title=data['title'],
@@ -63,31 +69,87 @@ def create_task():
                 'task_id': task_id
             }), 201
         else:
-            return jsonify({'error': 'Failed to create task'}), 500
+            return jsonify({'error': 'Insufficient coins for bounty'}), 400
+    
+    except Exception as e:
+        return jsonify({'error': 'Internal server error'}), 500
+
+@tasks_bp.route('/bulk', methods=['POST'])
+def create_tasks_bulk():
+    """Create up to MAX_BATCH_SIZE tasks at once; all are created or none"""
+    try:
+        # Authenticate user
+        user_data = get_user_from_request()
+        if not user_data:
+            return jsonify({'error': 'Authentication required'}), 401
+        
+        data = request.get_json()
+        tasks = data.get('tasks') if isinstance(data, dict) else None
+        if not isinstance(tasks, list) or not tasks:
+            return jsonify({'error': 'tasks must be a non-empty list'}), 400
+        if len(tasks) > MAX_BATCH_SIZE:
+            return jsonify({'error': f'At most {MAX_BATCH_SIZE} tasks per request'}), 400
+        
+        # Validate every task before touching the database
+        for index, task in enumerate(tasks):
+            error = validate_task_data(task)
+            if error:
+                return jsonify({'error': error, 'index': index}), 400
         
+        task_ids = db.create_tasks(user_data['user_id'], tasks)
+        if task_ids is None:
+            return jsonify({'error': 'Insufficient coins for bounty'}), 400
+        
+        return jsonify({
+            'message': 'Tasks created successfully',
+            'task_ids': task_ids,
+            'count': len(task_ids)
+        }), 201
+    
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
 @tasks_bp.route('', methods=['GET'])
+@cached_response(lambda: ['tasks'])
 def get_tasks():
-    """Get list of tasks"""
+    """Get list of tasks, or specific tasks with ?ids=1,2,3"""
     try:
+        if 'ids' in request.args:
+            try:
+                task_ids = [int(task_id) for task_id in request.args['ids'].split(',') if task_id.strip()]
+            except ValueError:
+                return jsonify({'error': 'ids must be a comma-separated list of integers'}), 400
+            if len(task_ids) > MAX_BATCH_SIZE:
+                return jsonify({'error': f'At most {MAX_BATCH_SIZE} ids per request'}), 400
+            
+            tasks = db.get_tasks_by_ids(task_ids)
+            found = {task['id'] for task in tasks}
+            return jsonify({
+                'tasks': tasks,
+                'count': len(tasks),
+                'missing': [task_id for task_id in task_ids if task_id not in found]
+            }), 200
+        
         # Get query parameters
-        limit = min(int(request.args.get('limit', 50)), 100)  # Max 100
-        offset = int(request.args.get('offset', 0))
+        try:
+            limit, cursor = parse_page_args(request.args)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
         status = request.args.get('status', 'active')
         
-        tasks = db.get_tasks(limit=limit, offset=offset, status=status)
+        tasks, next_cursor = db.get_tasks(limit=limit, after=cursor, status=status)
         
         return jsonify({
             'tasks': tasks,
-            'count': len(tasks)
+            'count': len(tasks),
+            'next_cursor': next_cursor
         }), 200
-        
+    
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
 @tasks_bp.route('/<int:task_id>', methods=['GET'])
+@cached_response(lambda task_id: [f'task:{task_id}'])
 def get_task(task_id):
     """Get task details"""
     try:
@@ -97,7 +159,7 @@ def get_task(task_id):
             return jsonify({'error': 'Task not found'}), 404
         
         return jsonify({'task': task}), 200
-        
+    
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
@@ -133,15 +195,22 @@ def update_task(task_id):
             if field in data:
                 update_fields[field] = data[field]
         
+        if 'bounty_amount' in update_fields:
+            bounty_amount = update_fields['bounty_amount']
+            if not isinstance(bounty_amount, int) or bounty_amount <= 0:
+                return jsonify({'error': 'Bounty amount must be a positive integer'}), 400
+        
         if update_fields:
             success = db.update_task(task_id, **update_fields)
             if success:
                 return jsonify({'message': 'Task updated successfully'}), 200
+            elif 'bounty_amount' in update_fields:
+                return jsonify({'error': 'Insufficient coins for bounty'}), 400
             else:
                 return jsonify({'error': 'Failed to update task'}), 500
         else:
             return jsonify({'error': 'No valid fields to update'}), 400
-        
+    
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
@@ -169,7 +238,7 @@ def delete_task(task_id):
             return jsonify({'message': 'Task deleted successfully'}), 200
         else:
             return jsonify({'error': 'Cannot delete task with submissions'}), 400
-        
+    
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
@@ -181,11 +250,18 @@ def get_nearby_tasks():
         latitude = request.args.get('lat', type=float)
         longitude = request.args.get('lng', type=float)
         radius = request.args.get('radius', 5.0, type=float)
+        limit = max(1, min(request.args.get('limit', 50, type=int), 100))  # Max 100
         
         if latitude is None or longitude is None:
             return jsonify({'error': 'Latitude and longitude required'}), 400
         
-        tasks = db.get_nearby_tasks(latitude, longitude, radius)
+        if not -90 <= latitude <= 90 or not -180 <= longitude <= 180:
+            return jsonify({'error': 'Invalid latitude or longitude'}), 400
+        
+        if radius <= 0 or radius > 500:
+            return jsonify({'error': 'Radius must be between 0 and 500 km'}), 400
+        
+        tasks = db.get_nearby_tasks(latitude, longitude, radius, limit=limit)
         
         return jsonify({
             'tasks': tasks,
@@ -193,6 +269,6 @@ def get_nearby_tasks():
             'center': {'lat': latitude, 'lng': longitude},
             'radius_km': radius
         }), 200
-        
+    
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500 
\ No newline at end of file
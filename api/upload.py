@@ -1,13 +1,13 @@
 from flask import Blueprint, request, jsonify
-from services.upload import UploadService
-from services.auth import AuthService
+from werkzeug.exceptions import RequestEntityTooLarge
+from services.container import db, auth_service, upload_service
+from services.upload import UploadRejected
 import os
 
 upload_bp = Blueprint('upload', __name__)
 
-# Initialize services
-upload_service = UploadService()
-auth_service = AuthService(os.getenv('JWT_SECRET', 'your-secret-key'))
+# Allowance for multipart boundaries and headers around the file itself
+MULTIPART_OVERHEAD = 64 * 1024
 
 def get_user_from_request():
     """Helper function to get user from Authorization header"""
@@ -18,20 +18,45 @@ def get_user_from_request():
     token = auth_header.split(' ')[1]
     return auth_service.get_user_from_token(token)
 
+def upload_response(upload):
+    """Public view of an upload record"""
+    response = {
+        'upload_id': upload['id'],
+        'status': upload['status']
+    }
+    
+    if upload['status'] == 'ready':
+        # Get base URL from environment or request
+        base_url = os.getenv('BASE_URL', request.host_url.rstrip('/'))
+        response['filename'] = upload['filename']
+        response['url'] = upload_service.get_file_url(upload['filename'], base_url)
+        response['variants'] = upload_service.get_variant_urls(upload['filename'], base_url)
+    elif upload['status'] == 'failed':
+        response['error'] = upload['error']
+    
+    return response
+
 @upload_bp.route('', methods=['POST'])
 def upload_image():
-    """Upload an image file"""
+    """Accept an image file; it is processed in the background"""
     try:
         # Authenticate user
         user_data = get_user_from_request()
         if not user_data:
             return jsonify({'error': 'Authentication required'}), 401
         
+        # Parsing the form stops at MAX_CONTENT_LENGTH (set from MAX_FILE_SIZE in create_app),
+        # whether or not the client sent a Content-Length
+        try:
+            files = request.files
+        except RequestEntityTooLarge:
+            return jsonify({'error': 'File too large'}), 413
+        
         # Check if file is present
-        if 'file' not in request.files:
+        if 'file' not in files:
             return jsonify({'error': 'No file provided'}), 400
         
-        file = request.files['file']
+        file = files['file']
         
         # Check if file is selected
         if file.filename == '':
@@ -41,24 +66,83 @@ def upload_image():
         if not upload_service.allowed_file(file.filename):
             return jsonify({'error': 'File type not allowed'}), 400
         
-        # Read file data
-        file_data = file.read()
-        
-        # Save file
-        filename = upload_service.save_image(file_data, file.filename)
-        
-        if filename:
-            # Get base URL from environment or request
-            base_url = os.getenv('BASE_URL', request.host_url.rstrip('/'))
-            file_url = upload_service.get_file_url(filename, base_url)
-            
-            return jsonify({
-                'message': 'File uploaded successfully',
-                'filename': filename,
-                'url': file_url
-            }), 201
-        else:
-            return jsonify({'error': 'Failed to upload file'}), 500
+        # Stream the raw file to disk; resizing happens off the request thread
+        try:
+            upload_id, raw_name = upload_service.store_stream(file.stream, file.filename)
+        except UploadRejected as e:
+            return jsonify({'error': str(e)}), e.status_code
+        
+        db.create_upload(upload_id, user_data['user_id'])
+        
+        # The callback runs on the upload completion thread, outside the request context,
+        # so bind the real objects now
+        database = db._get_current_object()
+        is_stored = upload_service.is_stored
+        
+        def on_done(filename, error):
+            if filename:
+                database.complete_upload(upload_id, filename, is_stored)
+            else:
+                database.update_upload_status(upload_id, 'failed', error=error)
+        
+        try:
+            upload_service.process_async(raw_name, on_done)
+        except Exception:
+            # The image pool could not be restarted; don't leave the upload processing forever
+            upload_service.discard_raw(raw_name)
+            db.update_upload_status(upload_id, 'failed', error='Image processing unavailable')
+            return jsonify({'error': 'Image processing unavailable, please try again'}), 503
+        
+        return jsonify({
+            'message': 'File accepted for processing',
+            'upload_id': upload_id,
+            'status': 'processing',
+            'status_url': f"/api/upload/{upload_id}"
+        }), 202
+    
+    except Exception as e:
+        return jsonify({'error': 'Internal server error'}), 500
+
+@upload_bp.route('/<upload_id>', methods=['GET'])
+def get_upload_status(upload_id):
+    """Get processing status of an upload (owner only)"""
+    try:
+        # Authenticate user
+        user_data = get_user_from_request()
+        if not user_data:
+            return jsonify({'error': 'Authentication required'}), 401
+        
+        upload = db.get_upload(upload_id)
+        if not upload or upload['user_id'] != user_data['user_id']:
+            return jsonify({'error': 'Upload not found'}), 404
+        
+        return jsonify(upload_response(upload)), 200
+    
+    except Exception as e:
+        return jsonify({'error': 'Internal server error'}), 500 
+
+@upload_bp.route('/<upload_id>', methods=['DELETE'])
+def delete_upload(upload_id):
+    """Delete an upload (owner only); the file is removed once no other upload shares it"""
+    try:
+        # Authenticate user
+        user_data = get_user_from_request()
+        if not user_data:
+            return jsonify({'error': 'Authentication required'}), 401
+        
+        upload = db.get_upload(upload_id)
+        if not upload or upload['user_id'] != user_data['user_id']:
+            return jsonify({'error': 'Upload not found'}), 404
         
+        if upload['status'] == 'processing':
+            return jsonify({'error': 'Upload is still processing'}), 409
+        
+        if upload['filename'] and db.is_image_in_use(user_data['user_id'], upload['filename']):
+            return jsonify({'error': 'Upload is used by a submission'}), 409
+        
+        db.release_upload(upload_id, upload_service.delete_file)
+        
+        return jsonify({'message': 'Upload deleted successfully'}), 200
+    
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500 
\ No newline at end of file
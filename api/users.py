@@ -1,14 +1,10 @@
 from flask import Blueprint, request, jsonify
-from services.database import DatabaseService
-from services.auth import AuthService
-import os
+from services.container import db, auth_service
+from services.pagination import parse_page_args
+from services.cache import cached_response
 
 users_bp = Blueprint('users', __name__)
 
-# Initialize services
-db = DatabaseService()
-auth_service = AuthService(os.getenv('JWT_SECRET', 'your-secret-key'))
-
 def get_user_from_request():
     """Helper function to get user from Authorization header"""
     auth_header = request.headers.get('Authorization')
@@ -19,6 +15,7 @@ def get_user_from_request():
     return auth_service.get_user_from_token(token)
 
 @users_bp.route('/<int:user_id>', methods=['GET'])
+@cached_response(lambda user_id: [f'user:{user_id}'])
 def get_user_profile(user_id):
     """Get user profile"""
     try:
@@ -35,7 +32,7 @@ def get_user_profile(user_id):
                 'created_at': user['created_at']
             }
         }), 200
-        
+    
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
@@ -43,13 +40,19 @@ def get_user_profile(user_id):
 def get_user_tasks(user_id):
     """Get tasks created by user"""
     try:
-        tasks = db.get_user_tasks(user_id, 'created')
+        try:
+            limit, cursor = parse_page_args(request.args)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        
+        tasks, next_cursor = db.get_user_tasks(user_id, 'created', limit=limit, after=cursor)
         
         return jsonify({
             'tasks': tasks,
-            'count': len(tasks)
+            'count': len(tasks),
+            'next_cursor': next_cursor
         }), 200
-        
+    
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
@@ -57,17 +60,24 @@ def get_user_tasks(user_id):
 def get_user_completions(user_id):
     """Get tasks completed by user"""
     try:
-        tasks = db.get_user_tasks(user_id, 'completed')
+        try:
+            limit, cursor = parse_page_args(request.args)
+        except ValueError:
+            return jsonify({'error': 'Invalid cursor'}), 400
+        
+        tasks, next_cursor = db.get_user_tasks(user_id, 'completed', limit=limit, after=cursor)
         
         return jsonify({
             'completions': tasks,
-            'count': len(tasks)
+            'count': len(tasks),
+            'next_cursor': next_cursor
         }), 200
-        
+    
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500
 
 @users_bp.route('/leaderboard', methods=['GET'])
+@cached_response(lambda: ['leaderboard'])
 def get_leaderboard():
     """Get user leaderboard ordered by coins, completions, and username"""
     try:
@@ -83,6 +93,20 @@ def get_leaderboard():
             'leaderboard': leaderboard,
             'count': len(leaderboard)
         }), 200
+    
+    except Exception as e:
+        return jsonify({'error': 'Internal server error'}), 500
+
+@users_bp.route('/<int:user_id>/rank', methods=['GET'])
+def get_user_rank(user_id):
+    """Get a user's position on the leaderboard"""
+    try:
+        rank = db.get_user_rank(user_id)
+        
+        if not rank:
+            return jsonify({'error': 'User not found'}), 404
         
+        return jsonify({'rank': rank}), 200
+    
     except Exception as e:
         return jsonify({'error': 'Internal server error'}), 500 
\ No newline at end of file
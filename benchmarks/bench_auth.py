@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""
+Login throughput vs. read latency under mixed load.
+
+Starts the API (python main.py) against a throwaway database, then runs login
+threads (POST /api/login) alongside reader threads (GET /api/tasks) and reports
+login throughput, rejected (503) logins and read latency percentiles.
+
+    python benchmarks/bench_auth.py                 # current settings
+    python benchmarks/bench_auth.py --compare       # bounded bcrypt pool vs. effectively unbounded
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def request(url, body=None):
+    """Issue a request and return the HTTP status code"""
+    data = json.dumps(body).encode('utf-8') if body is not None else None
+    req = urllib.request.Request(url, data=data, headers={'Content-Type': 'application/json'})
+    try:
+        with urllib.request.urlopen(req, timeout=60) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def seed(db_path, users, tasks, rounds):
+    """Create users (sharing one password hash) and some active tasks"""
+    import bcrypt
+    from services.database import DatabaseService
+
+    db = DatabaseService(db_path)
+    db.init_database()
+    password_hash = bcrypt.hashpw(b'password123', bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+    for i in range(users):
+        db.create_user(f'user{i}', f'user{i}@example.com', password_hash)
+    for i in range(tasks):
+        db.create_task(1, f'Task {i}', 'Benchmark task', 'bench', 'Photo', 1, 40.0, -73.0)
+
+def wait_for(url, timeout=30):
+    """Poll until the server answers"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if request(url) == 200:
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'Server did not start: {url}')
+
+def run(args, extra_env):
+    """Run one benchmark configuration and return its results"""
+    workdir = tempfile.mkdtemp(prefix='spacetask-bench-')
+    db_path = os.path.join(workdir, 'bench.db')
+    seed(db_path, args.users, 200, args.rounds)
+
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_PATH': db_path,
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'PORT': str(args.port),
+        'HOST': '127.0.0.1',
+        'DEBUG': 'False',
+        'BCRYPT_ROUNDS': str(args.rounds),
+    })
+    env.update(extra_env)
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'main.py')], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base = f'http://127.0.0.1:{args.port}'
+    try:
+        wait_for(f'{base}/api/health')
+        stop = threading.Event()
+        login_ok, login_busy, read_latencies = [], [], []
+        lock = threading.Lock()
+
+        def login_loop(n):
+            while not stop.is_set():
+                status = request(f'{base}/api/login',
+                                 {'email': f'user{n % args.users}@example.com', 'password': 'password123'})
+                with lock:
+                    (login_ok if status == 200 else login_busy).append(status)
+
+        def read_loop():
+            while not stop.is_set():
+                started = time.perf_counter()
+                request(f'{base}/api/tasks?limit=20')
+                with lock:
+                    read_latencies.append((time.perf_counter() - started) * 1000)
+
+        threads = [threading.Thread(target=login_loop, args=(i,)) for i in range(args.login_threads)]
+        threads += [threading.Thread(target=read_loop) for _ in range(args.read_threads)]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        return {
+            'config': extra_env,
+            'login_per_sec': round(len(login_ok) / args.duration, 2),
+            'login_rejected': len(login_busy),
+            'reads_per_sec': round(len(read_latencies) / args.duration, 2),
+            'read_p50_ms': round(percentile(read_latencies, 50) or 0, 2),
+            'read_p95_ms': round(percentile(read_latencies, 95) or 0, 2),
+            'read_p99_ms': round(percentile(read_latencies, 99) or 0, 2),
+            'read_mean_ms': round(statistics.mean(read_latencies), 2) if read_latencies else None,
+        }
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds of load per configuration')
+    parser.add_argument('--login-threads', type=int, default=16)
+    parser.add_argument('--read-threads', type=int, default=8)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--rounds', type=int, default=int(os.getenv('BCRYPT_ROUNDS', 12)))
+    parser.add_argument('--port', type=int, default=5091)
+    parser.add_argument('--compare', action='store_true',
+                        help='Also run with an effectively unbounded bcrypt pool for comparison')
+    args = parser.parse_args()
+
+    results = [run(args, {})]
+    if args.compare:
+        results.append(run(args, {'BCRYPT_WORKERS': '64', 'BCRYPT_QUEUE_LIMIT': '10000'}))
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+"""
+Push notification dispatch throughput by batch size.
+
+Queues notifications for many registered devices in a throwaway database, then
+drains the outbox with the stub provider, which sleeps for a fixed latency per
+call to stand in for the round trip to a real push service.
+
+    python benchmarks/bench_notifications.py
+    python benchmarks/bench_notifications.py --notifications 5000 --latency-ms 20 --batch-sizes 1 50 500
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def seed(db_path, users, notifications):
+    """Register one device per user and queue notifications round-robin across users"""
+    from services.database import DatabaseService
+
+    db = DatabaseService(db_path)
+    db.init_database()
+    for i in range(users):
+        user_id = db.create_user(f'user{i}', f'user{i}@example.com', 'x')
+        db.register_device(user_id, f'token-{i}', 'ios')
+    futures = [db.queue_notification(i % users + 1, f'bench:{i}', 'Benchmark', 'Queued by the benchmark')
+               for i in range(notifications)]
+    for future in futures:
+        future.result()
+    return db
+
+def run(args, batch_size):
+    """Drain a freshly seeded outbox with one batch size"""
+    from services.notifications import NotificationDispatcher, StubProvider
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='spacetask-bench-'), 'bench.db')
+    db = seed(db_path, args.users, args.notifications)
+    provider = StubProvider(latency=args.latency_ms / 1000)
+    dispatcher = NotificationDispatcher(db, provider, batch_size=batch_size)
+
+    started = time.perf_counter()
+    while dispatcher.dispatch_once():
+        pass
+    elapsed = time.perf_counter() - started
+    return {
+        'batch_size': batch_size,
+        'sent': dispatcher.sent,
+        'provider_calls': provider.calls,
+        'seconds': round(elapsed, 2),
+        'sent_per_sec': round(dispatcher.sent / elapsed, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--notifications', type=int, default=1000)
+    parser.add_argument('--users', type=int, default=200)
+    parser.add_argument('--latency-ms', type=float, default=5.0, help='Simulated provider round trip per call')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 10, 100])
+    args = parser.parse_args()
+
+    print(json.dumps([run(args, batch_size) for batch_size in args.batch_sizes], indent=2))
+
+if __name__ == '__main__':
+    main()
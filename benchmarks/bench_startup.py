@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Cold-start cost of one API worker.
+
+Starts the API (python main.py) against a migrated throwaway database several
+times and reports, as medians:
+
+    import_ms          time to import the app (python -c "import api")
+    first_request_ms   process start until /api/health answers
+    first_read_ms      first GET /api/tasks after that
+    rss_mb             worker resident memory after the first read
+
+    python benchmarks/bench_startup.py
+    python benchmarks/bench_startup.py --runs 10
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def get(url):
+    """Issue a GET and return the HTTP status code"""
+    try:
+        with urllib.request.urlopen(url, timeout=30) as response:
+            response.read()
+            return response.status
+    except urllib.error.HTTPError as e:
+        return e.code
+
+def rss_mb(pid):
+    """Resident set size of a process in MB (Linux)"""
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return int(line.split()[1]) / 1024
+    return None
+
+def measure_import(env):
+    """Time a fresh interpreter importing the app"""
+    code = 'import time; t = time.perf_counter(); import api; print((time.perf_counter() - t) * 1000)'
+    output = subprocess.check_output([sys.executable, '-c', code], env=env, cwd=ROOT,
+                                     stderr=subprocess.DEVNULL)
+    return float(output.decode().strip().splitlines()[-1])
+
+def measure_server(env, port):
+    """Start the server once and time its first responses"""
+    base = f'http://127.0.0.1:{port}'
+    started = time.perf_counter()
+    server = subprocess.Popen([sys.executable, os.path.join(ROOT, 'main.py')], env=env, cwd=ROOT,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                if get(f'{base}/api/health') == 200:
+                    break
+            except OSError:
+                if time.perf_counter() - started > 60:
+                    raise RuntimeError('Server did not start')
+                time.sleep(0.005)
+        first_request = (time.perf_counter() - started) * 1000
+
+        read_started = time.perf_counter()
+        get(f'{base}/api/tasks?limit=20')
+        first_read = (time.perf_counter() - read_started) * 1000
+        return first_request, first_read, rss_mb(server.pid)
+    finally:
+        server.terminate()
+        server.wait()
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--port', type=int, default=5093)
+    args = parser.parse_args()
+    
+    from services.database import DatabaseService
+    
+    workdir = tempfile.mkdtemp(prefix='spacetask-bench-')
+    db_path = os.path.join(workdir, 'bench.db')
+    db = DatabaseService(db_path)
+    db.init_database()
+    user_id = db.create_user('bench', 'bench@example.com', 'x')
+    for i in range(100):
+        db.create_task(user_id, f'Task {i}', 'Benchmark task', 'bench', 'Photo', 1, 40.0, -73.0)
+    
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_PATH': db_path,
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'PORT': str(args.port),
+        'HOST': '127.0.0.1',
+        'DEBUG': 'False',
+        'SERVER_MODE': 'development',
+    })
+    
+    imports, first_requests, first_reads, rss = [], [], [], []
+    for _ in range(args.runs):
+        imports.append(measure_import(env))
+        first_request, first_read, memory = measure_server(env, args.port)
+        first_requests.append(first_request)
+        first_reads.append(first_read)
+        rss.append(memory)
+    
+    print(json.dumps({
+        'runs': args.runs,
+        'import_ms': round(statistics.median(imports), 1),
+        'first_request_ms': round(statistics.median(first_requests), 1),
+        'first_read_ms': round(statistics.median(first_reads), 1),
+        'rss_mb': round(statistics.median(rss), 1),
+    }, indent=2))
+
+if __name__ == '__main__':
+    main()
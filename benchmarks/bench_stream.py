@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Event stream fan-out to many idle connections.
+
+Starts the stream server (python -m services.sse) against a throwaway database,
+opens many concurrent streams (one user each, a share of them also subscribed to
+an area), then logs user and area events and measures how long each takes to
+reach its client. Reports delivery latency percentiles and the server's RSS.
+
+    python benchmarks/bench_stream.py
+    python benchmarks/bench_stream.py --clients 5000 --events 2000
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+SECRET = 'bench-stream-secret-bench-stream-secret'
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def rss_mb(pid):
+    """Resident set size of a process in MB"""
+    with open(f'/proc/{pid}/status') as f:
+        for line in f:
+            if line.startswith('VmRSS:'):
+                return round(int(line.split()[1]) / 1024, 1)
+
+async def listen(port, token, query, latencies, ready):
+    """Hold one stream open and record the delivery latency of every event"""
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'GET /api/events?token={token}{query} HTTP/1.1\r\nHost: bench\r\n\r\n'.encode())
+    await writer.drain()
+    await reader.readuntil(b'\r\n\r\n')
+    ready.release()
+    try:
+        while True:
+            line = await reader.readline()
+            if not line:
+                break
+            if line.startswith(b'data: '):
+                latencies.append((time.time() - json.loads(line[6:])['sent_at']) * 1000)
+    finally:
+        writer.close()
+
+async def run(args, db_path, server_pid, empty_rss):
+    """Open the streams, log the events and collect delivery latencies"""
+    from services.auth import AuthService
+    from services.database import DatabaseService
+
+    auth = AuthService(SECRET)
+    db = DatabaseService(db_path)
+    latencies = []
+    ready = asyncio.Semaphore(0)
+    listeners = []
+    for user_id in range(1, args.clients + 1):
+        query = '&lat=40.0&lng=-73.0&radius=10' if user_id % args.area_every == 0 else ''
+        token = auth.generate_token(user_id, f'user{user_id}')
+        listeners.append(asyncio.create_task(listen(args.port, token, query, latencies, ready)))
+    for _ in listeners:
+        await ready.acquire()
+    idle_rss = rss_mb(server_pid)
+
+    rng = random.Random(1)
+    area_events = 0
+    for i in range(args.events):
+        if i % 10 == 0:
+            entry = ('task.created', None, 40.0 + rng.uniform(-0.05, 0.05), -73.0, {'sent_at': time.time()})
+            area_events += 1
+        else:
+            entry = ('user.balance_changed', rng.randint(1, args.clients), None, None, {'sent_at': time.time()})
+        db.log_events([entry], 100000)
+        await asyncio.sleep(args.interval_ms / 1000)
+
+    expected = args.events - area_events + area_events * (args.clients // args.area_every)
+    deadline = time.time() + 10
+    while len(latencies) < expected and time.time() < deadline:
+        await asyncio.sleep(0.1)
+    for listener in listeners:
+        listener.cancel()
+
+    return {
+        'clients': args.clients,
+        'area_subscribers': args.clients // args.area_every,
+        'events': args.events,
+        'deliveries': len(latencies),
+        'expected_deliveries': expected,
+        'p50_ms': round(percentile(latencies, 50) or 0, 1),
+        'p95_ms': round(percentile(latencies, 95) or 0, 1),
+        'p99_ms': round(percentile(latencies, 99) or 0, 1),
+        'server_rss_idle_mb': idle_rss,
+        'server_rss_per_client_kb': round((idle_rss - empty_rss) * 1024 / args.clients, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--clients', type=int, default=1000)
+    parser.add_argument('--area-every', type=int, default=10, help='Every Nth client also subscribes to the area')
+    parser.add_argument('--events', type=int, default=500)
+    parser.add_argument('--interval-ms', type=float, default=2.0, help='Pause between logged events')
+    parser.add_argument('--port', type=int, default=5093)
+    args = parser.parse_args()
+
+    from services.database import DatabaseService
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='spacetask-bench-'), 'bench.db')
+    DatabaseService(db_path).init_database()
+    env = dict(os.environ, DATABASE_PATH=db_path, JWT_SECRET=SECRET, EVENTS_POLL_INTERVAL='0.05')
+    server = subprocess.Popen([sys.executable, '-m', 'services.sse', '--port', str(args.port), '--host', '127.0.0.1'],
+                              cwd=ROOT, env=env, stdout=subprocess.DEVNULL)
+    try:
+        time.sleep(1.0)
+        print(json.dumps(asyncio.run(run(args, db_path, server.pid, rss_mb(server.pid))), indent=2))
+    finally:
+        server.terminate()
+        server.wait()
+
+if __name__ == '__main__':
+    main()
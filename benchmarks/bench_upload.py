@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+"""
+Peak memory and CPU time of image ingestion.
+
+Generates a large JPEG and PNG, then processes each in a fresh subprocess so
+peak RSS (ru_maxrss) is attributable to one path:
+
+    legacy  - whole body in memory, validate + decode twice (UploadService.save_image)
+    stream  - chunked copy to disk, header-only checks, one draft/reduced decode
+              (UploadService.store_stream + process_raw)
+
+    python benchmarks/bench_upload.py
+    python benchmarks/bench_upload.py --width 6000 --height 4000 --repeat 5
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def make_image(path, width, height):
+    """Write a noisy test image so the encoders cannot shortcut flat colour"""
+    from PIL import Image
+
+    image = Image.effect_noise((width // 4, height // 4), 64).convert('RGB').resize((width, height))
+    image.save(path)
+
+def measure(mode, path, repeat):
+    """Process one file repeat times in this process and report resource usage"""
+    from services.upload import UploadService
+
+    workdir = tempfile.mkdtemp(prefix='spacetask-bench-')
+    service = UploadService(workdir, max_file_size=200 * 1024 * 1024)
+    name = os.path.basename(path)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        if mode == 'legacy':
+            with open(path, 'rb') as f:
+                data = f.read()
+            if not service.save_image(data, name):
+                raise RuntimeError('legacy processing failed')
+        else:
+            with open(path, 'rb') as f:
+                _, raw_name = service.store_stream(f, name)
+            service.process_raw(raw_name)
+    elapsed = time.perf_counter() - started
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return {
+        'mode': mode,
+        'file': name,
+        'file_mb': round(os.path.getsize(path) / 1024 / 1024, 2),
+        'peak_rss_mb': round(usage.ru_maxrss / 1024, 1),
+        'cpu_ms_per_image': round((usage.ru_utime + usage.ru_stime) * 1000 / repeat, 1),
+        'wall_ms_per_image': round(elapsed * 1000 / repeat, 1),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--width', type=int, default=4000)
+    parser.add_argument('--height', type=int, default=3000)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--measure', nargs=2, metavar=('MODE', 'PATH'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.measure:
+        print(json.dumps(measure(args.measure[0], args.measure[1], args.repeat)))
+        return
+
+    workdir = tempfile.mkdtemp(prefix='spacetask-bench-')
+    results = []
+    for extension in ('jpg', 'png'):
+        path = os.path.join(workdir, f'sample.{extension}')
+        make_image(path, args.width, args.height)
+        for mode in ('legacy', 'stream'):
+            # A fresh interpreter per run keeps ru_maxrss specific to one path
+            output = subprocess.check_output([sys.executable, __file__, '--repeat', str(args.repeat),
+                                              '--measure', mode, path])
+            results.append(json.loads(output))
+    print(json.dumps(results, indent=2))
+
+if __name__ == '__main__':
+    main()
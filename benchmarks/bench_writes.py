@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+"""
+Write throughput with and without the single-writer queue.
+
+Seeds a throwaway database, then has worker processes (each with several
+threads, like gunicorn workers) issue a mix of task creations and submissions
+through DatabaseService. Reports writes per second, latency percentiles,
+errors (e.g. "database is locked") and how many jobs the writer committed per
+transaction.
+
+    python benchmarks/bench_writes.py                     # queue on vs. off
+    python benchmarks/bench_writes.py --processes 1 --threads 32
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def seed(db_path, users):
+    """Create users with enough coins for every task the benchmark creates; returns the first task ID"""
+    from services.database import DatabaseService
+
+    db = DatabaseService(db_path)
+    db.init_database()
+    for i in range(users):
+        user_id = db.create_user(f'user{i}', f'user{i}@example.com', 'x')
+        db.update_user_balance(user_id, 10 ** 9)
+    return db.create_task(1, 'Target', 'Benchmark task', 'bench', 'Photo', 1, 40.0, -73.0)
+
+def worker(db_path, use_queue, args, task_id, barrier, results):
+    """Run write threads until the deadline and report latencies and errors"""
+    from services.database import DatabaseService
+
+    db = DatabaseService(db_path)
+    db.writer.enabled = use_queue
+    latencies, errors = [], []
+    lock = threading.Lock()
+
+    def loop(n):
+        i = 0
+        while time.monotonic() < deadline:
+            user_id = (n + i) % args.users + 1
+            started = time.perf_counter()
+            try:
+                if i % 2:
+                    db.create_task(user_id, 'Task', 'Benchmark task', 'bench', 'Photo', 1, 40.0, -73.0)
+                else:
+                    db.create_submission(task_id, user_id, 'http://example.com/x.jpg')
+            except Exception as e:
+                with lock:
+                    errors.append(type(e).__name__)
+            else:
+                with lock:
+                    latencies.append((time.perf_counter() - started) * 1000)
+            i += 1
+
+    barrier.wait()
+    deadline = time.monotonic() + args.duration
+    threads = [threading.Thread(target=loop, args=(i,)) for i in range(args.threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    results.put((latencies, errors, db.write_stats()))
+
+def run(args, use_queue):
+    """Run one configuration and return its results"""
+    from services.database import DatabaseService
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='spacetask-bench-'), 'bench.db')
+    task_id = seed(db_path, args.users)
+    DatabaseService(db_path).pool.close()
+
+    context = multiprocessing.get_context('fork')
+    barrier = context.Barrier(args.processes)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(db_path, use_queue, args, task_id, barrier, results))
+                 for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    latencies = [value for outcome in outcomes for value in outcome[0]]
+    errors = [value for outcome in outcomes for value in outcome[1]]
+    batches = sum(outcome[2]['batches'] for outcome in outcomes)
+    jobs = sum(outcome[2]['jobs'] for outcome in outcomes)
+    return {
+        'write_queue': use_queue,
+        'processes': args.processes,
+        'threads_per_process': args.threads,
+        'writes_per_sec': round(len(latencies) / args.duration, 1),
+        'errors': len(errors),
+        'error_types': sorted(set(errors)),
+        'p50_ms': round(percentile(latencies, 50) or 0, 2),
+        'p95_ms': round(percentile(latencies, 95) or 0, 2),
+        'p99_ms': round(percentile(latencies, 99) or 0, 2),
+        'jobs_per_commit': round(jobs / batches, 2) if batches else None,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds of load per configuration')
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8, help='Writer threads per process')
+    parser.add_argument('--users', type=int, default=50)
+    args = parser.parse_args()
+
+    print(json.dumps([run(args, True), run(args, False)], indent=2))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+"""
+Mixed-traffic HTTP load test against a synthetic world.
+
+Seeds a world (benchmarks/world.py) or copies an existing one, starts the API
+in production mode (python main.py --mode production) on it, then has
+--concurrency virtual users replay a weighted mix of operations over
+keep-alive connections for --duration seconds:
+
+    browse       GET  /api/tasks (following next_cursor now and then)
+    task         GET  /api/tasks/:id
+    nearby       GET  /api/tasks/nearby around a city center
+    leaderboard  GET  /api/users/leaderboard
+    submit       POST /api/tasks/:id/submit
+    accept       POST /api/tasks/:id/submissions/:id/accept (as the task's creator)
+    upload       POST /api/upload (a small generated JPEG)
+    login        POST /api/login
+
+Reports throughput, status codes and p50/p95/p99 latency per operation as
+JSON, together with the configuration and git revision, so runs can be
+compared. Everything runs locally; --seed makes the world and the operation
+sequence of every virtual user reproducible.
+
+    python benchmarks/loadtest.py
+    python benchmarks/loadtest.py --users 20000 --tasks 200000 --duration 60 --concurrency 32
+    python benchmarks/loadtest.py --mix browse=50,nearby=50 --output nearby.json
+    python benchmarks/loadtest.py --db /tmp/world.db --server-env DB_WRITE_QUEUE=false
+"""
+
+import argparse
+import http.client
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from world import PASSWORD, build_world
+
+SECRET = 'loadtest-secret-loadtest-secret-loadtest'
+
+# Operation -> (request it issues, default weight)
+OPERATIONS = {
+    'browse': ('GET /api/tasks', 25),
+    'task': ('GET /api/tasks/:id', 15),
+    'nearby': ('GET /api/tasks/nearby', 25),
+    'leaderboard': ('GET /api/users/leaderboard', 5),
+    'submit': ('POST /api/tasks/:id/submit', 12),
+    'accept': ('POST /api/tasks/:id/submissions/:id/accept', 6),
+    'upload': ('POST /api/upload', 6),
+    'login': ('POST /api/login', 6),
+}
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+def parse_mix(text):
+    """'browse=50,nearby=50' -> {'browse': 50, 'nearby': 50}"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name.strip() not in OPERATIONS:
+            raise argparse.ArgumentTypeError(f"unknown operation '{name}'; expected one of: {', '.join(OPERATIONS)}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+def make_images(count, seed):
+    """Distinct small JPEGs, so content-addressed storage does not dedupe every upload"""
+    from PIL import Image
+
+    rng = random.Random(seed)
+    images = []
+    for _ in range(count):
+        image = Image.new('RGB', (640, 480), tuple(rng.randrange(256) for _ in range(3)))
+        for _ in range(20):
+            x, y = rng.randrange(600), rng.randrange(440)
+            image.paste(tuple(rng.randrange(256) for _ in range(3)), (x, y, x + 40, y + 40))
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=85)
+        images.append(buffer.getvalue())
+    return images
+
+class World:
+    """What the virtual users know about the seeded data; shared by every thread"""
+
+    def __init__(self, db_path, summary):
+        from services.auth import AuthService
+
+        conn = sqlite3.connect(db_path)
+        self.users = summary['users']
+        self.cities = [(city['latitude'], city['longitude']) for city in summary['cities']]
+        self.tasks = conn.execute("SELECT id, creator_id FROM tasks WHERE status = 'active'").fetchall()
+        self.creators = dict(self.tasks)
+        # Pending submissions on active tasks, accepted (and removed) by the accept operation
+        self.pending = conn.execute('''
+            SELECT s.task_id, s.id FROM task_submissions s JOIN tasks t ON t.id = s.task_id
+            WHERE t.status = 'active' AND s.status = 'pending'
+        ''').fetchall()
+        conn.close()
+        random.Random(summary['seed']).shuffle(self.pending)
+        self.auth = AuthService(SECRET)
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+    def token(self, user_id):
+        """A valid JWT for a user, minted locally rather than through /api/login"""
+        token = self._tokens.get(user_id)
+        if token is None:
+            token = self._tokens[user_id] = self.auth.generate_token(user_id, f'user{user_id}')
+        return token
+
+    def add_pending(self, task_id, submission_id):
+        with self._lock:
+            self.pending.append((task_id, submission_id))
+
+    def take_pending(self):
+        with self._lock:
+            return self.pending.pop() if self.pending else None
+
+class VirtualUser:
+    """One client connection issuing operations in a seeded random order"""
+
+    def __init__(self, port, world, images, mix, seed):
+        self.port = port
+        self.world = world
+        self.images = images
+        self.rng = random.Random(seed)
+        self.names = list(mix)
+        self.weights = [mix[name] for name in self.names]
+        self.user_id = self.rng.randint(1, world.users)
+        self.cursor = None
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None, token=None):
+        """Issue a request on the keep-alive connection; returns (status, parsed JSON or None)"""
+        headers = dict(headers or {})
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        if isinstance(body, dict):
+            body = json.dumps(body).encode('utf-8')
+            headers['Content-Type'] = 'application/json'
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection('127.0.0.1', self.port, timeout=60)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                data = response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                # The server closed an idle keep-alive connection; reconnect once
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+        try:
+            return response.status, json.loads(data) if data else None
+        except ValueError:
+            return response.status, None
+
+    def run_one(self):
+        """Pick and run one operation; returns (name, status, milliseconds)"""
+        name = self.rng.choices(self.names, self.weights)[0]
+        started = time.perf_counter()
+        status = getattr(self, f'op_{name}')()
+        return name, status, (time.perf_counter() - started) * 1000
+
+    def op_browse(self):
+        query = f'&cursor={self.cursor}' if self.cursor and self.rng.random() < 0.5 else ''
+        status, data = self.request('GET', f'/api/tasks?limit=20{query}')
+        self.cursor = (data or {}).get('next_cursor')
+        return status
+
+    def op_task(self):
+        task_id = self.rng.choice(self.world.tasks)[0]
+        return self.request('GET', f'/api/tasks/{task_id}')[0]
+
+    def op_nearby(self):
+        lat, lng = self.rng.choice(self.world.cities)
+        lat += self.rng.gauss(0, 0.03)
+        lng += self.rng.gauss(0, 0.03)
+        radius = self.rng.choice([1, 2, 5, 10])
+        return self.request('GET', f'/api/tasks/nearby?lat={lat:.5f}&lng={lng:.5f}&radius={radius}')[0]
+
+    def op_leaderboard(self):
+        return self.request('GET', '/api/users/leaderboard?limit=10')[0]
+
+    def op_submit(self):
+        task_id, creator_id = self.rng.choice(self.world.tasks)
+        submitter_id = self.user_id if self.user_id != creator_id else creator_id % self.world.users + 1
+        status, data = self.request('POST', f'/api/tasks/{task_id}/submit',
+                                    {'image_url': f'/uploads/loadtest/{uuid.uuid4().hex}.jpg', 'note': 'Load test'},
+                                    token=self.world.token(submitter_id))
+        if status == 201:
+            self.world.add_pending(task_id, data['submission_id'])
+        return status
+
+    def op_accept(self):
+        pending = self.world.take_pending()
+        if pending is None:
+            return self.op_browse()
+        task_id, submission_id = pending
+        return self.request('POST', f'/api/tasks/{task_id}/submissions/{submission_id}/accept',
+                            token=self.world.token(self.world.creators[task_id]))[0]
+
+    def op_upload(self):
+        boundary = uuid.uuid4().hex
+        image = self.rng.choice(self.images)
+        body = (f'--{boundary}\r\nContent-Disposition: form-data; name="file"; filename="proof.jpg"\r\n'
+                f'Content-Type: image/jpeg\r\n\r\n').encode() + image + f'\r\n--{boundary}--\r\n'.encode()
+        return self.request('POST', '/api/upload', body,
+                            {'Content-Type': f'multipart/form-data; boundary={boundary}'},
+                            token=self.world.token(self.user_id))[0]
+
+    def op_login(self):
+        user_id = self.rng.randint(1, self.world.users)
+        return self.request('POST', '/api/login', {'email': f'user{user_id}@example.com', 'password': PASSWORD})[0]
+
+def wait_for(port, timeout=60):
+    """Poll until the server answers"""
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/api/health')
+            if conn.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'Server did not start on port {port}')
+
+def git_revision():
+    """Current commit, or None outside a git checkout"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def summarize(samples, seconds):
+    """Throughput, status counts and latency percentiles of (status, ms) samples"""
+    latencies = [ms for _, ms in samples]
+    statuses = {}
+    for status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests': len(samples),
+        'per_sec': round(len(samples) / seconds, 2),
+        'errors': sum(1 for status, _ in samples if not isinstance(status, int) or status >= 400),
+        'statuses': statuses,
+        'p50_ms': round(percentile(latencies, 50) or 0, 2),
+        'p95_ms': round(percentile(latencies, 95) or 0, 2),
+        'p99_ms': round(percentile(latencies, 99) or 0, 2),
+        'max_ms': round(max(latencies), 2) if latencies else 0,
+    }
+
+def run(args):
+    """Seed or copy the world, start the server, replay the mix and return the report"""
+    workdir = tempfile.mkdtemp(prefix='spacetask-loadtest-')
+    db_path = os.path.join(workdir, 'world.db')
+    if args.db:
+        # Runs mutate the database, so each one starts from a fresh copy
+        with sqlite3.connect(args.db) as source, sqlite3.connect(db_path) as target:
+            source.backup(target)
+        with open(f'{args.db}.json') as f:
+            summary = json.load(f)
+    else:
+        summary = build_world(db_path, args.users, args.tasks, args.cities, args.spread_km,
+                              args.submissions_per_task, rounds=args.rounds, seed=args.seed)
+    world = World(db_path, summary)
+    images = make_images(32, args.seed)
+
+    env = dict(os.environ)
+    env.update({
+        'DATABASE_PATH': db_path,
+        'UPLOAD_FOLDER': os.path.join(workdir, 'uploads'),
+        'METRICS_DIR': os.path.join(workdir, 'metrics'),
+        'JWT_SECRET': SECRET,
+        'BCRYPT_ROUNDS': str(summary['bcrypt_rounds']),
+        'PORT': str(args.port),
+        'HOST': '127.0.0.1',
+        'DEBUG': 'False',
+    })
+    env.update(args.server_env)
+    command = [sys.executable, os.path.join(ROOT, 'main.py'), '--mode', 'production']
+    if args.workers:
+        command += ['--workers', str(args.workers)]
+    server = subprocess.Popen(command, env=env, cwd=ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+    samples = {name: [] for name in args.mix}
+    lock = threading.Lock()
+    try:
+        wait_for(args.port)
+        stop = threading.Event()
+        measure_from = time.perf_counter() + args.warmup
+
+        def loop(n):
+            user = VirtualUser(args.port, world, images, args.mix, args.seed * 1000 + n)
+            while not stop.is_set():
+                try:
+                    name, status, ms = user.run_one()
+                except (http.client.HTTPException, OSError) as e:
+                    name, status, ms = 'connection', type(e).__name__, 0.0
+                if time.perf_counter() >= measure_from:
+                    with lock:
+                        samples.setdefault(name, []).append((status, ms))
+                if args.think_ms:
+                    time.sleep(user.rng.expovariate(1000 / args.think_ms))
+
+        threads = [threading.Thread(target=loop, args=(n,), daemon=True) for n in range(args.concurrency)]
+        for thread in threads:
+            thread.start()
+        time.sleep(args.warmup + args.duration)
+        stop.set()
+        for thread in threads:
+            thread.join(timeout=60)
+    finally:
+        server.terminate()
+        server.wait()
+
+    all_samples = [sample for values in samples.values() for sample in values]
+    return {
+        'revision': git_revision(),
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'host': {'python': platform.python_version(), 'cpus': os.cpu_count(), 'platform': platform.platform()},
+        'config': {
+            'duration': args.duration,
+            'warmup': args.warmup,
+            'concurrency': args.concurrency,
+            'workers': args.workers,
+            'think_ms': args.think_ms,
+            'seed': args.seed,
+            'mix': args.mix,
+            'server_env': args.server_env,
+        },
+        'world': {key: summary[key] for key in ('users', 'tasks', 'completed_tasks', 'submissions', 'transactions',
+                                                'spread_km', 'bcrypt_rounds')},
+        'total': summarize(all_samples, args.duration),
+        'operations': {name: dict(summarize(values, args.duration), request=OPERATIONS.get(name, (name,))[0])
+                       for name, values in samples.items() if values},
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds of measured load')
+    parser.add_argument('--warmup', type=float, default=3.0, help='Seconds of load before measuring')
+    parser.add_argument('--concurrency', type=int, default=16, help='Virtual users, one connection each')
+    parser.add_argument('--think-ms', type=float, default=0.0, help='Mean pause between a user\'s requests')
+    parser.add_argument('--workers', type=int, default=None, help='Server worker processes (default: one per core)')
+    parser.add_argument('--mix', type=parse_mix, default={name: weight for name, (_, weight) in OPERATIONS.items()},
+                        help='Operation weights, e.g. browse=50,nearby=30,login=20')
+    parser.add_argument('--db', help='Existing world to copy (needs the world.py summary saved as <db>.json)')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--tasks', type=int, default=20000)
+    parser.add_argument('--cities', type=int, default=8)
+    parser.add_argument('--spread-km', type=float, default=3.0)
+    parser.add_argument('--submissions-per-task', type=int, default=2)
+    parser.add_argument('--rounds', type=int, default=int(os.getenv('BCRYPT_ROUNDS', 12)), help='bcrypt cost')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--port', type=int, default=5095)
+    parser.add_argument('--server-env', action='append', default=[], metavar='KEY=VALUE',
+                        help='Extra environment for the server, e.g. to compare settings (repeatable)')
+    parser.add_argument('--output', help='Also write the JSON report to this file')
+    args = parser.parse_args(argv)
+    args.server_env = dict(item.split('=', 1) for item in args.server_env)
+
+    report = run(args)
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    return 0 if report['total']['requests'] else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
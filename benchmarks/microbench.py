@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmarks of hot service methods, with saved baselines and a regression gate.
+
+Each case calls one method in a loop against a synthetic world
+(benchmarks/world.py) of a given scale and records per-call latency:
+
+    get_nearby_tasks      DatabaseService, 5 km around a city center
+    get_tasks             DatabaseService, first page of 20 and one page further
+    get_leaderboard       DatabaseService, top 10 with the in-memory cache dropped first
+    accept_submission     DatabaseService, one pending submission per call
+    get_user_tasks        DatabaseService, created and completed tasks of a busy user
+    resize_image          UploadService, a JPEG that grows with the scale
+    verify_token          AuthService, cached and uncached
+
+Per case and scale it reports the median, p95 and mean in microseconds of the
+quietest of --repeat runs.
+--save stores the results as a named baseline in benchmarks/baselines/, and
+--compare reruns and exits non-zero if any median got slower than the baseline
+by more than --tolerance. Baselines are only comparable on the same machine,
+so the directory is ignored by git.
+
+    python benchmarks/microbench.py --save laptop
+    python benchmarks/microbench.py --compare laptop --tolerance 0.2
+    python benchmarks/microbench.py --scales small --cases get_nearby_tasks get_tasks
+"""
+
+import argparse
+import io
+import json
+import os
+import platform
+import random
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from world import build_world
+
+BASELINES = os.path.join(ROOT, 'benchmarks', 'baselines')
+
+# Scale -> world size and the side of the image resize_image gets
+SCALES = {
+    'small': {'users': 500, 'tasks': 5000, 'image': 800},
+    'medium': {'users': 5000, 'tasks': 50000, 'image': 2000},
+    'large': {'users': 20000, 'tasks': 200000, 'image': 4000},
+}
+
+def percentile(values, pct):
+    """Nearest-rank percentile of a list of numbers"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(pct / 100 * len(ordered))) - 1))
+    return ordered[index]
+
+class Context:
+    """Services and sample data for one scale, shared by its cases"""
+
+    def __init__(self, scale, workdir, seed):
+        from services.auth import AuthService
+        from services.database import DatabaseService
+        from services.upload import UploadService
+
+        self.scale = scale
+        self.rng = random.Random(seed)
+        self.db_path = os.path.join(workdir, f'{scale}.db')
+        self.world = build_world(self.db_path, SCALES[scale]['users'], SCALES[scale]['tasks'], rounds=4, seed=seed)
+        self.db = DatabaseService(self.db_path)
+        self.uploads = UploadService(os.path.join(workdir, f'{scale}-uploads'))
+        self.auth = AuthService('microbench-secret-microbench-secret')
+        self.uncached_auth = AuthService('microbench-secret-microbench-secret', token_cache_size=0)
+        self.cities = [(city['latitude'], city['longitude']) for city in self.world['cities']]
+
+        conn = sqlite3.connect(self.db_path)
+        self.pending = conn.execute('''
+            SELECT s.id, s.task_id FROM task_submissions s JOIN tasks t ON t.id = s.task_id
+            WHERE t.status = 'active' AND s.status = 'pending'
+        ''').fetchall()
+        self.busy_creator = conn.execute('''
+            SELECT creator_id FROM tasks GROUP BY creator_id ORDER BY COUNT(*) DESC LIMIT 1
+        ''').fetchone()[0]
+        self.busy_submitter = conn.execute('''
+            SELECT submitter_id FROM task_submissions WHERE status = 'accepted'
+            GROUP BY submitter_id ORDER BY COUNT(*) DESC LIMIT 1
+        ''').fetchone()[0]
+        conn.close()
+        self.rng.shuffle(self.pending)
+
+    def image(self):
+        """A noisy JPEG of the scale's size, so resizing does real work"""
+        from PIL import Image
+
+        side = SCALES[self.scale]['image']
+        image = Image.effect_noise((side, side * 3 // 4), 64).convert('RGB')
+        buffer = io.BytesIO()
+        image.save(buffer, 'JPEG', quality=90)
+        return buffer.getvalue()
+
+def _nearby(ctx):
+    def call():
+        lat, lng = ctx.rng.choice(ctx.cities)
+        ctx.db.get_nearby_tasks(lat, lng, 5.0, limit=50)
+    return call
+
+def _tasks(ctx):
+    from services.pagination import decode_cursor
+
+    _, cursor = ctx.db.get_tasks(limit=20)
+    after = decode_cursor(cursor)
+    pages = [None, after]
+
+    def call():
+        ctx.db.get_tasks(limit=20, after=ctx.rng.choice(pages))
+    return call
+
+def _leaderboard(ctx):
+    def call():
+        ctx.db.leaderboard_cache.invalidate()
+        ctx.db.get_leaderboard(10)
+    return call
+
+def _accept(ctx):
+    def call():
+        submission_id, task_id = ctx.pending.pop()
+        ctx.db.accept_submission(submission_id, task_id)
+    return call
+
+def _user_tasks(ctx):
+    def call():
+        if ctx.rng.random() < 0.5:
+            ctx.db.get_user_tasks(ctx.busy_creator, 'created', limit=20)
+        else:
+            ctx.db.get_user_tasks(ctx.busy_submitter, 'completed', limit=20)
+    return call
+
+def _resize(ctx):
+    data = ctx.image()
+    return lambda: ctx.uploads.resize_image(data)
+
+def _verify(auth_attr):
+    def setup(ctx):
+        auth = getattr(ctx, auth_attr)
+        tokens = [auth.generate_token(user_id, f'user{user_id}') for user_id in range(1, 101)]
+        return lambda: auth.verify_token(ctx.rng.choice(tokens))
+    return setup
+
+# Case -> (setup returning the callable to time, most calls per run or None)
+CASES = {
+    'get_nearby_tasks': (_nearby, None),
+    'get_tasks': (_tasks, None),
+    'get_leaderboard': (_leaderboard, None),
+    'accept_submission': (_accept, 1000),
+    'get_user_tasks': (_user_tasks, None),
+    'resize_image': (_resize, 100),
+    'verify_token': (_verify('auth'), None),
+    'verify_token_uncached': (_verify('uncached_auth'), None),
+}
+
+def measure(call, seconds, repeat, max_calls=None, warmup=5):
+    """Time `repeat` runs of about `seconds` each; statistics (in microseconds) come from the run with the lowest median"""
+    for _ in range(warmup):
+        call()
+    runs = []
+    for _ in range(repeat):
+        samples = []
+        deadline = time.perf_counter() + seconds
+        while (time.perf_counter() < deadline or len(samples) < 20) and \
+                (max_calls is None or len(samples) < max_calls):
+            started = time.perf_counter_ns()
+            call()
+            samples.append((time.perf_counter_ns() - started) / 1000)
+        runs.append(samples)
+    # The quietest run is the most repeatable estimate on a shared machine
+    samples = min(runs, key=lambda run: percentile(run, 50))
+    return {
+        'calls': sum(len(run) for run in runs),
+        'median_us': round(percentile(samples, 50), 2),
+        'p95_us': round(percentile(samples, 95), 2),
+        'mean_us': round(sum(samples) / len(samples), 2),
+        'run_medians_us': [round(percentile(run, 50), 2) for run in runs],
+    }
+
+def run(args):
+    """Run every selected case at every selected scale"""
+    workdir = tempfile.mkdtemp(prefix='spacetask-microbench-')
+    os.environ.setdefault('METRICS_DIR', os.path.join(workdir, 'metrics'))
+    results = {}
+    for scale in args.scales:
+        ctx = Context(scale, workdir, args.seed)
+        for name in args.cases:
+            setup, max_calls = CASES[name]
+            results[f'{name}[{scale}]'] = measure(setup(ctx), args.seconds, args.repeat, max_calls)
+            print(f'{name}[{scale}]: {results[f"{name}[{scale}]"]["median_us"]} us', file=sys.stderr)
+    return results
+
+def compare(results, baseline, tolerance):
+    """Median ratio of each case to the baseline; regressed when slower by more than the tolerance"""
+    comparison = {}
+    for key, current in results.items():
+        previous = baseline['results'].get(key)
+        if previous is None:
+            comparison[key] = {'status': 'new', 'median_us': current['median_us']}
+            continue
+        ratio = current['median_us'] / previous['median_us'] if previous['median_us'] else float('inf')
+        if ratio > 1 + tolerance:
+            status = 'regressed'
+        elif ratio < 1 / (1 + tolerance):
+            status = 'improved'
+        else:
+            status = 'ok'
+        comparison[key] = {'status': status, 'baseline_us': previous['median_us'],
+                           'median_us': current['median_us'], 'ratio': round(ratio, 3)}
+    return comparison
+
+def git_revision():
+    """Current commit, or None outside a git checkout"""
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                       stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--cases', nargs='+', choices=list(CASES), default=list(CASES))
+    parser.add_argument('--scales', nargs='+', choices=list(SCALES), default=['small', 'medium'])
+    parser.add_argument('--seconds', type=float, default=0.5, help='Length of each timed run of a case')
+    parser.add_argument('--repeat', type=int, default=3, help='Timed runs per case; the one with the lowest median counts')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--save', metavar='NAME', help='Store the results as benchmarks/baselines/NAME.json')
+    parser.add_argument('--compare', metavar='NAME', help='Compare against a saved baseline; exit 1 on regressions')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='Allowed median slowdown before a case counts as regressed (default: 0.25 = 25%%)')
+    args = parser.parse_args(argv)
+
+    baseline = None
+    if args.compare:
+        with open(os.path.join(BASELINES, f'{args.compare}.json')) as f:
+            baseline = json.load(f)
+
+    report = {
+        'revision': git_revision(),
+        'started_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'host': {'python': platform.python_version(), 'cpus': os.cpu_count(), 'platform': platform.platform(),
+                 'sqlite': sqlite3.sqlite_version},
+        'config': {'seconds': args.seconds, 'repeat': args.repeat, 'seed': args.seed, 'scales': args.scales},
+        'results': run(args),
+    }
+
+    if args.save:
+        os.makedirs(BASELINES, exist_ok=True)
+        with open(os.path.join(BASELINES, f'{args.save}.json'), 'w') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+
+    exit_code = 0
+    if baseline is not None:
+        report['baseline'] = {'name': args.compare, 'revision': baseline.get('revision'), 'tolerance': args.tolerance}
+        report['comparison'] = compare(report['results'], baseline, args.tolerance)
+        regressed = [key for key, entry in report['comparison'].items() if entry['status'] == 'regressed']
+        for key in regressed:
+            entry = report['comparison'][key]
+            print(f"REGRESSED {key}: {entry['baseline_us']} -> {entry['median_us']} us (x{entry['ratio']})",
+                  file=sys.stderr)
+        exit_code = 1 if regressed else 0
+
+    print(json.dumps(report, indent=2))
+    return exit_code
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+"""
+Concurrency stress test for the coin ledger.
+
+Seeds a throwaway database with creators, escrowed tasks and several competing
+submissions per task, then has many worker processes accept every submission in
+random order at the same time. Afterwards it checks that:
+
+    - each task has exactly one accepted submission and is completed
+    - every submitter was paid exactly bounty + reward per accepted submission
+    - no coins were created or lost: balances + escrow on active tasks equal
+      the starting total plus the completion rewards paid out
+
+    python benchmarks/stress_ledger.py
+    python benchmarks/stress_ledger.py --workers 16 --tasks 500 --submissions-per-task 4
+
+Exits non-zero if any check fails.
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def seed(db_path, args):
+    """Create creators, submitters, tasks and pending submissions; returns submission IDs"""
+    from services.database import DatabaseService
+
+    db = DatabaseService(db_path)
+    db.init_database()
+    creators = [db.create_user(f'creator{i}', f'creator{i}@example.com', 'x') for i in range(args.creators)]
+    submitters = [db.create_user(f'submitter{i}', f'submitter{i}@example.com', 'x') for i in range(args.submitters)]
+    for creator_id in creators:
+        db.update_user_balance(creator_id, args.tasks * 100)
+
+    rng = random.Random(1)
+    submission_ids = []
+    for i in range(args.tasks):
+        task_id = db.create_task(creators[i % len(creators)], f'Task {i}', 'Stress task', 'stress', 'Photo',
+                                 rng.randint(1, 50), 40.0, -73.0)
+        for submitter_id in rng.sample(submitters, args.submissions_per_task):
+            submission_ids.append(db.create_submission(task_id, submitter_id, 'http://example.com/x.jpg'))
+    return submission_ids
+
+def worker(db_path, submission_ids, seed_value, barrier, results):
+    """Try to accept every submission, in a worker-specific random order"""
+    from services.database import DatabaseService
+
+    db = DatabaseService(db_path)
+    order = list(submission_ids)
+    random.Random(seed_value).shuffle(order)
+    barrier.wait()
+    accepted = 0
+    for submission_id in order:
+        if db.accept_submission(submission_id):
+            accepted += 1
+    results.put((len(order), accepted))
+
+def total_coins(conn):
+    """Balances plus bounties still held in escrow"""
+    balances = conn.execute('SELECT SUM(coin_balance) FROM users').fetchone()[0]
+    escrow = conn.execute("SELECT COALESCE(SUM(escrow_amount), 0) FROM tasks WHERE status = 'active'").fetchone()[0]
+    return balances + escrow
+
+def check(db_path, starting_total, starting_balances):
+    """Verify the ledger invariants; returns a list of failures"""
+    from services.database import DatabaseService
+    from services.ledger import COMPLETION_REWARD
+
+    failures = []
+    with DatabaseService(db_path).connection() as conn:
+        rows = conn.execute('''
+            SELECT t.id, t.status, t.bounty_amount,
+                   SUM(ts.status = 'accepted') AS accepted
+            FROM tasks t JOIN task_submissions ts ON ts.task_id = t.id
+            GROUP BY t.id
+        ''').fetchall()
+        for row in rows:
+            if row['accepted'] != 1 or row['status'] != 'completed':
+                failures.append(f"task {row['id']}: {row['accepted']} accepted, status {row['status']}")
+
+        expected = dict(starting_balances)
+        paid = conn.execute('''
+            SELECT ts.submitter_id, SUM(t.bounty_amount + ?) AS earned
+            FROM task_submissions ts JOIN tasks t ON t.id = ts.task_id
+            WHERE ts.status = 'accepted'
+            GROUP BY ts.submitter_id
+        ''', (COMPLETION_REWARD,)).fetchall()
+        for row in paid:
+            expected[row['submitter_id']] += row['earned']
+        for row in conn.execute("SELECT id, coin_balance FROM users WHERE username LIKE 'submitter%'"):
+            if row['coin_balance'] != expected[row['id']]:
+                failures.append(f"submitter {row['id']}: balance {row['coin_balance']}, expected {expected[row['id']]}")
+
+        accepted = sum(row['accepted'] for row in rows)
+        total = total_coins(conn)
+        if total != starting_total + accepted * COMPLETION_REWARD:
+            failures.append(f'total coins {total}, expected {starting_total + accepted * COMPLETION_REWARD}')
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--creators', type=int, default=5)
+    parser.add_argument('--submitters', type=int, default=20)
+    parser.add_argument('--tasks', type=int, default=200)
+    parser.add_argument('--submissions-per-task', type=int, default=3)
+    args = parser.parse_args()
+
+    from services.database import DatabaseService
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='spacetask-stress-'), 'stress.db')
+    submission_ids = seed(db_path, args)
+    with DatabaseService(db_path).connection() as conn:
+        starting_total = total_coins(conn)
+        starting_balances = {row['id']: row['coin_balance'] for row in conn.execute('SELECT id, coin_balance FROM users')}
+
+    # Workers open their own connections; fork before any of them exist in this process
+    DatabaseService(db_path).pool.close()
+    context = multiprocessing.get_context('fork')
+    barrier = context.Barrier(args.workers)
+    results = context.Queue()
+    processes = [context.Process(target=worker, args=(db_path, submission_ids, i, barrier, results))
+                 for i in range(args.workers)]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    outcomes = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+    elapsed = time.perf_counter() - started
+
+    failures = check(db_path, starting_total, starting_balances)
+    attempts = sum(outcome[0] for outcome in outcomes)
+    print(json.dumps({
+        'workers': args.workers,
+        'tasks': args.tasks,
+        'attempts': attempts,
+        'accepted': sum(outcome[1] for outcome in outcomes),
+        'attempts_per_sec': round(attempts / elapsed, 1),
+        'seconds': round(elapsed, 2),
+        'failures': failures[:20],
+        'ok': not failures,
+    }, indent=2))
+    return 0 if not failures else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
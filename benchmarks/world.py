@@ -0,0 +1,190 @@
+#!/usr/bin/env python3
+"""
+Synthetic world generator for benchmarks and load tests.
+
+Builds a database (schema via the normal migrations) holding users, tasks
+clustered around synthetic city centers, pending and accepted submissions and
+a consistent coin ledger, using bulk inserts in one transaction. The same
+--seed always produces the same world.
+
+    - every user shares one password ('password123'), hashed once
+    - tasks are normally distributed around their city (sigma --spread-km) with
+      created_at spread over the last 30 days; --completed of them are done
+    - transactions record the signup bonus, a seed grant covering each
+      creator's bounties, escrow of every bounty and payouts of completed tasks,
+      so balances + escrow match the ledger
+
+The summary (counts and city centers) is printed and saved as <db>.json.
+
+    python benchmarks/world.py --db /tmp/world.db
+    python benchmarks/world.py --db /tmp/world.db --users 20000 --tasks 200000 --cities 20
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+PASSWORD = 'password123'
+SIGNUP_BONUS = 200
+SEED_BUFFER = 500
+
+def city_centers(count, rng):
+    """Synthetic city centers spread over the inhabited latitudes"""
+    return [(round(rng.uniform(-45, 60), 4), round(rng.uniform(-170, 170), 4)) for _ in range(count)]
+
+def jitter(center, spread_km, rng):
+    """A point normally distributed around a center, spread_km being one standard deviation"""
+    lat, lng = center
+    lat += rng.gauss(0, spread_km) / 111.32
+    lng += rng.gauss(0, spread_km) / (111.32 * max(0.1, math.cos(math.radians(lat))))
+    return round(max(-89.9, min(89.9, lat)), 6), round(lng, 6)
+
+def timestamp(now, rng, days=30):
+    """SQLite-formatted time up to `days` before now"""
+    return (now - timedelta(seconds=rng.uniform(0, days * 86400))).strftime('%Y-%m-%d %H:%M:%S')
+
+def password_hash(rounds):
+    """One bcrypt hash of PASSWORD shared by every generated user"""
+    import bcrypt
+    return bcrypt.hashpw(PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds=rounds)).decode('utf-8')
+
+def build_world(db_path, users=2000, tasks=20000, cities=8, spread_km=3.0, submissions_per_task=2,
+                completed=0.2, rounds=None, seed=1):
+    """Create and fill a database; returns a summary including the city centers"""
+    from services.database import DatabaseService
+    from services.ledger import COMPLETION_REWARD
+
+    started = time.perf_counter()
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc).replace(microsecond=0)
+    rounds = rounds or int(os.getenv('BCRYPT_ROUNDS', 12))
+    DatabaseService(db_path).init_database()
+    centers = city_centers(cities, rng)
+
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    conn.execute('PRAGMA journal_mode = WAL')
+    conn.execute('PRAGMA synchronous = OFF')
+    conn.execute('BEGIN')
+    try:
+        user_rows = [(i, f'user{i}', f'user{i}@example.com', timestamp(now, rng, 60)) for i in range(1, users + 1)]
+        balances = {user_id: SIGNUP_BONUS for user_id, *_ in user_rows}
+        completions = {}
+        ledger = [(None, user_id, SIGNUP_BONUS, 'signup_bonus', None, 'Welcome bonus for joining SpaceTask', created)
+                  for user_id, _, _, created in user_rows]
+
+        task_rows, submission_rows = [], []
+        bounties = {}
+        submission_id = 0
+        for task_id in range(1, tasks + 1):
+            city = rng.randrange(cities)
+            creator_id = rng.randint(1, users)
+            bounty = rng.randint(5, 50)
+            lat, lng = jitter(centers[city], spread_km, rng)
+            created = timestamp(now, rng)
+            done = rng.random() < completed
+            bounties[creator_id] = bounties.get(creator_id, 0) + bounty
+            ledger.append((creator_id, creator_id, bounty, 'bounty_escrow', task_id,
+                           f'Bounty escrowed for task #{task_id}', created))
+
+            submitters = rng.sample(range(1, users + 1), min(users - 1, submissions_per_task + 1))
+            submitters = [s for s in submitters if s != creator_id][:submissions_per_task]
+            accepted = submitters[0] if done and submitters else None
+            for submitter_id in submitters:
+                submission_id += 1
+                status = 'accepted' if submitter_id == accepted else 'pending'
+                submission_rows.append((submission_id, task_id, submitter_id,
+                                        f'/uploads/world/{submission_id}.jpg', None, status, created,
+                                        created if submitter_id == accepted else None))
+            if accepted:
+                reward = COMPLETION_REWARD
+                balances[accepted] += bounty + reward
+                completions[accepted] = completions.get(accepted, 0) + 1
+                ledger.append((creator_id, accepted, bounty, 'task_bounty', task_id,
+                               f'Bounty for completing task #{task_id}', created))
+                ledger.append((None, accepted, reward, 'task_completion', task_id,
+                               f'Completion reward for task #{task_id}', created))
+
+            task_rows.append((task_id, creator_id, f'City {city} task {task_id}',
+                              'Photograph the marked spot', rng.choice(['photo', 'delivery', 'survey', 'cleanup']),
+                              'A clear photo of the location', bounty, 0 if accepted else bounty, lat, lng,
+                              f'City {city}', 'completed' if accepted else 'active', created, created))
+
+        # Grant every creator enough to have paid their bounties, plus spending money for the load test
+        for user_id, total in bounties.items():
+            grant = total + SEED_BUFFER
+            balances[user_id] += grant - total
+            ledger.append((None, user_id, grant, 'seed_grant', None, 'Synthetic world grant', user_rows[user_id - 1][3]))
+
+        hashed = password_hash(rounds)
+        conn.executemany('''
+            INSERT INTO users (id, username, email, password_hash, coin_balance, completed_tasks, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', [(user_id, name, email, hashed, balances[user_id], completions.get(user_id, 0), created, created)
+              for user_id, name, email, created in user_rows])
+        conn.executemany('''
+            INSERT INTO tasks (id, creator_id, title, description, label, completion_criteria, bounty_amount,
+                               escrow_amount, latitude, longitude, location_name, status, created_at, updated_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', task_rows)
+        conn.executemany('''
+            INSERT INTO task_submissions (id, task_id, submitter_id, image_url, note, status, submitted_at, reviewed_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', submission_rows)
+        conn.executemany('''
+            INSERT INTO transactions (from_user_id, to_user_id, amount, transaction_type, task_id, description, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', ledger)
+        conn.execute('COMMIT')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    conn.close()
+
+    return {
+        'db': db_path,
+        'seed': seed,
+        'users': users,
+        'tasks': tasks,
+        'completed_tasks': sum(1 for row in task_rows if row[11] == 'completed'),
+        'submissions': len(submission_rows),
+        'transactions': len(ledger),
+        'cities': [{'latitude': lat, 'longitude': lng} for lat, lng in centers],
+        'spread_km': spread_km,
+        'bcrypt_rounds': rounds,
+        'seconds': round(time.perf_counter() - started, 2),
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--db', required=True, help='Database file to create (must not exist)')
+    parser.add_argument('--users', type=int, default=2000)
+    parser.add_argument('--tasks', type=int, default=20000)
+    parser.add_argument('--cities', type=int, default=8)
+    parser.add_argument('--spread-km', type=float, default=3.0, help='Standard deviation of tasks around a city')
+    parser.add_argument('--submissions-per-task', type=int, default=2)
+    parser.add_argument('--completed', type=float, default=0.2, help='Share of tasks already completed')
+    parser.add_argument('--rounds', type=int, default=None, help='bcrypt cost (default: $BCRYPT_ROUNDS or 12)')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args(argv)
+
+    if os.path.exists(args.db):
+        parser.error(f'{args.db} already exists')
+    summary = build_world(args.db, args.users, args.tasks, args.cities, args.spread_km,
+                          args.submissions_per_task, args.completed, args.rounds, args.seed)
+    # Saved next to the database for loadtest.py --db
+    with open(f'{args.db}.json', 'w') as f:
+        json.dump(summary, f, indent=2)
+    print(json.dumps(summary, indent=2))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
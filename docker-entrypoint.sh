@@ -18,9 +18,17 @@ fi
 # Set database path to the mounted volume
 export DATABASE_PATH="/app/data/spacetask.db"
 
-# Run database initialization (will create tables if they don't exist)
-echo "Initializing database at $DATABASE_PATH..."
-python -c "from services.database import DatabaseService; db = DatabaseService('$DATABASE_PATH'); print('Database initialized successfully')"
+# Apply pending schema migrations (tracked in PRAGMA user_version)
+echo "Migrating database at $DATABASE_PATH..."
+python -m services.migrations --db "$DATABASE_PATH"
+
+# Verify the hot queries are still served by indexes
+python -m services.migrations --db "$DATABASE_PATH" --check-plans || echo "WARNING: query plan check failed, see above"
+
+# Run another command against the same database (e.g. the notification dispatcher)
+if [ "$#" -gt 0 ]; then
+    exec "$@"
+fi
 
 # Start the application
 echo "Starting SpaceTask Backend on port $PORT..."
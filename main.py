@@ -3,10 +3,16 @@
 SpaceTask Backend - Main Entry Point
 """
 
+import argparse
 import os
 import sys
 from dotenv import load_dotenv
 
+try:
+    from gunicorn.app.base import BaseApplication
+except ImportError:  # only needed for --mode production
+    BaseApplication = None
+
 # Load environment variables from .env file
 load_dotenv()
 
@@ -16,8 +22,58 @@ sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 # Import the Flask app
 from api import app
 
-def main():
+class ProductionServer(BaseApplication if BaseApplication else object):
+    """Gunicorn prefork server with the Flask app loaded once in the master"""
+    
+    def __init__(self, application, options: dict):
+        self.application = application
+        self.options = options
+        super().__init__()
+    
+    def load_config(self):
+        for key, value in self.options.items():
+            if key in self.cfg.settings and value is not None:
+                self.cfg.set(key, value)
+    
+    def load(self):
+        return self.application
+
+def production_options(host: str, port: int) -> dict:
+    """Gunicorn settings, sized to the available cores and overridable from the environment"""
+    # Honors a container CPU limit; every worker brings its own image and bcrypt pools
+    from services.resources import available_cpus
+    cores = available_cpus()
+    return {
+        'bind': f'{host}:{port}',
+        'workers': int(os.getenv('WEB_CONCURRENCY', cores)),
+        'worker_class': 'gthread',
+        'threads': int(os.getenv('WEB_THREADS', 4)),
+        # Import the app (and pay its startup cost) once, then fork workers from it
+        'preload_app': True,
+        # Recycle workers periodically to contain memory growth
+        'max_requests': int(os.getenv('WEB_MAX_REQUESTS', 2000)),
+        'max_requests_jitter': int(os.getenv('WEB_MAX_REQUESTS_JITTER', 200)),
+        # Let in-flight requests finish on SIGTERM before killing a worker. With the
+        # app preloaded, SIGHUP forks workers from the old code; deploy with a restart.
+        'graceful_timeout': int(os.getenv('WEB_GRACEFUL_TIMEOUT', 30)),
+        'timeout': int(os.getenv('WEB_TIMEOUT', 60)),
+        'keepalive': int(os.getenv('WEB_KEEPALIVE', 5)),
+        'accesslog': os.getenv('WEB_ACCESS_LOG'),
+        'errorlog': '-',
+    }
+
+def parse_args(argv=None):
+    """Command line options (each falls back to an environment variable)"""
+    parser = argparse.ArgumentParser(description='Run the SpaceTask API server')
+    parser.add_argument('--mode', choices=['development', 'production'],
+                        default=os.getenv('SERVER_MODE', 'development'),
+                        help='development: Flask dev server; production: prefork gunicorn workers (default: $SERVER_MODE)')
+    parser.add_argument('--workers', type=int, help='Number of worker processes (default: $WEB_CONCURRENCY or one per available core)')
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """Main function to run the SpaceTask API server"""
+    args = parse_args(argv)
     
     # Get configuration from environment
     host = os.getenv('HOST', '0.0.0.0')
@@ -25,6 +81,7 @@ def main():
     debug = os.getenv('DEBUG', 'False').lower() == 'true'
     
     print(f"Starting SpaceTask API server...")
+    print(f"Mode: {args.mode}")
     print(f"Host: {host}")
     print(f"Port: {port}")
     print(f"Debug: {debug}")
@@ -34,8 +91,37 @@ def main():
     uploads_dir = os.getenv('UPLOAD_FOLDER', 'uploads')
     os.makedirs(uploads_dir, exist_ok=True)
     
-    # Run the Flask app
-    app.run(host=host, port=port, debug=debug)
+    # Apply any pending migrations (a no-op when the entrypoint already ran them)
+    from services.database import DatabaseService
+    db = DatabaseService()
+    db.init_database()
+    
+    # Clean up after uploads whose processing died with a previous server
+    from services.upload import UploadService
+    stale_after = float(os.getenv('UPLOAD_STALE_SECONDS', 600))
+    failed = db.fail_stale_uploads(stale_after)
+    swept = UploadService(uploads_dir).sweep_incoming(stale_after)
+    if failed or swept:
+        print(f"Uploads: marked {failed} stale as failed, removed {swept} orphaned raw files")
+    # Don't hand open SQLite connections to forked workers: close the pooled
+    # readers and stop the writer thread the startup sweep above may have started
+    db.pool.close()
+    db.writer.close()
+    
+    if args.mode == 'production':
+        if BaseApplication is None:
+            sys.exit('Production mode requires gunicorn (pip install -r requirements.txt)')
+        options = production_options(host, port)
+        if args.workers:
+            options['workers'] = args.workers
+        print(f"Workers: {options['workers']} x {options['threads']} threads")
+        # Workers size their bcrypt pools from these (services/auth.py)
+        os.environ['WEB_CONCURRENCY'] = str(options['workers'])
+        os.environ['WEB_THREADS'] = str(options['threads'])
+        ProductionServer(app, options).run()
+    else:
+        # Run the Flask app
+        app.run(host=host, port=port, debug=debug)
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
@@ -1,22 +1,184 @@
 import jwt
-import bcrypt
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
 import os
 
+from services.metrics import metrics
+from services.resources import available_cpus
+
+logger = logging.getLogger(__name__)
+
+class AuthServiceBusy(Exception):
+    """Raised when the password hashing queue is full; callers should answer 503"""
+    pass
+
+class PasswordHasher:
+    """Runs bcrypt on a small dedicated thread pool with a bounded queue.
+    
+    bcrypt releases the GIL, so capping the pool at a few threads keeps a burst of
+    logins or signups from occupying every CPU core while reads wait. Work beyond
+    `workers + queue_limit` in flight is rejected immediately with AuthServiceBusy.
+    
+    Unless set explicitly, the limits are worked out when the pool starts in a
+    web worker: half the available cores are shared out across the
+    WEB_CONCURRENCY workers as bcrypt threads, and at most half of a worker's
+    WEB_THREADS may wait on a password at once, so the rest keep serving reads.
+    """
+    
+    def __init__(self, workers: int = None, queue_limit: int = None):
+        self._configured = (workers, queue_limit)
+        self.workers = None
+        self.queue_limit = None
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._slots = None
+        self.rejected = 0
+    
+    def _resolve_limits(self):
+        """Set workers and queue_limit from the constructor, the environment or the server's size"""
+        workers, queue_limit = self._configured
+        cores = available_cpus()
+        web_workers = int(os.getenv('WEB_CONCURRENCY', cores))
+        threads = int(os.getenv('WEB_THREADS', 4))
+        
+        self.workers = workers or int(os.getenv('BCRYPT_WORKERS', max(1, cores // 2 // max(1, web_workers))))
+        if queue_limit is None:
+            queue_limit = int(os.getenv('BCRYPT_QUEUE_LIMIT', max(0, threads // 2 - self.workers)))
+        self.queue_limit = queue_limit
+        if self.workers + self.queue_limit >= threads:
+            logger.warning('BCRYPT_WORKERS + BCRYPT_QUEUE_LIMIT (%d) is not below WEB_THREADS (%d); '
+                           'password bursts can occupy every request thread', self.workers + self.queue_limit,
+                           threads)
+    
+    def _get_executor(self) -> ThreadPoolExecutor:
+        """Create the pool lazily, and again after a fork (threads do not survive one)"""
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._resolve_limits()
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='bcrypt')
+                self._slots = threading.BoundedSemaphore(self.workers + self.queue_limit)
+            return self._executor
+    
+    def run(self, fn, *args):
+        """Run fn(*args) on the bcrypt pool and wait for the result"""
+        executor = self._get_executor()
+        slots = self._slots
+        if not slots.acquire(blocking=False):
+            with self._lock:
+                self.rejected += 1
+            raise AuthServiceBusy('Too many password operations in progress')
+        try:
+            return executor.submit(self._timed, fn, *args).result()
+        finally:
+            slots.release()
+    
+    @staticmethod
+    def _timed(fn, *args):
+        """Call fn on a pool thread, observing only the bcrypt time and not the queue wait"""
+        with metrics.timer('bcrypt_duration_seconds', operation=fn.__name__):
+            return fn(*args)
+
+# One hashing pool per process, shared by every AuthService
+_password_hasher = PasswordHasher()
+metrics.register_collector(lambda: [('bcrypt_rejected_total', {}, _password_hasher.rejected)])
+
+class TokenCache:
+    """Bounded LRU of already-verified JWT payloads, keyed by the full token string.
+    
+    Entries expire at the token's own `exp`, so a cached token is never accepted
+    after PyJWT would have rejected it. Tampered tokens differ in their signature
+    and therefore never match a cached entry.
+    """
+    
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        """Get the cached payload for a token, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                self.misses += 1
+                return None
+            
+            payload, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[token]
+                self.misses += 1
+                return None
+            
+            self._entries.move_to_end(token)
+            self.hits += 1
+            return dict(payload)
+    
+    def put(self, token: str, payload: Dict[str, Any]):
+        """Remember a verified payload until its expiry"""
+        expires_at = payload.get('exp')
+        if not isinstance(expires_at, (int, float)):
+            return
+        
+        with self._lock:
+            self._entries[token] = (dict(payload), expires_at)
+            self._entries.move_to_end(token)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Hit/miss counters and current size"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0
+            }
+
 class AuthService:
-    def __init__(self, secret_key: str, algorithm: str = 'HS256'):
+    def __init__(self, secret_key: str, algorithm: str = 'HS256', token_cache_size: int = None,
+                 bcrypt_rounds: int = None):
         self.secret_key = secret_key
         self.algorithm = algorithm
+        self.bcrypt_rounds = bcrypt_rounds or int(os.getenv('BCRYPT_ROUNDS', 12))
+        self.password_hasher = _password_hasher
+        
+        if token_cache_size is None:
+            token_cache_size = int(os.getenv('JWT_CACHE_SIZE', 10000))
+        self.token_cache = TokenCache(token_cache_size) if token_cache_size > 0 else None
     
     def hash_password(self, password: str) -> str:
-        """Hash a password using bcrypt"""
-        salt = bcrypt.gensalt()
-        return bcrypt.hashpw(password.encode('utf-8'), salt).decode('utf-8')
+        """Hash a password using bcrypt (raises AuthServiceBusy when saturated)"""
+        import bcrypt
+        
+        salt = bcrypt.gensalt(rounds=self.bcrypt_rounds)
+        hashed = self.password_hasher.run(bcrypt.hashpw, password.encode('utf-8'), salt)
+        return hashed.decode('utf-8')
     
     def verify_password(self, password: str, hashed_password: str) -> bool:
-        """Verify a password against its hash"""
-        return bcrypt.checkpw(password.encode('utf-8'), hashed_password.encode('utf-8'))
+        """Verify a password against its hash (raises AuthServiceBusy when saturated)"""
+        import bcrypt
+        
+        return self.password_hasher.run(bcrypt.checkpw, password.encode('utf-8'), hashed_password.encode('utf-8'))
+    
+    def needs_rehash(self, hashed_password: str) -> bool:
+        """Check whether a hash was made with a different cost than the configured one"""
+        try:
+            # bcrypt hashes look like $2b$12$<salt+hash>
+            return int(hashed_password.split('$')[2]) != self.bcrypt_rounds
+        except (IndexError, ValueError):
+            return False
     
     def generate_token(self, user_id: int, username: str, expires_in_hours: int = 24) -> str:
         """Generate JWT token for user"""
@@ -31,8 +193,15 @@ class AuthService:
     
     def verify_token(self, token: str) -> Optional[Dict[str, Any]]:
         """Verify JWT token and return payload"""
+        if self.token_cache is not None:
+            payload = self.token_cache.get(token)
+            if payload is not None:
+                return payload
+        
         try:
             payload = jwt.decode(token, self.secret_key, algorithms=[self.algorithm])
+            if self.token_cache is not None:
+                self.token_cache.put(token, payload)
             return payload
         except jwt.ExpiredSignatureError:
             return None
@@ -47,4 +216,8 @@ class AuthService:
                 'user_id': payload.get('user_id'),
                 'username': payload.get('username')
             }
-        return None 
\ No newline at end of file
+        return None
+    
+    def token_cache_stats(self) -> Optional[Dict[str, Any]]:
+        """Get verified-token cache counters (None when caching is disabled)"""
+        return self.token_cache.stats() if self.token_cache is not None else None 
\ No newline at end of file
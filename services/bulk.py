@@ -0,0 +1,307 @@
+"""
+Streaming NDJSON export and import of the core tables.
+
+Export writes one ``<table>.ndjson`` (or ``.ndjson.gz``) file per table plus a
+``manifest.json`` with the schema version and row counts. Every table is read
+in one read transaction, so balances and the ledger in an export always agree,
+and rows are fetched in chunks, so memory use does not grow with the table.
+The manifest is written last; a directory without one is an unfinished export.
+
+Import migrates the target database, then loads the files in dependency order
+with batched ``executemany`` calls, committing every few batches. The tables
+being imported must be empty. Their secondary indexes and the triggers that
+keep ``tasks_rtree`` in sync are dropped first and rebuilt in one pass at the
+end, which is much faster than maintaining them row by row. A failed import
+leaves the batches committed so far in place; start again on a fresh database.
+
+Import needs the database to itself: stop the web server, notifier and event
+stream server first. It takes SQLite's exclusive locking mode for the whole
+run, so it refuses to start while any other connection has the database open,
+and nothing else can read or write it until the import finishes.
+
+    python -m services.bulk export --db spacetask.db --output dump/ [--gzip]
+    python -m services.bulk import --db staging.db --input dump/ [--tables users tasks]
+
+Exports contain password hashes; treat them like the database file itself.
+"""
+
+import argparse
+import gzip
+import json
+import operator
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional, TextIO
+
+from services.migrations import get_version, migrate
+
+# Exportable tables, in the order they must be imported (parents first)
+TABLES = ('users', 'tasks', 'task_submissions', 'transactions')
+
+MANIFEST = 'manifest.json'
+
+class BulkError(Exception):
+    """Raised when an export or import cannot proceed; the CLI reports it and exits 1"""
+    pass
+
+def _open(path: str, mode: str) -> TextIO:
+    """Open an NDJSON file for text I/O, gzip-compressed when the name ends in .gz"""
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8', compresslevel=6)
+    return open(path, mode, encoding='utf-8', buffering=1024 * 1024)
+
+def _columns(conn: sqlite3.Connection, table: str) -> List[str]:
+    """Column names of a table, in declaration order"""
+    return [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+
+def export_table(conn: sqlite3.Connection, table: str, out: TextIO, chunk_size: int = 10000) -> int:
+    """Write every row of a table to out as one JSON object per line, in id order; returns the row count"""
+    cursor = conn.execute(f'SELECT * FROM {table} ORDER BY id')
+    columns = [description[0] for description in cursor.description]
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':')).encode
+    count = 0
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            break
+        out.write(''.join(encode(dict(zip(columns, row))) + '\n' for row in rows))
+        count += len(rows)
+    return count
+
+def export_database(db_path: str, directory: str, tables: Iterable[str] = TABLES, compress: bool = False,
+                    chunk_size: int = 10000, progress: Callable[[str], None] = None) -> Dict:
+    """Export tables to directory from a single snapshot of the database; returns the manifest"""
+    if not os.path.exists(db_path):
+        raise BulkError(f'{db_path} does not exist')
+    os.makedirs(directory, exist_ok=True)
+    if os.path.exists(os.path.join(directory, MANIFEST)):
+        raise BulkError(f'{directory} already holds an export')
+    
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        conn.execute('PRAGMA busy_timeout = 5000')
+        # Writers carry on under WAL; this transaction keeps seeing the state at its first read
+        conn.execute('BEGIN')
+        manifest = {
+            'schema_version': get_version(conn),
+            'exported_at': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+            'tables': {}
+        }
+        for table in [table for table in TABLES if table in tables]:
+            filename = f'{table}.ndjson' + ('.gz' if compress else '')
+            started = time.perf_counter()
+            with _open(os.path.join(directory, filename), 'w') as out:
+                count = export_table(conn, table, out, chunk_size)
+            manifest['tables'][table] = {'file': filename, 'rows': count, 'columns': _columns(conn, table)}
+            if progress:
+                progress(f'{table}: exported {count} rows in {time.perf_counter() - started:.1f}s')
+        conn.execute('COMMIT')
+    finally:
+        conn.close()
+    
+    with open(os.path.join(directory, MANIFEST), 'w') as f:
+        json.dump(manifest, f, indent=2)
+        f.write('\n')
+    return manifest
+
+def _deferrable(conn: sqlite3.Connection, tables: Iterable[str]) -> List[tuple]:
+    """(type, name, sql) of the explicit indexes and the triggers on the given tables"""
+    tables = list(tables)
+    placeholders = ', '.join('?' for _ in tables)
+    return conn.execute(f'''
+        SELECT type, name, sql FROM sqlite_master
+        WHERE type IN ('index', 'trigger') AND sql IS NOT NULL AND tbl_name IN ({placeholders})
+        ORDER BY type, name
+    ''', tables).fetchall()
+
+def _rebuild(conn: sqlite3.Connection, deferred: List[tuple], spatial: bool):
+    """Recreate the dropped indexes and triggers, refilling tasks_rtree first when tasks were imported"""
+    conn.execute('BEGIN IMMEDIATE')
+    if spatial:
+        conn.execute('''
+            INSERT INTO tasks_rtree (id, min_lat, max_lat, min_lng, max_lng)
+            SELECT id, latitude, latitude, longitude, longitude
+            FROM tasks WHERE status = 'active'
+        ''')
+    for _, _, sql in deferred:
+        conn.execute(sql)
+    conn.execute('COMMIT')
+
+def import_table(conn: sqlite3.Connection, table: str, source: TextIO, batch_size: int = 5000,
+                 commit_every: int = 50) -> int:
+    """Insert the NDJSON rows from source into an empty table; returns the row count.
+    
+    Rows go in with executemany batches of batch_size, and the transaction is
+    committed every commit_every batches.
+    """
+    known = set(_columns(conn, table))
+    insert = columns = key = None
+    batch = []
+    count = batches = 0
+    
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for line_number, line in enumerate(source, 1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                raise BulkError(f'{table} line {line_number}: invalid JSON ({e})')
+            
+            # The first row fixes the column list for the whole file
+            if columns is None:
+                columns = list(row)
+                unknown = [column for column in columns if column not in known]
+                if unknown:
+                    raise BulkError(f'{table}: unknown columns {", ".join(unknown)}')
+                key = operator.itemgetter(*columns) if len(columns) > 1 else (lambda r: (r[columns[0]],))
+                insert = f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join("?" for _ in columns)})'
+            try:
+                batch.append(key(row))
+            except (KeyError, TypeError):
+                raise BulkError(f'{table} line {line_number}: expected the columns {", ".join(columns)}')
+            
+            if len(batch) >= batch_size:
+                conn.executemany(insert, batch)
+                count += len(batch)
+                batch.clear()
+                batches += 1
+                if batches % commit_every == 0:
+                    conn.execute('COMMIT')
+                    conn.execute('BEGIN IMMEDIATE')
+        
+        if batch:
+            conn.executemany(insert, batch)
+            count += len(batch)
+        conn.execute('COMMIT')
+    except sqlite3.Error as e:
+        conn.execute('ROLLBACK')
+        raise BulkError(f'{table}: {e}')
+    except Exception:
+        conn.execute('ROLLBACK')
+        raise
+    return count
+
+def import_database(db_path: str, directory: str, tables: Optional[Iterable[str]] = None, batch_size: int = 5000,
+                    commit_every: int = 50, progress: Callable[[str], None] = None) -> Dict[str, int]:
+    """Load an export into a database whose target tables are empty; returns rows imported per table"""
+    manifest_path = os.path.join(directory, MANIFEST)
+    if not os.path.exists(manifest_path):
+        raise BulkError(f'{directory} has no {MANIFEST} (missing or unfinished export)')
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    
+    tables = [table for table in TABLES if table in (tables or manifest['tables'])]
+    missing = [table for table in tables if table not in manifest['tables']]
+    if missing:
+        raise BulkError(f'the export does not include {", ".join(missing)}')
+    
+    conn = sqlite3.connect(db_path, isolation_level=None, timeout=1)
+    try:
+        # Hold the lock from here until close; this fails while the app has the database open
+        conn.execute('PRAGMA locking_mode = EXCLUSIVE')
+        try:
+            conn.execute('BEGIN EXCLUSIVE')
+            conn.execute('COMMIT')
+        except sqlite3.OperationalError as e:
+            raise BulkError(f'{db_path} is in use ({e}); stop the app and its workers before importing')
+        migrate(conn)
+        if manifest['schema_version'] > get_version(conn):
+            raise BulkError(f'the export is from schema version {manifest["schema_version"]}, '
+                            f'newer than this code ({get_version(conn)})')
+        for table in tables:
+            if conn.execute(f'SELECT 1 FROM {table} LIMIT 1').fetchone():
+                raise BulkError(f'{table} is not empty')
+        
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        # A larger page cache than the app's speeds up rebuilding the indexes
+        conn.execute('PRAGMA cache_size = -65536')
+        
+        deferred = _deferrable(conn, tables)
+        conn.execute('BEGIN IMMEDIATE')
+        for kind, name, _ in deferred:
+            conn.execute(f'DROP {kind.upper()} {name}')
+        conn.execute('COMMIT')
+        
+        counts = {}
+        failure = None
+        try:
+            for table in tables:
+                started = time.perf_counter()
+                with _open(os.path.join(directory, manifest['tables'][table]['file']), 'r') as source:
+                    counts[table] = import_table(conn, table, source, batch_size, commit_every)
+                if progress:
+                    progress(f'{table}: imported {counts[table]} rows in {time.perf_counter() - started:.1f}s')
+        except Exception as e:
+            failure = e
+            raise
+        finally:
+            # Rebuild what was dropped even when the import failed part way
+            started = time.perf_counter()
+            try:
+                _rebuild(conn, deferred, 'tasks' in tables)
+            except sqlite3.Error as e:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                message = (f'rebuilding indexes and triggers failed ({e}); '
+                           f'{", ".join(name for _, name, _ in deferred)} are missing')
+                if failure is None:
+                    raise BulkError(message) from e
+                # Keep the import error as the cause and report both
+                raise BulkError(f'{failure}; {message}') from failure
+            if progress:
+                progress(f'rebuilt {len(deferred)} indexes and triggers in {time.perf_counter() - started:.1f}s')
+        
+        conn.execute('PRAGMA optimize')
+        conn.execute('PRAGMA wal_checkpoint(TRUNCATE)')
+    finally:
+        conn.close()
+    return counts
+
+def main(argv: List[str] = None) -> int:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Bulk NDJSON export and import of SpaceTask data')
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    export = commands.add_parser('export', help='Write tables to a directory of NDJSON files')
+    export.add_argument('--output', required=True, help='Directory to write the export to')
+    export.add_argument('--gzip', action='store_true', help='Compress each file with gzip')
+    export.add_argument('--chunk-size', type=int, default=10000, help='Rows fetched per read')
+    
+    load = commands.add_parser('import', help='Load an export into empty tables')
+    load.add_argument('--input', required=True, help='Directory holding an export')
+    load.add_argument('--batch-size', type=int, default=5000, help='Rows per executemany call')
+    load.add_argument('--commit-every', type=int, default=50, help='Batches per transaction')
+    
+    for command in (export, load):
+        command.add_argument('--db', default=os.getenv('DATABASE_PATH', '/app/data/spacetask.db'),
+                             help='SQLite database path (default: $DATABASE_PATH)')
+        command.add_argument('--tables', nargs='+', choices=TABLES, help='Only these tables (default: all)')
+    args = parser.parse_args(argv)
+    
+    progress = lambda message: print(message, file=sys.stderr)
+    started = time.perf_counter()
+    try:
+        if args.command == 'export':
+            manifest = export_database(args.db, args.output, args.tables or TABLES, args.gzip,
+                                       args.chunk_size, progress)
+            total = sum(entry['rows'] for entry in manifest['tables'].values())
+        else:
+            directory = os.path.dirname(args.db)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            total = sum(import_database(args.db, args.input, args.tables, args.batch_size,
+                                        args.commit_every, progress).values())
+    except BulkError as e:
+        print(f'{args.command} failed: {e}', file=sys.stderr)
+        return 1
+    print(f'{args.command}ed {total} rows in {time.perf_counter() - started:.1f}s')
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
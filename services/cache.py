@@ -0,0 +1,179 @@
+import functools
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Set
+
+from flask import Response, make_response, request
+
+from services.events import events
+from services.metrics import metrics
+
+# Cache tags invalidated by each write event published by DatabaseService
+EVENT_TAGS: Dict[str, Callable[..., Iterable[str]]] = {
+    'task.created': lambda task_id, **_: ['tasks'],
+    'task.updated': lambda task_id, **_: ['tasks', f'task:{task_id}'],
+    'task.deleted': lambda task_id, **_: ['tasks', f'task:{task_id}'],
+    'submission.accepted': lambda task_id, **_: ['tasks', f'task:{task_id}', 'leaderboard'],
+    'user.created': lambda user_id, **_: ['leaderboard'],
+    'user.balance_changed': lambda user_id, **_: ['leaderboard'],
+}
+
+class CachedResponse:
+    """A stored response body with its validator.
+    
+    Only a strong ETag over the body: a Last-Modified of when the entry was
+    built has one-second resolution and would answer If-Modified-Since with 304
+    after a write in the same second.
+    """
+    
+    __slots__ = ('body', 'mimetype', 'etag', 'expires_at', 'tags')
+    
+    def __init__(self, body: bytes, mimetype: str, tags: Set[str], expires_at: float):
+        self.body = body
+        self.mimetype = mimetype
+        self.etag = hashlib.blake2b(body, digest_size=16).hexdigest()
+        self.expires_at = expires_at
+        self.tags = tags
+
+class ResponseCache:
+    """Per-process TTL + LRU cache of serialized GET responses, invalidated by tag.
+    
+    Writes made through this process invalidate matching entries immediately
+    (via the event bus). Other worker processes don't hear about them, so their
+    entries can serve data up to the TTL old; keep RESPONSE_CACHE_TTL short.
+    """
+    
+    def __init__(self, max_entries: int = None, ttl: float = None):
+        self.max_entries = max_entries if max_entries is not None else int(os.getenv('RESPONSE_CACHE_SIZE', 1000))
+        self.ttl = ttl if ttl is not None else float(os.getenv('RESPONSE_CACHE_TTL', 5))
+        self._lock = threading.Lock()
+        self._entries: 'OrderedDict[str, CachedResponse]' = OrderedDict()
+        self._tags: Dict[str, Set[str]] = {}
+        self._generation = 0
+        self.hits = 0
+        self.misses = 0
+    
+    @property
+    def generation(self) -> int:
+        """Counter bumped by every invalidation; see set()"""
+        return self._generation
+    
+    def get(self, key: str) -> Optional[CachedResponse]:
+        """Get a live entry and mark it recently used, or None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or time.monotonic() >= entry.expires_at:
+                if entry is not None:
+                    self._remove(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+    
+    def set(self, key: str, body: bytes, mimetype: str, tags: Iterable[str],
+            generation: int = None) -> CachedResponse:
+        """Store a response; returns the entry.
+        
+        If generation is given and an invalidation happened since it was read,
+        the entry is returned but not stored, so a response built from data
+        read before a write can never outlive that write.
+        """
+        entry = CachedResponse(body, mimetype, set(tags), time.monotonic() + self.ttl)
+        if self.max_entries <= 0 or self.ttl <= 0:
+            return entry
+        with self._lock:
+            if generation is not None and generation != self._generation:
+                return entry
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            for tag in entry.tags:
+                self._tags.setdefault(tag, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+        return entry
+    
+    def invalidate(self, *tags: str):
+        """Drop every entry carrying any of the given tags"""
+        with self._lock:
+            self._generation += 1
+            for tag in tags:
+                for key in list(self._tags.get(tag, ())):
+                    self._remove(key)
+    
+    def clear(self):
+        """Drop every entry"""
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._tags.clear()
+    
+    def on_event(self, topic: str, **fields: Any):
+        """Event bus subscriber mapping write events to tag invalidations"""
+        tags = EVENT_TAGS.get(topic)
+        if tags:
+            self.invalidate(*tags(**fields))
+    
+    def stats(self) -> Dict[str, Any]:
+        """Get cache size and hit statistics"""
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses
+            }
+    
+    def _remove(self, key: str):
+        """Remove one entry and its tag index references (lock held)"""
+        entry = self._entries.pop(key)
+        for tag in entry.tags:
+            keys = self._tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._tags[tag]
+
+# One response cache per process, shared by every blueprint
+response_cache = ResponseCache()
+events.subscribe(response_cache.on_event)
+
+def _collect_metrics():
+    """Response cache samples for this process"""
+    stats = response_cache.stats()
+    yield 'cache_lookups_total', {'cache': 'response', 'result': 'hit'}, stats['hits']
+    yield 'cache_lookups_total', {'cache': 'response', 'result': 'miss'}, stats['misses']
+    yield 'cache_entries', {'cache': 'response'}, stats['entries']
+
+metrics.register_collector(_collect_metrics)
+
+def cached_response(tags: Callable[..., Iterable[str]]):
+    """Cache a public GET view's 200 responses and answer conditional requests.
+    
+    tags(**view_kwargs) names what the response depends on (see EVENT_TAGS).
+    Every response carries a strong ETag; If-None-Match gets a 304 without
+    re-running the view when cached.
+    """
+    def decorator(view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            key = request.full_path
+            entry = response_cache.get(key)
+            if entry is None:
+                generation = response_cache.generation
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+                entry = response_cache.set(key, response.get_data(), response.mimetype,
+                                           tags(**kwargs), generation)
+            
+            response = Response(entry.body, mimetype=entry.mimetype)
+            response.set_etag(entry.etag)
+            # Clients may keep the body but must revalidate, which is a cheap 304
+            response.headers['Cache-Control'] = 'no-cache'
+            return response.make_conditional(request)
+        return wrapper
+    return decorator
@@ -0,0 +1,57 @@
+import os
+from functools import cached_property
+
+from flask import current_app
+from werkzeug.local import LocalProxy
+
+from services.auth import AuthService
+from services.database import DatabaseService
+
+class ServiceContainer:
+    """Application-scoped services, created once per app by create_app.
+    
+    Every service is built on first use, so importing the app opens no database
+    connections and loads neither Pillow nor bcrypt.
+    """
+    
+    @cached_property
+    def db(self) -> DatabaseService:
+        return DatabaseService()
+    
+    @cached_property
+    def auth(self) -> AuthService:
+        return AuthService(os.getenv('JWT_SECRET', 'your-secret-key'))
+    
+    @cached_property
+    def uploads(self):
+        from services.upload import UploadService
+        return UploadService(os.getenv('UPLOAD_FOLDER', 'uploads'),
+                             int(os.getenv('MAX_FILE_SIZE', 5 * 1024 * 1024)))
+    
+    @cached_property
+    def notifications(self):
+        from services.notifications import NotificationQueue
+        return NotificationQueue(self.db)
+    
+    @cached_property
+    def event_log(self):
+        from services.sse import EventLog
+        return EventLog(self.db)
+    
+    def collect_metrics(self):
+        """JWT cache samples, once the auth service exists"""
+        auth = self.__dict__.get('auth')
+        stats = auth.token_cache_stats() if auth is not None else None
+        if stats:
+            yield 'cache_lookups_total', {'cache': 'jwt', 'result': 'hit'}, stats['hits']
+            yield 'cache_lookups_total', {'cache': 'jwt', 'result': 'miss'}, stats['misses']
+            yield 'cache_entries', {'cache': 'jwt'}, stats['size']
+
+def current_services() -> ServiceContainer:
+    """Get the container of the app handling the current request"""
+    return current_app.extensions['services']
+
+# Proxies for blueprints; they resolve to the current app's services on each use
+db: DatabaseService = LocalProxy(lambda: current_services().db)
+auth_service: AuthService = LocalProxy(lambda: current_services().auth)
+upload_service = LocalProxy(lambda: current_services().uploads)
@@ -1,9 +1,242 @@
 import sqlite3
 import os
+import heapq
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from contextlib import contextmanager
 from datetime import datetime
-from typing import Optional, List, Dict, Any
+from typing import Callable, Optional, List, Dict, Any, Tuple
 import json
 
+from services import ledger
+from services.events import events
+from services.geo import bounding_boxes, haversine_km
+from services.metrics import metrics, timed_methods
+from services.querylog import connection_factory
+from services.migrations import migrate
+from services.pagination import paginate
+from services.writer import WriteAborted, WriteQueue
+
+class ConnectionPool:
+    """Bounded, thread-safe pool of long-lived SQLite connections.
+    
+    Connections are opened lazily (once per worker process) and reused across
+    requests so the per-connection statement cache and page cache survive.
+    """
+    
+    def __init__(self, db_path: str, max_size: int = None, timeout: float = None):
+        self.db_path = db_path
+        self.max_size = max_size or int(os.getenv('DB_POOL_SIZE', 8))
+        self.timeout = timeout if timeout is not None else float(os.getenv('DB_POOL_TIMEOUT', 30))
+        self.busy_timeout_ms = int(os.getenv('DB_BUSY_TIMEOUT_MS', 5000))
+        self.cache_size_kb = int(os.getenv('DB_CACHE_SIZE_KB', 20000))
+        self.mmap_size = int(os.getenv('DB_MMAP_SIZE', 256 * 1024 * 1024))
+        self._lock = threading.Lock()
+        self._reset()
+    
+    def _reset(self):
+        """Forget every connection; used at startup and after a fork"""
+        self._pid = os.getpid()
+        self._idle = queue.LifoQueue()
+        self._open = 0
+        self._in_use = 0
+        self.checkouts = 0
+        self.waits = 0
+    
+    def connect(self) -> sqlite3.Connection:
+        """Open a new, unpooled connection and apply the tuned PRAGMAs"""
+        conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout_ms / 1000,
+                               check_same_thread=False, factory=connection_factory())
+        conn.row_factory = sqlite3.Row  # Enable dict-like access
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA cache_size = -{self.cache_size_kb}')
+        conn.execute(f'PRAGMA mmap_size = {self.mmap_size}')
+        conn.execute(f'PRAGMA busy_timeout = {self.busy_timeout_ms}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+        return conn
+    
+    def acquire(self) -> sqlite3.Connection:
+        """Check out a connection, opening one if the pool is not yet full"""
+        with self._lock:
+            # Connections must never cross a fork; start over in the child
+            if self._pid != os.getpid():
+                self._reset()
+            self.checkouts += 1
+            self._in_use += 1
+        
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            pass
+        
+        with self._lock:
+            can_open = self._open < self.max_size
+            if can_open:
+                self._open += 1
+            else:
+                self.waits += 1
+        
+        try:
+            if can_open:
+                try:
+                    return self.connect()
+                except Exception:
+                    with self._lock:
+                        self._open -= 1
+                    raise
+            try:
+                return self._idle.get(timeout=self.timeout)
+            except queue.Empty:
+                raise sqlite3.OperationalError('Timed out waiting for a database connection')
+        except Exception:
+            with self._lock:
+                self._in_use -= 1
+            raise
+    
+    def release(self, conn: sqlite3.Connection):
+        """Return a connection to the pool, discarding any open transaction"""
+        with self._lock:
+            if self._pid != os.getpid():
+                return
+            self._in_use -= 1
+        
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # Broken connection; drop it so a fresh one gets opened
+            with self._lock:
+                self._open -= 1
+            conn.close()
+            return
+        self._idle.put(conn)
+    
+    @contextmanager
+    def connection(self):
+        """Context manager that checks a connection out and back in"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+    
+    def stats(self) -> Dict[str, Any]:
+        """Pool counters used for sizing"""
+        with self._lock:
+            return {
+                'max_size': self.max_size,
+                'open_connections': self._open,
+                'in_use': self._in_use,
+                'idle': self._idle.qsize(),
+                'checkouts': self.checkouts,
+                'waits': self.waits
+            }
+    
+    def close(self):
+        """Close every idle connection"""
+        with self._lock:
+            while True:
+                try:
+                    conn = self._idle.get_nowait()
+                except queue.Empty:
+                    break
+                conn.close()
+                self._open -= 1
+
+class LeaderboardCache:
+    """In-memory copy of the top of the leaderboard.
+    
+    Invalidated by every balance change made through this process; the TTL bounds
+    staleness from writes made by other worker processes.
+    """
+    
+    def __init__(self, size: int = 100, ttl: float = None):
+        self.size = size
+        self.ttl = ttl if ttl is not None else float(os.getenv('LEADERBOARD_CACHE_TTL', 30))
+        self._lock = threading.Lock()
+        self._rows = None
+        self._expires_at = 0.0
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, limit: int) -> Optional[List[Dict[str, Any]]]:
+        """Get the top `limit` rows, or None on a miss"""
+        with self._lock:
+            if self._rows is None or limit > self.size or time.monotonic() >= self._expires_at:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return [dict(row) for row in self._rows[:limit]]
+    
+    def set(self, rows: List[Dict[str, Any]]):
+        """Store a fresh top-N snapshot"""
+        with self._lock:
+            self._rows = rows
+            self._expires_at = time.monotonic() + self.ttl
+    
+    def invalidate(self):
+        """Drop the snapshot after a balance or completion count changed"""
+        with self._lock:
+            self._rows = None
+
+# One pool and leaderboard cache per database file per process, shared by every DatabaseService
+_pools: Dict[str, ConnectionPool] = {}
+_leaderboards: Dict[str, LeaderboardCache] = {}
+_writers: Dict[str, WriteQueue] = {}
+_pools_lock = threading.Lock()
+
+def get_pool(db_path: str) -> ConnectionPool:
+    """Get (or lazily create) the connection pool for a database file"""
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = _pools[db_path] = ConnectionPool(db_path)
+        return pool
+
+def get_write_queue(db_path: str) -> WriteQueue:
+    """Get (or lazily create) the single-writer queue for a database file"""
+    pool = get_pool(db_path)
+    with _pools_lock:
+        writer = _writers.get(db_path)
+        if writer is None:
+            writer = _writers[db_path] = WriteQueue(pool)
+        return writer
+
+def get_leaderboard_cache(db_path: str) -> LeaderboardCache:
+    """Get (or lazily create) the leaderboard cache for a database file"""
+    with _pools_lock:
+        cache = _leaderboards.get(db_path)
+        if cache is None:
+            cache = _leaderboards[db_path] = LeaderboardCache()
+        return cache
+
+def _collect_metrics():
+    """Pool, write queue and leaderboard cache samples for every database file in this process"""
+    with _pools_lock:
+        pools, writers, leaderboards = dict(_pools), dict(_writers), dict(_leaderboards)
+    for db_path, pool in pools.items():
+        stats = pool.stats()
+        database = os.path.basename(db_path)
+        yield 'db_pool_connections', {'database': database, 'state': 'in_use'}, stats['in_use']
+        yield 'db_pool_connections', {'database': database, 'state': 'idle'}, stats['idle']
+        yield 'db_pool_checkouts_total', {'database': database}, stats['checkouts']
+        yield 'db_pool_waits_total', {'database': database}, stats['waits']
+    for db_path, writer in writers.items():
+        stats = writer.stats()
+        database = os.path.basename(db_path)
+        yield 'db_write_queue_depth', {'database': database}, stats['queued']
+        yield 'db_write_batches_total', {'database': database}, stats['batches']
+        yield 'db_write_jobs_total', {'database': database}, stats['jobs']
+    for cache in leaderboards.values():
+        yield 'cache_lookups_total', {'cache': 'leaderboard', 'result': 'hit'}, cache.hits
+        yield 'cache_lookups_total', {'cache': 'leaderboard', 'result': 'miss'}, cache.misses
+
+metrics.register_collector(_collect_metrics)
+
+@timed_methods('db_method_duration_seconds', exclude=('connection', 'write', 'pool_stats', 'write_stats'))
 class DatabaseService:
     def __init__(self, db_path: str = None):
         if db_path is None:
@@ -14,111 +247,42 @@ class DatabaseService:
         # Ensure the directory exists
         os.makedirs(os.path.dirname(self.db_path), exist_ok=True)
         
-        self.init_database()
+        self.pool = get_pool(self.db_path)
+        self.writer = get_write_queue(self.db_path)
+        self.leaderboard_cache = get_leaderboard_cache(self.db_path)
     
-    def get_connection(self):
-        """Get database connection"""
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row  # Enable dict-like access
-        return conn
+    def connection(self):
+        """Check out a pooled database connection (use as a context manager)"""
+        return self.pool.connection()
+    
+    def pool_stats(self) -> Dict[str, Any]:
+        """Get connection pool statistics"""
+        return self.pool.stats()
+    
+    def write(self, job: Callable[[sqlite3.Cursor], Any]) -> Any:
+        """Run a write job on the single-writer queue and return its result once committed"""
+        return self.writer.run(job)
+    
+    def write_stats(self) -> Dict[str, Any]:
+        """Get write queue batching statistics"""
+        return self.writer.stats()
     
-    def init_database(self):
-        """Initialize database with all required tables"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Users table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS users (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                username TEXT UNIQUE NOT NULL,
-                email TEXT UNIQUE NOT NULL,
-                password_hash TEXT NOT NULL,
-                coin_balance INTEGER DEFAULT 200,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        # Tasks table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS tasks (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                creator_id INTEGER NOT NULL,
-                title TEXT NOT NULL,
-                description TEXT NOT NULL,
-                label TEXT,
-                completion_criteria TEXT NOT NULL,
-                bounty_amount INTEGER NOT NULL,
-                latitude REAL NOT NULL,
-                longitude REAL NOT NULL,
-                location_name TEXT,
-                status TEXT DEFAULT 'active',
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (creator_id) REFERENCES users (id)
-            )
-        ''')
-        
-        # Task submissions table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS task_submissions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                task_id INTEGER NOT NULL,
-                submitter_id INTEGER NOT NULL,
-                image_url TEXT NOT NULL,
-                note TEXT,
-                status TEXT DEFAULT 'pending',
-                submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                reviewed_at TIMESTAMP,
-                FOREIGN KEY (task_id) REFERENCES tasks (id),
-                FOREIGN KEY (submitter_id) REFERENCES users (id)
-            )
-        ''')
-        
-        # Notifications table
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS notifications (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id INTEGER NOT NULL,
-                device_token TEXT,
-                platform TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (user_id) REFERENCES users (id)
-            )
-        ''')
-        
-        # Transactions table for coin transfers
-        cursor.execute('''
-            CREATE TABLE IF NOT EXISTS transactions (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                from_user_id INTEGER,
-                to_user_id INTEGER NOT NULL,
-                amount INTEGER NOT NULL,
-                transaction_type TEXT NOT NULL,
-                task_id INTEGER,
-                description TEXT,
-                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                FOREIGN KEY (from_user_id) REFERENCES users (id),
-                FOREIGN KEY (to_user_id) REFERENCES users (id),
-                FOREIGN KEY (task_id) REFERENCES tasks (id)
-            )
-        ''')
-        
-        conn.commit()
-        conn.close()
+    def init_database(self) -> int:
+        """Bring the schema up to date; returns the resulting schema version"""
+        with self.connection() as conn:
+            return migrate(conn)
     
     # User operations
     def create_user(self, username: str, email: str, password_hash: str) -> Optional[int]:
         """Create a new user with 200 starting coins"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            cursor.execute('''
-                INSERT INTO users (username, email, password_hash, coin_balance)
-                VALUES (?, ?, ?, 200)
-            ''', (username, email, password_hash))
+        def write(cursor):
+            try:
+                cursor.execute('''
+                    INSERT INTO users (username, email, password_hash, coin_balance)
+                    VALUES (?, ?, ?, 200)
+                ''', (username, email, password_hash))
+            except sqlite3.IntegrityError:
+                raise WriteAborted(None)
             user_id = cursor.lastrowid
             
             # Record initial coin grant
@@ -126,113 +290,204 @@ class DatabaseService:
                 INSERT INTO transactions (to_user_id, amount, transaction_type, description)
                 VALUES (?, 200, 'signup_bonus', 'Initial signup bonus')
             ''', (user_id,))
-            
-            conn.commit()
             return user_id
-        except sqlite3.IntegrityError:
-            return None
-        finally:
-            conn.close()
+        
+        user_id = self.write(write)
+        if user_id is not None:
+            self.leaderboard_cache.invalidate()
+            events.publish('user.created', user_id=user_id)
+        return user_id
     
     def get_user_by_email(self, email: str) -> Optional[Dict[str, Any]]:
         """Get user by email"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
-        user = cursor.fetchone()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT * FROM users WHERE email = ?', (email,))
+            user = cursor.fetchone()
         
         return dict(user) if user else None
     
     def get_user_by_id(self, user_id: int) -> Optional[Dict[str, Any]]:
         """Get user by ID"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
-        user = cursor.fetchone()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT * FROM users WHERE id = ?', (user_id,))
+            user = cursor.fetchone()
         
         return dict(user) if user else None
     
+    def update_user_password_hash(self, user_id: int, password_hash: str) -> bool:
+        """Replace a user's password hash (used to upgrade the bcrypt cost)"""
+        def write(cursor):
+            cursor.execute('''
+                UPDATE users SET password_hash = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (password_hash, user_id))
+            return cursor.rowcount > 0
+        
+        return self.write(write)
+    
     def update_user_balance(self, user_id: int, new_balance: int) -> bool:
         """Update user's coin balance"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            UPDATE users SET coin_balance = ?, updated_at = CURRENT_TIMESTAMP
-            WHERE id = ?
-        ''', (new_balance, user_id))
+        def write(cursor):
+            cursor.execute('''
+                UPDATE users SET coin_balance = ?, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (new_balance, user_id))
+            return cursor.rowcount > 0
         
-        success = cursor.rowcount > 0
-        conn.commit()
-        conn.close()
+        success = self.write(write)
+        self.leaderboard_cache.invalidate()
+        events.publish('user.balance_changed', user_id=user_id)
         return success
     
     # Task operations
     def create_task(self, creator_id: int, title: str, description: str, label: str,
                    completion_criteria: str, bounty_amount: int, latitude: float,
                    longitude: float, location_name: str = None) -> Optional[int]:
-        """Create a new task"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO tasks (creator_id, title, description, label, completion_criteria,
-                             bounty_amount, latitude, longitude, location_name)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (creator_id, title, description, label, completion_criteria,
-              bounty_amount, latitude, longitude, location_name))
-        
-        task_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        """Create a new task, moving its bounty from the creator into escrow.
+        
+        Returns None if the creator cannot cover the bounty.
+        """
+        def write(cursor):
+            if not ledger.debit(cursor, creator_id, bounty_amount):
+                raise WriteAborted(None)
+            
+            cursor.execute('''
+                INSERT INTO tasks (creator_id, title, description, label, completion_criteria,
+                                 bounty_amount, escrow_amount, latitude, longitude, location_name)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', (creator_id, title, description, label, completion_criteria,
+                  bounty_amount, bounty_amount, latitude, longitude, location_name))
+            task_id = cursor.lastrowid
+            
+            ledger.record(cursor, [(creator_id, creator_id, bounty_amount, 'bounty_escrow', task_id,
+                                    'Task bounty held in escrow')])
+            return task_id
+        
+        task_id = self.write(write)
+        if task_id is None:
+            return None
+        
+        self.leaderboard_cache.invalidate()
+        events.publish('user.balance_changed', user_id=creator_id)
+        events.publish('task.created', task_id=task_id, creator_id=creator_id,
+                       latitude=latitude, longitude=longitude)
         return task_id
     
-    def get_tasks(self, limit: int = 50, offset: int = 0, status: str = 'active') -> List[Dict[str, Any]]:
-        """Get list of tasks"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    
+    def create_tasks(self, creator_id: int, tasks: List[Dict[str, Any]]) -> Optional[List[int]]:
+        """Create several tasks in one transaction; returns their IDs in order.
+        
+        The combined bounty is moved into escrow with one conditional debit, under
+        the same write lock as the inserts. Returns None if it is insufficient.
+        """
+        total_bounty = sum(task['bounty_amount'] for task in tasks)
+        rows = [(creator_id, task['title'], task['description'], task.get('label', ''),
+                 task['completion_criteria'], task['bounty_amount'], task['bounty_amount'],
+                 task['latitude'], task['longitude'], task.get('location_name')) for task in tasks]
         
-        cursor.execute('''
-            SELECT t.*, u.username as creator_username
-            FROM tasks t
-            JOIN users u ON t.creator_id = u.id
-            WHERE t.status = ?
-            ORDER BY t.created_at DESC
-            LIMIT ? OFFSET ?
-        ''', (status, limit, offset))
+        def write(cursor):
+            if not ledger.debit(cursor, creator_id, total_bounty):
+                raise WriteAborted(None)
+            
+            cursor.executemany('''
+                INSERT INTO tasks (creator_id, title, description, label, completion_criteria,
+                                 bounty_amount, escrow_amount, latitude, longitude, location_name)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            
+            # AUTOINCREMENT IDs are consecutive while this transaction holds the write lock
+            cursor.execute('SELECT last_insert_rowid()')
+            last_id = cursor.fetchone()[0]
+            task_ids = list(range(last_id - len(rows) + 1, last_id + 1))
+            
+            ledger.record(cursor, [(creator_id, creator_id, task['bounty_amount'], 'bounty_escrow', task_id,
+                                    'Task bounty held in escrow') for task, task_id in zip(tasks, task_ids)])
+            return task_ids
+        
+        task_ids = self.write(write)
+        if task_ids is None:
+            return None
+        
+        self.leaderboard_cache.invalidate()
+        events.publish('user.balance_changed', user_id=creator_id)
+        for task, task_id in zip(tasks, task_ids):
+            events.publish('task.created', task_id=task_id, creator_id=creator_id,
+                           latitude=task['latitude'], longitude=task['longitude'])
+        return task_ids
+    
+    
+    def get_tasks(self, limit: int = 50, after: tuple = None,
+                  status: str = 'active') -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Get one page of tasks, newest first, and the cursor for the next page"""
+        where = 't.status = ?'
+        params = [status]
+        if after:
+            where += ' AND (t.created_at, t.id) < (?, ?)'
+            params.extend(after)
         
-        tasks = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return tasks
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(f'''
+                SELECT t.*, u.username as creator_username
+                FROM tasks t
+                JOIN users u ON t.creator_id = u.id
+                WHERE {where}
+                ORDER BY t.created_at DESC, t.id DESC
+                LIMIT ?
+            ''', (*params, limit + 1))
+            
+            tasks = [dict(row) for row in cursor.fetchall()]
+        return paginate(tasks, limit, 'created_at')
     
     def get_task_by_id(self, task_id: int) -> Optional[Dict[str, Any]]:
         """Get task by ID"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT t.*, u.username as creator_username
-            FROM tasks t
-            JOIN users u ON t.creator_id = u.id
-            WHERE t.id = ?
-        ''', (task_id,))
-        
-        task = cursor.fetchone()
-        conn.close()
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT t.*, u.username as creator_username
+                FROM tasks t
+                JOIN users u ON t.creator_id = u.id
+                WHERE t.id = ?
+            ''', (task_id,))
+            
+            task = cursor.fetchone()
         return dict(task) if task else None
     
+    def get_tasks_by_ids(self, task_ids: List[int]) -> List[Dict[str, Any]]:
+        """Get several tasks by ID with one query, in the order requested; unknown IDs are skipped"""
+        if not task_ids:
+            return []
+        
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            placeholders = ', '.join('?' * len(task_ids))
+            cursor.execute(f'''
+                SELECT t.*, u.username as creator_username
+                FROM tasks t
+                JOIN users u ON t.creator_id = u.id
+                WHERE t.id IN ({placeholders})
+            ''', task_ids)
+            
+            tasks = {row['id']: dict(row) for row in cursor.fetchall()}
+        return [tasks[task_id] for task_id in dict.fromkeys(task_ids) if task_id in tasks]
+    
     def update_task(self, task_id: int, **kwargs) -> bool:
-        """Update task fields"""
+        """Update task fields.
+        
+        Changing the bounty of an active escrowed task tops up or refunds the
+        escrow in the same transaction; returns False if the creator cannot cover
+        an increase.
+        """
         if not kwargs:
             return False
         
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
         # Build dynamic update query
         fields = []
         values = []
@@ -242,252 +497,577 @@ class DatabaseService:
                 values.append(value)
         
         if not fields:
-            conn.close()
             return False
         
         fields.append("updated_at = CURRENT_TIMESTAMP")
-        values.append(task_id)
         
-        query = f"UPDATE tasks SET {', '.join(fields)} WHERE id = ?"
-        cursor.execute(query, values)
+        def write(cursor):
+            balance_changed = None
+            if 'bounty_amount' in kwargs:
+                cursor.execute('SELECT creator_id, escrow_amount, status FROM tasks WHERE id = ?', (task_id,))
+                task = cursor.fetchone()
+                
+                # Tasks created before escrow existed (escrow_amount 0) still pay from the balance on accept
+                if task and task['status'] == 'active' and task['escrow_amount'] > 0:
+                    difference = kwargs['bounty_amount'] - task['escrow_amount']
+                    if difference > 0 and not ledger.debit(cursor, task['creator_id'], difference):
+                        raise WriteAborted((False, None))
+                    if difference < 0:
+                        ledger.credit(cursor, task['creator_id'], -difference)
+                    if difference:
+                        transaction_type = 'bounty_escrow' if difference > 0 else 'bounty_refund'
+                        ledger.record(cursor, [(task['creator_id'], task['creator_id'], abs(difference),
+                                                transaction_type, task_id, 'Task bounty changed')])
+                        balance_changed = task['creator_id']
+                    fields.append("escrow_amount = ?")
+                    values.append(kwargs['bounty_amount'])
+            
+            values.append(task_id)
+            query = f"UPDATE tasks SET {', '.join(fields)} WHERE id = ?"
+            cursor.execute(query, values)
+            return cursor.rowcount > 0, balance_changed
         
-        success = cursor.rowcount > 0
-        conn.commit()
-        conn.close()
+        success, balance_changed = self.write(write)
+        if balance_changed:
+            self.leaderboard_cache.invalidate()
+            events.publish('user.balance_changed', user_id=balance_changed)
+        if success:
+            events.publish('task.updated', task_id=task_id)
         return success
     
+    
     def delete_task(self, task_id: int) -> bool:
-        """Delete task (only if no submissions)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Check if task has submissions
-        cursor.execute('SELECT COUNT(*) FROM task_submissions WHERE task_id = ?', (task_id,))
-        submission_count = cursor.fetchone()[0]
-        
-        if submission_count > 0:
-            conn.close()
-            return False
+        """Delete task (only if no submissions), refunding any escrowed bounty"""
+        def write(cursor):
+            # Check if task has submissions
+            cursor.execute('SELECT COUNT(*) FROM task_submissions WHERE task_id = ?', (task_id,))
+            submission_count = cursor.fetchone()[0]
+            
+            if submission_count > 0:
+                raise WriteAborted((None, False))
+            
+            cursor.execute('''
+                DELETE FROM tasks WHERE id = ?
+                RETURNING creator_id, escrow_amount, status
+            ''', (task_id,))
+            task = cursor.fetchone()
+            
+            refunded = bool(task) and task['status'] == 'active' and task['escrow_amount'] > 0
+            if refunded:
+                ledger.credit(cursor, task['creator_id'], task['escrow_amount'])
+                ledger.record(cursor, [(task['creator_id'], task['creator_id'], task['escrow_amount'],
+                                        'bounty_refund', task_id, 'Task deleted, bounty refunded')])
+            return (dict(task) if task else None), refunded
         
-        cursor.execute('DELETE FROM tasks WHERE id = ?', (task_id,))
-        success = cursor.rowcount > 0
-        conn.commit()
-        conn.close()
-        return success
+        task, refunded = self.write(write)
+        if refunded:
+            self.leaderboard_cache.invalidate()
+            events.publish('user.balance_changed', user_id=task['creator_id'])
+        if task:
+            events.publish('task.deleted', task_id=task_id)
+        return task is not None
     
     # Task submission operations
+    
     def create_submission(self, task_id: int, submitter_id: int, image_url: str, note: str = None) -> Optional[int]:
         """Create a task submission"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            INSERT INTO task_submissions (task_id, submitter_id, image_url, note)
-            VALUES (?, ?, ?, ?)
-        ''', (task_id, submitter_id, image_url, note))
+        def write(cursor):
+            cursor.execute('''
+                INSERT INTO task_submissions (task_id, submitter_id, image_url, note)
+                VALUES (?, ?, ?, ?)
+            ''', (task_id, submitter_id, image_url, note))
+            submission_id = cursor.lastrowid
+            
+            cursor.execute('SELECT creator_id FROM tasks WHERE id = ?', (task_id,))
+            task = cursor.fetchone()
+            return submission_id, task['creator_id'] if task else None
         
-        submission_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
+        submission_id, creator_id = self.write(write)
+        events.publish('submission.created', submission_id=submission_id, task_id=task_id,
+                       submitter_id=submitter_id, creator_id=creator_id)
         return submission_id
     
-    def get_task_submissions(self, task_id: int) -> List[Dict[str, Any]]:
-        """Get all submissions for a task"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+    def get_task_submissions(self, task_id: int, limit: int = 50,
+                             after: tuple = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Get one page of submissions for a task, newest first, and the next cursor"""
+        where = 'ts.task_id = ?'
+        params = [task_id]
+        if after:
+            where += ' AND (ts.submitted_at, ts.id) < (?, ?)'
+            params.extend(after)
         
-        cursor.execute('''
-            SELECT ts.*, u.username as submitter_username
-            FROM task_submissions ts
-            JOIN users u ON ts.submitter_id = u.id
-            WHERE ts.task_id = ?
-            ORDER BY ts.submitted_at DESC
-        ''', (task_id,))
-        
-        submissions = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return submissions
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(f'''
+                SELECT ts.*, u.username as submitter_username
+                FROM task_submissions ts
+                JOIN users u ON ts.submitter_id = u.id
+                WHERE {where}
+                ORDER BY ts.submitted_at DESC, ts.id DESC
+                LIMIT ?
+            ''', (*params, limit + 1))
+            
+            submissions = [dict(row) for row in cursor.fetchall()]
+        return paginate(submissions, limit, 'submitted_at')
     
     def get_submission_by_id(self, submission_id: int) -> Optional[Dict[str, Any]]:
         """Get submission by ID"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        cursor.execute('''
-            SELECT ts.*, u.username as submitter_username, t.creator_id, t.bounty_amount
-            FROM task_submissions ts
-            JOIN users u ON ts.submitter_id = u.id
-            JOIN tasks t ON ts.task_id = t.id
-            WHERE ts.id = ?
-        ''', (submission_id,))
-        
-        submission = cursor.fetchone()
-        conn.close()
-        return dict(submission) if submission else None
-    
-    def accept_submission(self, submission_id: int) -> bool:
-        """Accept a submission and transfer coins"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        try:
-            # Get submission details
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
             cursor.execute('''
-                SELECT ts.*, t.creator_id, t.bounty_amount
+                SELECT ts.*, u.username as submitter_username, t.creator_id, t.bounty_amount
                 FROM task_submissions ts
+                JOIN users u ON ts.submitter_id = u.id
                 JOIN tasks t ON ts.task_id = t.id
-                WHERE ts.id = ? AND ts.status = 'pending'
+                WHERE ts.id = ?
             ''', (submission_id,))
             
             submission = cursor.fetchone()
-            if not submission:
-                conn.close()
-                return False
-            
-            # Get current balances
-            cursor.execute('SELECT coin_balance FROM users WHERE id = ?', (submission['creator_id'],))
-            creator_balance = cursor.fetchone()[0]
-            
-            cursor.execute('SELECT coin_balance FROM users WHERE id = ?', (submission['submitter_id'],))
-            submitter_balance = cursor.fetchone()[0]
+        return dict(submission) if submission else None
+    
+    def accept_submission(self, submission_id: int, task_id: int = None) -> bool:
+        """Accept a pending submission on an active task and pay the submitter.
+        
+        The bounty comes out of the task's escrow. Tasks created before escrow
+        existed are paid with a conditional debit from the creator's balance.
+        Everything runs under one write lock with single-statement updates, so
+        concurrent accepts cannot lose coins or accept two submissions for the
+        same task. Pass task_id to also require the submission to belong to it.
+        """
+        def write(cursor):
+            # Claim the submission
+            cursor.execute('''
+                UPDATE task_submissions SET status = 'accepted', reviewed_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'pending'
+                RETURNING task_id, submitter_id
+            ''', (submission_id,))
+            submission = cursor.fetchone()
+            if not submission or (task_id is not None and submission['task_id'] != task_id):
+                raise WriteAborted(None)
             
-            # Check if creator has enough coins
-            if creator_balance < submission['bounty_amount']:
-                conn.close()
-                return False
+            # Close the task; only one accept per task can get past this
+            cursor.execute('''
+                UPDATE tasks SET status = 'completed', updated_at = CURRENT_TIMESTAMP
+                WHERE id = ? AND status = 'active'
+                RETURNING creator_id, bounty_amount, escrow_amount
+            ''', (submission['task_id'],))
+            task = cursor.fetchone()
+            if not task:
+                raise WriteAborted(None)
             
-            # Transfer coins
-            new_creator_balance = creator_balance - submission['bounty_amount']
-            new_submitter_balance = submitter_balance + submission['bounty_amount'] + 10  # 10 base coins
+            # Cover any part of the bounty not held in escrow (all of it for legacy tasks)
+            shortfall = task['bounty_amount'] - task['escrow_amount']
+            if shortfall > 0 and not ledger.debit(cursor, task['creator_id'], shortfall):
+                raise WriteAborted(None)
+            if shortfall < 0:
+                ledger.credit(cursor, task['creator_id'], -shortfall)
             
-            cursor.execute('UPDATE users SET coin_balance = ? WHERE id = ?', 
-                         (new_creator_balance, submission['creator_id']))
-            cursor.execute('UPDATE users SET coin_balance = ? WHERE id = ?', 
-                         (new_submitter_balance, submission['submitter_id']))
+            ledger.credit(cursor, submission['submitter_id'], task['bounty_amount'] + ledger.COMPLETION_REWARD,
+                          completed_tasks=1)
+            ledger.record(cursor, [
+                (task['creator_id'], submission['submitter_id'], task['bounty_amount'], 'task_bounty',
+                 submission['task_id'], 'Task bounty payment'),
+                (None, submission['submitter_id'], ledger.COMPLETION_REWARD, 'task_completion',
+                 submission['task_id'], 'Base task completion reward')
+            ])
+            return submission['task_id'], submission['submitter_id'], task['creator_id'], shortfall != 0
+        
+        try:
+            accepted = self.write(write)
+        except Exception:
+            return False
+        if not accepted:
+            return False
+        
+        accepted_task_id, submitter_id, creator_id, creator_charged = accepted
+        self.leaderboard_cache.invalidate()
+        events.publish('submission.accepted', submission_id=submission_id,
+                       task_id=accepted_task_id, creator_id=creator_id,
+                       submitter_id=submitter_id)
+        events.publish('user.balance_changed', user_id=submitter_id)
+        if creator_charged:
+            events.publish('user.balance_changed', user_id=creator_id)
+        return True
+    
+    # Upload operations
+    
+    def create_upload(self, upload_id: str, user_id: int) -> bool:
+        """Record an upload that is waiting to be processed"""
+        def write(cursor):
+            cursor.execute('''
+                INSERT INTO uploads (id, user_id, status) VALUES (?, ?, 'processing')
+            ''', (upload_id, user_id))
+            return True
+        
+        return self.write(write)
+    
+    def get_upload(self, upload_id: str) -> Optional[Dict[str, Any]]:
+        """Get upload status by ID"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
             
-            # Update submission status
+            cursor.execute('SELECT * FROM uploads WHERE id = ?', (upload_id,))
+            upload = cursor.fetchone()
+        return dict(upload) if upload else None
+    
+    def update_upload_status(self, upload_id: str, status: str, filename: str = None, error: str = None) -> bool:
+        """Mark an upload as ready (with its processed filename) or failed"""
+        def write(cursor):
             cursor.execute('''
-                UPDATE task_submissions SET status = 'accepted', reviewed_at = CURRENT_TIMESTAMP
+                UPDATE uploads SET status = ?, filename = ?, error = ?, updated_at = CURRENT_TIMESTAMP
                 WHERE id = ?
-            ''', (submission_id,))
-            
-            # Update task status
-            cursor.execute('UPDATE tasks SET status = "completed" WHERE id = ?', (submission['task_id'],))
-            
-            # Record transactions
+            ''', (status, filename, error, upload_id))
+            return cursor.rowcount > 0
+        
+        return self.write(write)
+    
+    def fail_stale_uploads(self, older_than_seconds: float) -> int:
+        """Mark uploads stuck in processing (their worker died) as failed; returns how many"""
+        def write(cursor):
             cursor.execute('''
-                INSERT INTO transactions (from_user_id, to_user_id, amount, transaction_type, task_id, description)
-                VALUES (?, ?, ?, 'task_bounty', ?, 'Task bounty payment')
-            ''', (submission['creator_id'], submission['submitter_id'], submission['bounty_amount'], submission['task_id']))
+                UPDATE uploads SET status = 'failed', error = 'Processing was interrupted, please upload again',
+                                   updated_at = CURRENT_TIMESTAMP
+                WHERE status = 'processing' AND created_at < datetime('now', ?)
+            ''', (f'-{int(older_than_seconds)} seconds',))
+            return cursor.rowcount
+        
+        return self.write(write)
+    
+    def complete_upload(self, upload_id: str, filename: str, is_stored: Callable[[str], bool]) -> bool:
+        """Mark an upload ready and take a reference on its stored file.
+        
+        is_stored is checked inside the write transaction, which serializes it
+        against release_upload removing the same file; returns False (and marks
+        the upload failed) if the file was reclaimed in the meantime.
+        """
+        def write(cursor):
+            if not is_stored(filename):
+                cursor.execute('''
+                    UPDATE uploads SET status = 'failed', error = 'Stored file was removed, please upload again',
+                           updated_at = CURRENT_TIMESTAMP
+                    WHERE id = ?
+                ''', (upload_id,))
+                return False
             
             cursor.execute('''
-                INSERT INTO transactions (to_user_id, amount, transaction_type, task_id, description)
-                VALUES (?, 10, 'task_completion', ?, 'Base task completion reward')
-            ''', (submission['submitter_id'], submission['task_id']))
+                INSERT INTO stored_files (filename, refcount) VALUES (?, 1)
+                ON CONFLICT(filename) DO UPDATE SET refcount = refcount + 1
+            ''', (filename,))
+            cursor.execute('''
+                UPDATE uploads SET status = 'ready', filename = ?, error = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', (filename, upload_id))
+            return True
+        
+        return self.write(write)
+    
+    def release_upload(self, upload_id: str, delete_file: Callable[[str], bool]) -> bool:
+        """Delete an upload record and drop its file reference.
+        
+        When the last reference goes, delete_file(filename) is called before
+        the transaction commits, so a concurrent complete_upload either sees the
+        reference still held or sees the file gone.
+        """
+        def write(cursor):
+            cursor.execute('SELECT status, filename FROM uploads WHERE id = ?', (upload_id,))
+            upload = cursor.fetchone()
+            if not upload:
+                return False
             
-            conn.commit()
+            cursor.execute('DELETE FROM uploads WHERE id = ?', (upload_id,))
+            if upload['status'] == 'ready' and upload['filename']:
+                cursor.execute('''
+                    UPDATE stored_files SET refcount = refcount - 1 WHERE filename = ?
+                    RETURNING refcount
+                ''', (upload['filename'],))
+                row = cursor.fetchone()
+                
+                # No row means a file stored before reference counting, owned by this upload alone
+                if not row or row['refcount'] <= 0:
+                    cursor.execute('DELETE FROM stored_files WHERE filename = ?', (upload['filename'],))
+                    delete_file(upload['filename'])
             return True
+        
+        return self.write(write)
+    
+    def is_image_in_use(self, user_id: int, filename: str) -> bool:
+        """Check whether any of a user's submissions links to an uploaded file"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
             
-        except Exception as e:
-            conn.rollback()
-            return False
-        finally:
-            conn.close()
+            cursor.execute('''
+                SELECT 1 FROM task_submissions
+                WHERE submitter_id = ? AND image_url LIKE ?
+                LIMIT 1
+            ''', (user_id, f"%/uploads/{filename}%"))
+            return cursor.fetchone() is not None
     
     # Notification operations
     def register_device(self, user_id: int, device_token: str, platform: str) -> bool:
-        """Register device for push notifications"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
+        """Register device for push notifications; a known token moves to the new user and platform"""
+        def write(cursor):
+            cursor.execute('''
+                INSERT INTO notifications (user_id, device_token, platform)
+                VALUES (?, ?, ?)
+                ON CONFLICT(device_token) DO UPDATE SET user_id = excluded.user_id, platform = excluded.platform
+            ''', (user_id, device_token, platform))
+            return True
         
-        cursor.execute('''
-            INSERT OR REPLACE INTO notifications (user_id, device_token, platform)
-            VALUES (?, ?, ?)
-        ''', (user_id, device_token, platform))
+        return self.write(write)
+    
+    def queue_notification(self, user_id: int, dedupe_key: str, title: str, body: str,
+                           data: Dict[str, Any] = None) -> Future:
+        """Queue a push notification to every device of a user without waiting for the commit.
         
-        conn.commit()
-        conn.close()
-        return True
+        Rows are unique per (dedupe_key, device), so queueing the same event twice
+        sends it once. The future resolves with the number of rows queued.
+        """
+        payload = json.dumps(data) if data else None
+        
+        def write(cursor):
+            cursor.execute('''
+                INSERT OR IGNORE INTO notification_outbox
+                    (user_id, device_token, platform, dedupe_key, title, body, data, next_attempt_at)
+                SELECT user_id, device_token, platform, ?, ?, ?, ?, ?
+                FROM notifications
+                WHERE user_id = ? AND device_token IS NOT NULL
+            ''', (dedupe_key, title, body, payload, time.time(), user_id))
+            return cursor.rowcount
+        
+        return self.writer.submit(write)
+    
+    def claim_notifications(self, limit: int, lease_seconds: float) -> List[Dict[str, Any]]:
+        """Take up to `limit` due notifications for sending.
+        
+        Claimed rows count an attempt and are hidden for lease_seconds, so another
+        dispatcher does not pick them up; if this one dies they become due again.
+        """
+        def write(cursor):
+            now = time.time()
+            cursor.execute('''
+                UPDATE notification_outbox SET attempts = attempts + 1, next_attempt_at = ?
+                WHERE id IN (
+                    SELECT id FROM notification_outbox
+                    WHERE status = 'pending' AND next_attempt_at <= ?
+                    ORDER BY next_attempt_at
+                    LIMIT ?
+                )
+                RETURNING id, user_id, device_token, platform, title, body, data, attempts
+            ''', (now + lease_seconds, now, limit))
+            return [dict(row) for row in cursor.fetchall()]
+        
+        return self.write(write)
+    
+    def finish_notifications(self, sent: List[int], retry: List[Tuple[int, float, str]],
+                             failed: List[Tuple[int, str]], invalid_tokens: List[str]):
+        """Record one dispatch round: sent IDs, (id, next attempt time, error) to retry,
+        (id, error) given up on, and device tokens the provider rejected for good"""
+        def write(cursor):
+            cursor.executemany('''
+                UPDATE notification_outbox SET status = 'sent', last_error = NULL, sent_at = CURRENT_TIMESTAMP
+                WHERE id = ?
+            ''', [(notification_id,) for notification_id in sent])
+            cursor.executemany('''
+                UPDATE notification_outbox SET next_attempt_at = ?, last_error = ? WHERE id = ?
+            ''', [(next_attempt_at, error, notification_id) for notification_id, next_attempt_at, error in retry])
+            cursor.executemany('''
+                UPDATE notification_outbox SET status = 'failed', last_error = ? WHERE id = ?
+            ''', [(error, notification_id) for notification_id, error in failed])
+            cursor.executemany('DELETE FROM notifications WHERE device_token = ?',
+                               [(token,) for token in invalid_tokens])
+        
+        self.write(write)
+    
+    def prune_notifications(self, older_than_seconds: float) -> int:
+        """Delete sent and failed notifications older than the given age; returns how many"""
+        def write(cursor):
+            # next_attempt_at of a finished row is its last claim time plus the lease
+            cursor.execute('''
+                DELETE FROM notification_outbox
+                WHERE status != 'pending' AND next_attempt_at < ?
+            ''', (time.time() - older_than_seconds,))
+            return cursor.rowcount
+        
+        return self.write(write)
+    
+    # Event stream operations
+    def log_events(self, entries: List[Tuple[str, Optional[int], Optional[float], Optional[float], Dict[str, Any]]],
+                   max_rows: int) -> Future:
+        """Append (topic, user_id, latitude, longitude, data) rows to the event log without waiting.
+        
+        Only the newest max_rows events are kept; older ones are deleted in the
+        same job with a primary key range, so the log never needs a separate sweep.
+        """
+        now = time.time()
+        rows = [(topic, user_id, latitude, longitude, json.dumps(data), now)
+                for topic, user_id, latitude, longitude, data in entries]
+        
+        def write(cursor):
+            cursor.executemany('''
+                INSERT INTO event_log (topic, user_id, latitude, longitude, data, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+            ''', rows)
+            cursor.execute('SELECT last_insert_rowid()')
+            cursor.execute('DELETE FROM event_log WHERE id <= ?', (cursor.fetchone()[0] - max_rows,))
+            return len(rows)
+        
+        return self.writer.submit(write)
+    
+    def get_events(self, after_id: int, up_to_id: int = None, user_id: int = None,
+                   limit: int = 1000) -> List[Dict[str, Any]]:
+        """Get logged events with after_id < id <= up_to_id, oldest first.
+        
+        With user_id, only that user's events and area events (user_id NULL) are returned.
+        """
+        where = 'id > ?'
+        params: List[Any] = [after_id]
+        if up_to_id is not None:
+            where += ' AND id <= ?'
+            params.append(up_to_id)
+        if user_id is not None:
+            where += ' AND (user_id = ? OR user_id IS NULL)'
+            params.append(user_id)
+        
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute(f'''
+                SELECT id, topic, user_id, latitude, longitude, data
+                FROM event_log
+                WHERE {where}
+                ORDER BY id
+                LIMIT ?
+            ''', (*params, limit))
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_event_bounds(self) -> Tuple[int, int]:
+        """Get the (oldest, newest) event IDs still in the log; (0, 0) when it is empty"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), 0) FROM event_log')
+            return tuple(cursor.fetchone())
+    
+    def get_nearby_tasks(self, latitude: float, longitude: float, radius_km: float = 5.0,
+                         limit: int = 50) -> List[Dict[str, Any]]:
+        """Get active tasks within radius_km, nearest first, with their distance in km"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Candidate lookup through the R*Tree, then exact haversine filtering
+            candidates = []
+            for min_lat, max_lat, min_lng, max_lng in bounding_boxes(latitude, longitude, radius_km):
+                cursor.execute('''
+                    SELECT t.*, u.username as creator_username
+                    FROM tasks_rtree r
+                    CROSS JOIN tasks t ON t.id = r.id
+                    JOIN users u ON t.creator_id = u.id
+                    WHERE r.max_lat >= ? AND r.min_lat <= ?
+                    AND r.max_lng >= ? AND r.min_lng <= ?
+                    AND t.status = 'active'
+                ''', (min_lat, max_lat, min_lng, max_lng))
+                candidates.extend(cursor.fetchall())
+        
+        tasks = []
+        for row in candidates:
+            distance = haversine_km(latitude, longitude, row['latitude'], row['longitude'])
+            if distance <= radius_km:
+                task = dict(row)
+                task['distance'] = round(distance, 3)
+                tasks.append(task)
+        
+        return heapq.nsmallest(limit, tasks, key=lambda task: (task['distance'], task['id']))
+    
+    def get_user_tasks(self, user_id: int, task_type: str = 'created', limit: int = 50,
+                       after: tuple = None) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+        """Get one page of tasks created or completed by user, and the next cursor"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            if task_type == 'created':
+                where = 't.creator_id = ?'
+                params = [user_id]
+                if after:
+                    where += ' AND (t.created_at, t.id) < (?, ?)'
+                    params.extend(after)
+                query = f'''
+                    SELECT t.*, u.username as creator_username
+                    FROM tasks t
+                    JOIN users u ON t.creator_id = u.id
+                    WHERE {where}
+                    ORDER BY t.created_at DESC, t.id DESC
+                    LIMIT ?
+                '''
+                sort_column, id_column = 'created_at', 'id'
+            else:  # completed
+                where = "s.submitter_id = ? AND s.status = 'accepted'"
+                params = [user_id]
+                if after:
+                    where += ' AND (s.submitted_at, s.id) < (?, ?)'
+                    params.extend(after)
+                query = f'''
+                    SELECT t.*, u.username as creator_username, s.submitted_at, s.image_url,
+                           s.id as submission_id
+                    FROM task_submissions s
+                    JOIN tasks t ON t.id = s.task_id
+                    JOIN users u ON t.creator_id = u.id
+                    WHERE {where}
+                    ORDER BY s.submitted_at DESC, s.id DESC
+                    LIMIT ?
+                '''
+                sort_column, id_column = 'submitted_at', 'submission_id'
+            cursor.execute(query, (*params, limit + 1))
+            
+            tasks = [dict(row) for row in cursor.fetchall()]
+        return paginate(tasks, limit, sort_column, id_column)
     
-    def get_nearby_tasks(self, latitude: float, longitude: float, radius_km: float = 5.0) -> List[Dict[str, Any]]:
-        """Get tasks within a certain radius (simplified distance calculation)"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        # Simplified bounding box calculation (not precise for large distances)
-        lat_range = radius_km / 111.0  # Rough km to degrees
-        lng_range = radius_km / (111.0 * abs(latitude))
-        
-        cursor.execute('''
-            SELECT t.*, u.username as creator_username
-            FROM tasks t
-            JOIN users u ON t.creator_id = u.id
-            WHERE t.status = 'active'
-            AND t.latitude BETWEEN ? AND ?
-            AND t.longitude BETWEEN ? AND ?
-        ''', (latitude - lat_range, latitude + lat_range,
-              longitude - lng_range, longitude + lng_range))
-        
-        tasks = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return tasks
-    
-    def get_user_tasks(self, user_id: int, task_type: str = 'created') -> List[Dict[str, Any]]:
-        """Get tasks created or completed by user"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        if task_type == 'created':
-            query = '''
-                SELECT t.*, u.username as creator_username
-                FROM tasks t
-                JOIN users u ON t.creator_id = u.id
-                WHERE t.creator_id = ?
-                ORDER BY t.created_at DESC
-            '''
-            cursor.execute(query, (user_id,))
-        else:  # completed
-            query = '''
-                SELECT t.*, u.username as creator_username, s.submitted_at, s.image_url
-                FROM tasks t
-                JOIN users u ON t.creator_id = u.id
-                JOIN task_submissions s ON t.id = s.task_id
-                WHERE s.submitter_id = ? AND s.status = 'accepted'
-                ORDER BY s.submitted_at DESC
-            '''
-            cursor.execute(query, (user_id,))
-        
-        tasks = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return tasks
-
     def get_leaderboard(self, limit: int = 10) -> List[Dict[str, Any]]:
         """Get user leaderboard ordered by coins, task completions, and username"""
-        conn = self.get_connection()
-        cursor = conn.cursor()
-        
-        query = '''
-            WITH user_completions AS (
-                SELECT submitter_id, COUNT(*) as completed_tasks
-                FROM task_submissions
-                WHERE status = 'accepted'
-                GROUP BY submitter_id
-            )
-            SELECT 
-                u.id,
-                u.username,
-                u.coin_balance,
-                COALESCE(uc.completed_tasks, 0) as completed_tasks
-            FROM users u
-            LEFT JOIN user_completions uc ON u.id = uc.submitter_id
-            ORDER BY 
-                u.coin_balance DESC,
-                COALESCE(uc.completed_tasks, 0) DESC,
-                u.username ASC
-            LIMIT ?
-        '''
-        
-        cursor.execute(query, (limit,))
-        leaderboard = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return leaderboard 
\ No newline at end of file
+        leaderboard = self.leaderboard_cache.get(limit)
+        if leaderboard is not None:
+            return leaderboard
+        
+        # Walks idx_users_leaderboard in order, so only the top rows are read
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT id, username, coin_balance, completed_tasks
+                FROM users
+                ORDER BY coin_balance DESC, completed_tasks DESC, username ASC
+                LIMIT ?
+            ''', (max(limit, self.leaderboard_cache.size),))
+            rows = [dict(row) for row in cursor.fetchall()]
+        
+        self.leaderboard_cache.set(rows)
+        return [dict(row) for row in rows[:limit]]
+    
+    def get_user_rank(self, user_id: int) -> Optional[Dict[str, Any]]:
+        """Get a user's leaderboard position without sorting the whole table"""
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+                SELECT id, username, coin_balance, completed_tasks
+                FROM users WHERE id = ?
+            ''', (user_id,))
+            user = cursor.fetchone()
+            if not user:
+                return None
+            
+            # Count the users ahead of this one; each OR branch is a range on idx_users_leaderboard
+            cursor.execute('''
+                SELECT COUNT(*) FROM users
+                WHERE coin_balance > ?
+                OR (coin_balance = ? AND completed_tasks > ?)
+                OR (coin_balance = ? AND completed_tasks = ? AND username < ?)
+            ''', (user['coin_balance'],
+                  user['coin_balance'], user['completed_tasks'],
+                  user['coin_balance'], user['completed_tasks'], user['username']))
+            ahead = cursor.fetchone()[0]
+        
+        rank = dict(user)
+        rank['rank'] = ahead + 1
+        return rank
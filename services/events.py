@@ -0,0 +1,36 @@
+import threading
+from typing import Any, Callable, List
+
+class EventBus:
+    """In-process publish/subscribe for data change events.
+    
+    DatabaseService publishes an event after each committed write (for example
+    'task.updated' with task_id=...). Subscribers run synchronously in the
+    writing thread, so they must be quick and must not raise. Events do not
+    cross process boundaries.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscribers: List[Callable[..., None]] = []
+    
+    def subscribe(self, callback: Callable[..., None]):
+        """Register callback(topic, **fields) for every published event"""
+        with self._lock:
+            self._subscribers = self._subscribers + [callback]
+    
+    def unsubscribe(self, callback: Callable[..., None]):
+        """Remove a previously registered callback"""
+        with self._lock:
+            self._subscribers = [s for s in self._subscribers if s is not callback]
+    
+    def publish(self, topic: str, **fields: Any):
+        """Deliver an event to every subscriber; subscriber errors are swallowed"""
+        for callback in self._subscribers:
+            try:
+                callback(topic, **fields)
+            except Exception:
+                pass
+
+# One bus per process
+events = EventBus()
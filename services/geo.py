@@ -0,0 +1,42 @@
+import math
+from typing import List, Tuple
+
+EARTH_RADIUS_KM = 6371.0088
+
+def haversine_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Great-circle distance between two points in kilometers"""
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    d_phi = phi2 - phi1
+    d_lambda = math.radians(lng2 - lng1)
+
+    a = math.sin(d_phi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(d_lambda / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+def bounding_boxes(latitude: float, longitude: float, radius_km: float) -> List[Tuple[float, float, float, float]]:
+    """Get (min_lat, max_lat, min_lng, max_lng) boxes covering a search circle.
+
+    The longitude span is widened by 1/cos(latitude) and the box is split in two
+    when it crosses the antimeridian. Near the poles the box covers every longitude.
+    """
+    lat_range = math.degrees(radius_km / EARTH_RADIUS_KM)
+    min_lat = max(-90.0, latitude - lat_range)
+    max_lat = min(90.0, latitude + lat_range)
+
+    # Circle reaches a pole, so every meridian is within range
+    if min_lat <= -90.0 or max_lat >= 90.0:
+        return [(min_lat, max_lat, -180.0, 180.0)]
+
+    # Use the widest parallel inside the box so the corners are covered too
+    widest_lat = max(abs(min_lat), abs(max_lat))
+    lng_range = lat_range / math.cos(math.radians(widest_lat))
+    if lng_range >= 180.0:
+        return [(min_lat, max_lat, -180.0, 180.0)]
+
+    min_lng = longitude - lng_range
+    max_lng = longitude + lng_range
+    if min_lng < -180.0:
+        return [(min_lat, max_lat, min_lng + 360.0, 180.0), (min_lat, max_lat, -180.0, max_lng)]
+    if max_lng > 180.0:
+        return [(min_lat, max_lat, min_lng, 180.0), (min_lat, max_lat, -180.0, max_lng - 360.0)]
+    return [(min_lat, max_lat, min_lng, max_lng)]
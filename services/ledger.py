@@ -0,0 +1,42 @@
+"""
+Coin ledger primitives used by DatabaseService.
+
+Every balance change is a single conditional UPDATE executed inside the
+caller's ``BEGIN IMMEDIATE`` transaction, so concurrent workers never
+read-modify-write a balance and a debit can never take a balance below zero.
+
+Task bounties are escrowed: the creator is debited when the task is created
+and the amount is held in ``tasks.escrow_amount`` until the task is completed
+(paid to the submitter) or deleted (refunded). Escrow movements are recorded in
+``transactions`` with the creator on both sides, since the ledger has no
+system account.
+"""
+
+from typing import Iterable, Optional, Tuple
+
+# Coins paid by the system to the submitter on top of the bounty
+COMPLETION_REWARD = 10
+
+def debit(cursor, user_id: int, amount: int) -> bool:
+    """Take coins from a user; returns False (and changes nothing) if the balance is too low"""
+    cursor.execute('''
+        UPDATE users SET coin_balance = coin_balance - ?, updated_at = CURRENT_TIMESTAMP
+        WHERE id = ? AND coin_balance >= ?
+    ''', (amount, user_id, amount))
+    return cursor.rowcount == 1
+
+def credit(cursor, user_id: int, amount: int, completed_tasks: int = 0) -> bool:
+    """Give coins to a user, optionally counting completed tasks for the leaderboard"""
+    cursor.execute('''
+        UPDATE users SET coin_balance = coin_balance + ?, completed_tasks = completed_tasks + ?,
+                         updated_at = CURRENT_TIMESTAMP
+        WHERE id = ?
+    ''', (amount, completed_tasks, user_id))
+    return cursor.rowcount == 1
+
+def record(cursor, entries: Iterable[Tuple[Optional[int], int, int, str, Optional[int], str]]):
+    """Append (from_user_id, to_user_id, amount, type, task_id, description) rows to the ledger"""
+    cursor.executemany('''
+        INSERT INTO transactions (from_user_id, to_user_id, amount, transaction_type, task_id, description)
+        VALUES (?, ?, ?, ?, ?, ?)
+    ''', list(entries))
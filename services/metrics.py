@@ -0,0 +1,321 @@
+"""
+Process-safe metrics in the Prometheus text format.
+
+Each process records counters and histograms in memory and, from a daemon
+thread, periodically writes a snapshot to METRICS_DIR/<pid>-<token>.json.
+GET /metrics (served by whichever worker takes the request) merges every
+snapshot, so the totals cover all gunicorn workers:
+    
+    - counters and histograms are summed over all processes; snapshots of
+      processes that have exited are folded into archive.json, so totals never
+      go backwards when a worker is recycled
+    - gauges are summed over live processes only
+
+Gauges and counters that services already keep (pool usage, cache hits) are
+read by collectors registered with register_collector at snapshot time.
+Reports registered with register_report ride along in the snapshot files so
+admin endpoints can show per-process data from every worker.
+"""
+
+import fcntl
+import functools
+import json
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Seconds; covers a cached GET (sub-millisecond) up to a slow image upload
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# name -> (type, help, buckets)
+METRICS: Dict[str, Tuple[str, str, Optional[Tuple[float, ...]]]] = {
+    'http_request_duration_seconds': ('histogram', 'HTTP request duration by method, route and status', DEFAULT_BUCKETS),
+    'db_method_duration_seconds': ('histogram', 'DatabaseService method duration, including pool and write queue waits', DEFAULT_BUCKETS),
+    'bcrypt_duration_seconds': ('histogram', 'bcrypt hash and check time on the hashing pool', (0.01, 0.025, 0.05, 0.1, 0.2, 0.4, 0.8, 1.6, 3.2)),
+    'image_processing_seconds': ('histogram', 'Pillow decode, resize and encode time per upload', (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)),
+    'image_processing_failures_total': ('counter', 'Uploads that failed processing', None),
+    'db_pool_connections': ('gauge', 'Pooled SQLite connections by state', None),
+    'db_pool_checkouts_total': ('counter', 'Pooled SQLite connection checkouts', None),
+    'db_pool_waits_total': ('counter', 'Checkouts that had to wait for a free connection', None),
+    'db_write_queue_depth': ('gauge', 'Write jobs waiting for the writer thread', None),
+    'db_write_batches_total': ('counter', 'Write transactions committed', None),
+    'db_write_jobs_total': ('counter', 'Write jobs committed', None),
+    'cache_lookups_total': ('counter', 'Cache lookups by cache and result', None),
+    'cache_entries': ('gauge', 'Entries held by each cache', None),
+    'bcrypt_rejected_total': ('counter', 'Password operations rejected because the hashing pool was full', None),
+}
+
+Labels = Tuple[Tuple[str, str], ...]
+Sample = Tuple[str, Dict[str, Any], float]
+
+def _labels(labels: Dict[str, Any]) -> Labels:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+def _process_started(pid: int) -> Optional[str]:
+    """Start time of a process (from /proc), or None if it is not running.
+    
+    Together with the pid this identifies a process, so a snapshot left by an
+    earlier container run is not mistaken for a live worker that reused its pid.
+    """
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            return f.read().rsplit(')', 1)[1].split()[19]
+    except (OSError, IndexError):
+        pass
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return None
+    except PermissionError:
+        pass
+    return ''
+
+class MetricsRegistry:
+    """In-memory counters and histograms for one process, with snapshot files for the rest"""
+    
+    def __init__(self, directory: str = None, flush_interval: float = None):
+        self.directory = directory or os.getenv('METRICS_DIR') or os.path.join(tempfile.gettempdir(), 'spacetask-metrics')
+        self.flush_interval = flush_interval if flush_interval is not None else float(os.getenv('METRICS_FLUSH_INTERVAL', 1))
+        self._collectors: List[Callable[[], Iterable[Sample]]] = []
+        self._reports: Dict[str, Callable[[], Any]] = {}
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+    
+    def _reset(self):
+        """Start empty; used at startup and in a forked child, whose parent keeps its own counts"""
+        self._lock = threading.Lock()
+        self._token = uuid.uuid4().hex[:8]
+        self._started = _process_started(os.getpid())
+        self._counters: Dict[Tuple[str, Labels], float] = {}
+        self._histograms: Dict[Tuple[str, Labels], List[float]] = {}
+        self._flusher = None
+    
+    # Recording
+    def inc(self, name: str, value: float = 1, **labels: Any):
+        """Add to a counter"""
+        key = (name, _labels(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+        self._ensure_flusher()
+    
+    def observe(self, name: str, value: float, **labels: Any):
+        """Record one histogram observation"""
+        buckets = METRICS[name][2]
+        key = (name, _labels(labels))
+        with self._lock:
+            # Per-bucket counts (non-cumulative), then sum and count
+            series = self._histograms.get(key)
+            if series is None:
+                series = self._histograms[key] = [0.0] * (len(buckets) + 2)
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            series[-2] += value
+            series[-1] += 1
+        self._ensure_flusher()
+    
+    @contextmanager
+    def timer(self, name: str, **labels: Any):
+        """Observe the duration of a with block"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+    
+    def register_collector(self, collector: Callable[[], Iterable[Sample]]):
+        """Add a callable returning (name, labels, value) samples, read at every snapshot"""
+        self._collectors.append(collector)
+    
+    def register_report(self, name: str, report: Callable[[], Any]):
+        """Add a callable returning JSON-serializable data, shipped with every snapshot (see reports)"""
+        self._reports[name] = report
+    
+    # Snapshots
+    def snapshot(self) -> Dict[str, Any]:
+        """This process's metrics as JSON-serializable data"""
+        counters: Dict[Tuple[str, Labels], float] = {}
+        gauges: Dict[Tuple[str, Labels], float] = {}
+        for collector in self._collectors:
+            try:
+                for name, labels, value in collector():
+                    target = gauges if METRICS[name][0] == 'gauge' else counters
+                    key = (name, _labels(labels))
+                    target[key] = target.get(key, 0) + value
+            except Exception:
+                pass
+        
+        with self._lock:
+            counters.update({key: counters.get(key, 0) + value for key, value in self._counters.items()})
+            histograms = {key: list(series) for key, series in self._histograms.items()}
+        
+        encode = lambda series: [[name, list(labels), value] for (name, labels), value in series.items()]
+        reports = {}
+        for name, report in self._reports.items():
+            try:
+                reports[name] = report()
+            except Exception:
+                pass
+        return {'pid': os.getpid(), 'started': self._started, 'counters': encode(counters), 'gauges': encode(gauges),
+                'histograms': encode(histograms), 'reports': reports}
+    
+    def flush(self):
+        """Write this process's snapshot file"""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f'{os.getpid()}-{self._token}.json')
+        temp_path = f'{path}.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump(self.snapshot(), f)
+        os.replace(temp_path, path)
+    
+    def _ensure_flusher(self):
+        if self._flusher is None:
+            with self._lock:
+                if self._flusher is None:
+                    self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flush', daemon=True)
+                    self._flusher.start()
+    
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except OSError:
+                pass
+    
+    # Exposition
+    def collect(self) -> Dict[str, Dict[Tuple[str, Labels], Any]]:
+        """Merge every process's snapshot (flushing this one first) into counters, gauges and histograms"""
+        self.flush()
+        merged = {'counters': {}, 'gauges': {}, 'histograms': {}}
+        
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            archive_path = os.path.join(self.directory, 'archive.json')
+            archive = self._read(archive_path) or {'counters': [], 'histograms': []}
+            archived = {'counters': {}, 'gauges': {}, 'histograms': {}}
+            self._merge(archived, archive)
+            
+            dead = []
+            for name in os.listdir(self.directory):
+                if not name.endswith('.json') or name == 'archive.json':
+                    continue
+                snapshot = self._read(os.path.join(self.directory, name))
+                if snapshot is None:
+                    continue
+                if _process_started(snapshot['pid']) == snapshot.get('started'):
+                    self._merge(merged, snapshot)
+                else:
+                    # Keep an exited worker's totals, drop its gauges
+                    snapshot['gauges'] = []
+                    self._merge(archived, snapshot)
+                    dead.append(name)
+            
+            if dead:
+                encode = lambda series: [[name, list(labels), value] for (name, labels), value in series.items()]
+                temp_path = f'{archive_path}.tmp'
+                with open(temp_path, 'w') as f:
+                    json.dump({'counters': encode(archived['counters']),
+                               'histograms': encode(archived['histograms'])}, f)
+                os.replace(temp_path, archive_path)
+                for name in dead:
+                    os.remove(os.path.join(self.directory, name))
+        
+        self._merge(merged, {'counters': [[n, l, v] for (n, l), v in archived['counters'].items()],
+                             'histograms': [[n, l, v] for (n, l), v in archived['histograms'].items()]})
+        return merged
+    
+    def reports(self, name: str) -> List[Any]:
+        """The named report from every live process (this one freshly flushed)"""
+        self.flush()
+        results = []
+        for filename in os.listdir(self.directory):
+            if not filename.endswith('.json') or filename == 'archive.json':
+                continue
+            snapshot = self._read(os.path.join(self.directory, filename))
+            if snapshot and name in snapshot.get('reports', {}) and \
+                    _process_started(snapshot['pid']) == snapshot.get('started'):
+                results.append(snapshot['reports'][name])
+        return results
+    
+    @staticmethod
+    def _read(path: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+    
+    @staticmethod
+    def _merge(into: Dict[str, Dict], snapshot: Dict[str, Any]):
+        for kind in ('counters', 'gauges'):
+            for name, labels, value in snapshot.get(kind, []):
+                key = (name, tuple(tuple(pair) for pair in labels))
+                into[kind][key] = into[kind].get(key, 0) + value
+        for name, labels, series in snapshot.get('histograms', []):
+            key = (name, tuple(tuple(pair) for pair in labels))
+            current = into['histograms'].get(key)
+            into['histograms'][key] = [a + b for a, b in zip(current, series)] if current else list(series)
+    
+    def render(self) -> str:
+        """All processes' metrics in the Prometheus text exposition format (version 0.0.4)"""
+        merged = self.collect()
+        by_name: Dict[str, List[Tuple[Labels, Any]]] = {}
+        for kind in ('counters', 'gauges', 'histograms'):
+            for (name, labels), value in merged[kind].items():
+                by_name.setdefault(name, []).append((labels, value))
+        
+        lines = []
+        for name in sorted(by_name):
+            kind, help_text, buckets = METRICS.get(name, ('untyped', name, None))
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {kind}')
+            for labels, value in sorted(by_name[name]):
+                if kind != 'histogram':
+                    lines.append(f'{name}{_format_labels(labels)} {_format_value(value)}')
+                    continue
+                cumulative = 0
+                for bound, count in zip(buckets, value):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{_format_labels(labels + (("le", repr(bound)),))} {_format_value(cumulative)}')
+                lines.append(f'{name}_bucket{_format_labels(labels + (("le", "+Inf"),))} {_format_value(value[-1])}')
+                lines.append(f'{name}_sum{_format_labels(labels)} {_format_value(value[-2])}')
+                lines.append(f'{name}_count{_format_labels(labels)} {_format_value(value[-1])}')
+        return '\n'.join(lines) + '\n'
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ''
+    escape = lambda value: value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{key}="{escape(value)}"' for key, value in labels) + '}'
+
+def _format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+def timed_methods(histogram: str, exclude: Iterable[str] = ()):
+    """Class decorator observing the duration of every public method, labelled by method name"""
+    def decorate(cls):
+        for name, fn in list(vars(cls).items()):
+            if name.startswith('_') or name in exclude or not callable(fn):
+                continue
+            setattr(cls, name, _timed(fn, histogram, name))
+        return cls
+    return decorate
+
+def _timed(fn: Callable, histogram: str, method: str) -> Callable:
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            metrics.observe(histogram, time.perf_counter() - started, method=method)
+    return wrapper
+
+# One registry per process
+metrics = MetricsRegistry()
@@ -0,0 +1,526 @@
+"""
+Versioned schema migrations for the SpaceTask database.
+
+The schema version is stored in SQLite's ``PRAGMA user_version``. Each migration
+runs once, inside its own ``BEGIN IMMEDIATE`` transaction, so concurrent workers
+starting at the same time cannot apply the same step twice.
+
+Run from the command line (the Docker entrypoint does this before starting the
+server):
+    
+    python -m services.migrations [--db PATH] [--check-plans]
+"""
+
+import argparse
+import os
+import re
+import sqlite3
+import sys
+from typing import Callable, List, Tuple
+
+def _base_schema(cursor):
+    """Initial tables"""
+    # Users table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            email TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            coin_balance INTEGER DEFAULT 200,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    
+    # Tasks table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tasks (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            creator_id INTEGER NOT NULL,
+            title TEXT NOT NULL,
+            description TEXT NOT NULL,
+            label TEXT,
+            completion_criteria TEXT NOT NULL,
+            bounty_amount INTEGER NOT NULL,
+            latitude REAL NOT NULL,
+            longitude REAL NOT NULL,
+            location_name TEXT,
+            status TEXT DEFAULT 'active',
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (creator_id) REFERENCES users (id)
+        )
+    ''')
+    
+    # Task submissions table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS task_submissions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            task_id INTEGER NOT NULL,
+            submitter_id INTEGER NOT NULL,
+            image_url TEXT NOT NULL,
+            note TEXT,
+            status TEXT DEFAULT 'pending',
+            submitted_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            reviewed_at TIMESTAMP,
+            FOREIGN KEY (task_id) REFERENCES tasks (id),
+            FOREIGN KEY (submitter_id) REFERENCES users (id)
+        )
+    ''')
+    
+    # Notifications table
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS notifications (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            device_token TEXT,
+            platform TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    
+    # Transactions table for coin transfers
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            from_user_id INTEGER,
+            to_user_id INTEGER NOT NULL,
+            amount INTEGER NOT NULL,
+            transaction_type TEXT NOT NULL,
+            task_id INTEGER,
+            description TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (from_user_id) REFERENCES users (id),
+            FOREIGN KEY (to_user_id) REFERENCES users (id),
+            FOREIGN KEY (task_id) REFERENCES tasks (id)
+        )
+    ''')
+
+def _spatial_index(cursor):
+    """R*Tree over active task locations, kept in sync by triggers"""
+    cursor.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tasks_rtree'")
+    exists = cursor.fetchone() is not None
+    
+    cursor.execute('''
+        CREATE VIRTUAL TABLE IF NOT EXISTS tasks_rtree USING rtree (
+            id,
+            min_lat, max_lat,
+            min_lng, max_lng
+        )
+    ''')
+    
+    # Only active tasks are indexed; completing, cancelling or deleting a task removes it
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tasks_rtree_insert AFTER INSERT ON tasks
+        WHEN NEW.status = 'active'
+        BEGIN
+            INSERT INTO tasks_rtree (id, min_lat, max_lat, min_lng, max_lng)
+            VALUES (NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude);
+        END
+    ''')
+    
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tasks_rtree_update AFTER UPDATE OF status, latitude, longitude ON tasks
+        BEGIN
+            DELETE FROM tasks_rtree WHERE id = OLD.id;
+            INSERT INTO tasks_rtree (id, min_lat, max_lat, min_lng, max_lng)
+            SELECT NEW.id, NEW.latitude, NEW.latitude, NEW.longitude, NEW.longitude
+            WHERE NEW.status = 'active';
+        END
+    ''')
+    
+    cursor.execute('''
+        CREATE TRIGGER IF NOT EXISTS tasks_rtree_delete AFTER DELETE ON tasks
+        BEGIN
+            DELETE FROM tasks_rtree WHERE id = OLD.id;
+        END
+    ''')
+    
+    # Backfill tasks created before the index existed
+    if not exists:
+        cursor.execute('''
+            INSERT INTO tasks_rtree (id, min_lat, max_lat, min_lng, max_lng)
+            SELECT id, latitude, latitude, longitude, longitude
+            FROM tasks WHERE status = 'active'
+        ''')
+
+def _secondary_indexes(cursor):
+    """Indexes for the list, ownership and leaderboard queries"""
+    # get_tasks: WHERE status = ? ORDER BY created_at DESC
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_status_created ON tasks (status, created_at, id)')
+    # get_user_tasks('created'): WHERE creator_id = ? ORDER BY created_at DESC
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_tasks_creator_created ON tasks (creator_id, created_at, id)')
+    # get_task_submissions and delete_task's COUNT: WHERE task_id = ?
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_submissions_task_submitted ON task_submissions (task_id, submitted_at, id)')
+    # get_user_tasks('completed'): WHERE submitter_id = ? AND status = 'accepted'
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_submissions_submitter_status ON task_submissions (submitter_id, status, submitted_at, id)')
+    # get_leaderboard: accepted submissions grouped by submitter
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_submissions_status_submitter ON task_submissions (status, submitter_id)')
+
+def _materialized_leaderboard(cursor):
+    """Per-user completed task counter and an index matching the leaderboard order"""
+    cursor.execute('ALTER TABLE users ADD COLUMN completed_tasks INTEGER NOT NULL DEFAULT 0')
+    cursor.execute('''
+        UPDATE users SET completed_tasks = (
+            SELECT COUNT(*) FROM task_submissions
+            WHERE submitter_id = users.id AND status = 'accepted'
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_users_leaderboard
+        ON users (coin_balance DESC, completed_tasks DESC, username)
+    ''')
+
+def _uploads(cursor):
+    """Tracks images accepted by /api/upload while they are processed in the background"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS uploads (
+            id TEXT PRIMARY KEY,
+            user_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'processing',
+            filename TEXT,
+            error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+
+def _content_store(cursor):
+    """Reference counts for content-addressed upload files shared by duplicate uploads"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stored_files (
+            filename TEXT PRIMARY KEY,
+            refcount INTEGER NOT NULL DEFAULT 0,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_uploads_filename ON uploads (filename)
+    ''')
+    
+    # Existing ready uploads each hold one reference to their file
+    cursor.execute('''
+        INSERT INTO stored_files (filename, refcount)
+        SELECT filename, COUNT(*) FROM uploads
+        WHERE status = 'ready' AND filename IS NOT NULL
+        GROUP BY filename
+    ''')
+
+def _bounty_escrow(cursor):
+    """Bounty held in escrow per task; 0 for tasks created before escrow, which pay from the balance"""
+    cursor.execute('''
+        ALTER TABLE tasks ADD COLUMN escrow_amount INTEGER NOT NULL DEFAULT 0
+    ''')
+
+def _notification_outbox(cursor):
+    """One registration per device token and a persistent queue of outgoing push notifications"""
+    # Keep the newest registration of each token before making tokens unique
+    cursor.execute('''
+        DELETE FROM notifications
+        WHERE device_token IS NULL
+        OR id NOT IN (SELECT MAX(id) FROM notifications GROUP BY device_token)
+    ''')
+    cursor.execute('CREATE UNIQUE INDEX IF NOT EXISTS idx_notifications_device_token ON notifications (device_token)')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_notifications_user ON notifications (user_id)')
+    
+    # One row per (event, device); status is pending until sent or given up on
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS notification_outbox (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            device_token TEXT NOT NULL,
+            platform TEXT,
+            dedupe_key TEXT NOT NULL,
+            title TEXT NOT NULL,
+            body TEXT NOT NULL,
+            data TEXT,
+            status TEXT NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            sent_at TIMESTAMP,
+            UNIQUE (dedupe_key, device_token),
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    # claim_notifications: WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY next_attempt_at
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_outbox_status_due ON notification_outbox (status, next_attempt_at)
+    ''')
+
+def _event_log(cursor):
+    """Recent write events, tailed by the event stream server (services/sse.py)"""
+    # user_id is the recipient; area events (new tasks) have no user and carry a location
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS event_log (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            topic TEXT NOT NULL,
+            user_id INTEGER,
+            latitude REAL,
+            longitude REAL,
+            data TEXT NOT NULL,
+            created_at REAL NOT NULL
+        )
+    ''')
+
+def _drop_status_submitter_index(cursor):
+    """Drop the grouped leaderboard index; get_leaderboard reads users.completed_tasks since version 4"""
+    cursor.execute('DROP INDEX IF EXISTS idx_submissions_status_submitter')
+
+# Ordered list of (version, description, apply). Never edit or reorder a shipped
+# migration; append a new one instead.
+MIGRATIONS: List[Tuple[int, str, Callable]] = [
+    (1, 'base schema', _base_schema),
+    (2, 'spatial index on active tasks', _spatial_index),
+    (3, 'secondary indexes', _secondary_indexes),
+    (4, 'materialized leaderboard', _materialized_leaderboard),
+    (5, 'background upload processing', _uploads),
+    (6, 'content-addressed upload store', _content_store),
+    (7, 'bounty escrow', _bounty_escrow),
+    (8, 'push notification outbox', _notification_outbox),
+    (9, 'event log for the event stream', _event_log),
+    (10, 'drop unused submission status index', _drop_status_submitter_index),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+def get_version(conn: sqlite3.Connection) -> int:
+    """Get the schema version recorded in the database"""
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+def migrate(conn: sqlite3.Connection, target: int = None) -> int:
+    """Apply every pending migration up to target; returns the resulting version"""
+    target = LATEST_VERSION if target is None else target
+    if get_version(conn) >= target:
+        return get_version(conn)
+    
+    if conn.in_transaction:
+        conn.commit()
+    
+    for version, description, apply in MIGRATIONS:
+        if version > target:
+            break
+        
+        # Take the write lock before re-reading the version so only one process applies each step
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if get_version(conn) >= version:
+                conn.rollback()
+                continue
+            apply(conn.cursor())
+            conn.execute(f'PRAGMA user_version = {version}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    
+    conn.execute('PRAGMA optimize')
+    return get_version(conn)
+
+# EXPLAIN QUERY PLAN expectations for the hot queries in DatabaseService. Each entry
+# lists the table aliases that must be searched through an index (never a full
+# SCAN), whether a temporary B-tree for sorting is acceptable and, optionally,
+# plan fragments that must appear.
+QUERY_PLAN_CHECKS = {
+    'get_tasks': {
+        'sql': '''
+            SELECT t.*, u.username as creator_username
+            FROM tasks t
+            JOIN users u ON t.creator_id = u.id
+            WHERE t.status = ? AND (t.created_at, t.id) < (?, ?)
+            ORDER BY t.created_at DESC, t.id DESC
+            LIMIT ?
+        ''',
+        'params': ('active', '2100-01-01 00:00:00', 1, 51),
+        'indexed': ['t', 'u'],
+        'allow_sort': False
+    },
+    'get_task_submissions': {
+        'sql': '''
+            SELECT ts.*, u.username as submitter_username
+            FROM task_submissions ts
+            JOIN users u ON ts.submitter_id = u.id
+            WHERE ts.task_id = ? AND (ts.submitted_at, ts.id) < (?, ?)
+            ORDER BY ts.submitted_at DESC, ts.id DESC
+            LIMIT ?
+        ''',
+        'params': (1, '2100-01-01 00:00:00', 1, 51),
+        'indexed': ['ts', 'u'],
+        'allow_sort': False
+    },
+    'get_user_tasks_created': {
+        'sql': '''
+            SELECT t.*, u.username as creator_username
+            FROM tasks t
+            JOIN users u ON t.creator_id = u.id
+            WHERE t.creator_id = ? AND (t.created_at, t.id) < (?, ?)
+            ORDER BY t.created_at DESC, t.id DESC
+            LIMIT ?
+        ''',
+        'params': (1, '2100-01-01 00:00:00', 1, 51),
+        'indexed': ['t', 'u'],
+        'allow_sort': False
+    },
+    'get_user_tasks_completed': {
+        'sql': '''
+            SELECT t.*, u.username as creator_username, s.submitted_at, s.image_url,
+                   s.id as submission_id
+            FROM task_submissions s
+            JOIN tasks t ON t.id = s.task_id
+            JOIN users u ON t.creator_id = u.id
+            WHERE s.submitter_id = ? AND s.status = 'accepted' AND (s.submitted_at, s.id) < (?, ?)
+            ORDER BY s.submitted_at DESC, s.id DESC
+            LIMIT ?
+        ''',
+        'params': (1, '2100-01-01 00:00:00', 1, 51),
+        'indexed': ['t', 'u', 's'],
+        'allow_sort': False
+    },
+    'get_leaderboard': {
+        'sql': '''
+            SELECT id, username, coin_balance, completed_tasks
+            FROM users
+            ORDER BY coin_balance DESC, completed_tasks DESC, username ASC
+            LIMIT ?
+        ''',
+        'params': (100,),
+        'indexed': ['users'],
+        'allow_sort': False
+    },
+    'get_user_rank': {
+        'sql': '''
+            SELECT COUNT(*) FROM users
+            WHERE coin_balance > ?
+            OR (coin_balance = ? AND completed_tasks > ?)
+            OR (coin_balance = ? AND completed_tasks = ? AND username < ?)
+        ''',
+        'params': (200, 200, 0, 200, 0, 'm'),
+        'indexed': ['users'],
+        'allow_sort': True
+    },
+    'delete_task_submission_count': {
+        'sql': 'SELECT COUNT(*) FROM task_submissions WHERE task_id = ?',
+        'params': (1,),
+        'indexed': ['task_submissions'],
+        'allow_sort': False
+    },
+    'get_tasks_by_ids': {
+        'sql': '''
+            SELECT t.*, u.username as creator_username
+            FROM tasks t
+            JOIN users u ON t.creator_id = u.id
+            WHERE t.id IN (?, ?, ?)
+        ''',
+        'params': (1, 2, 3),
+        'indexed': ['t', 'u'],
+        'allow_sort': True
+    },
+    'is_image_in_use': {
+        'sql': '''
+            SELECT 1 FROM task_submissions
+            WHERE submitter_id = ? AND image_url LIKE ?
+            LIMIT 1
+        ''',
+        'params': (1, '%/uploads/x.jpg%'),
+        'indexed': ['task_submissions'],
+        'allow_sort': False
+    },
+    'claim_notifications': {
+        'sql': '''
+            SELECT id FROM notification_outbox
+            WHERE status = 'pending' AND next_attempt_at <= ?
+            ORDER BY next_attempt_at
+            LIMIT ?
+        ''',
+        'params': (0.0, 100),
+        'indexed': ['notification_outbox'],
+        'allow_sort': False
+    },
+    'get_events': {
+        'sql': '''
+            SELECT id, topic, user_id, latitude, longitude, data
+            FROM event_log
+            WHERE id > ? AND id <= ? AND (user_id = ? OR user_id IS NULL)
+            ORDER BY id
+            LIMIT ?
+        ''',
+        'params': (0, 100, 1, 1000),
+        'indexed': ['event_log'],
+        'allow_sort': False
+    },
+    'get_nearby_tasks': {
+        'sql': '''
+            SELECT t.*, u.username as creator_username
+            FROM tasks_rtree r
+            CROSS JOIN tasks t ON t.id = r.id
+            JOIN users u ON t.creator_id = u.id
+            WHERE r.max_lat >= ? AND r.min_lat <= ?
+            AND r.max_lng >= ? AND r.min_lng <= ?
+            AND t.status = 'active'
+        ''',
+        'params': (0.0, 1.0, 0.0, 1.0),
+        'indexed': ['t', 'u'],
+        'allow_sort': True,
+        # The R*Tree must drive the join with all four box constraints
+        'expect': ['SCAN r VIRTUAL TABLE INDEX 2:']
+    },
+}
+
+def explain(conn: sqlite3.Connection, sql: str, params: tuple = ()) -> List[str]:
+    """Get the EXPLAIN QUERY PLAN detail lines for a statement"""
+    return [row[3] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()]
+
+def check_query_plans(conn: sqlite3.Connection) -> List[str]:
+    """Check every QUERY_PLAN_CHECKS entry; returns a list of regressions (empty if all pass)"""
+    problems = []
+    for name, check in QUERY_PLAN_CHECKS.items():
+        plan = explain(conn, check['sql'], check['params'])
+        for detail in plan:
+            for alias in check['indexed']:
+                # Older SQLite prints "SCAN TABLE tasks AS t", newer prints "SCAN t";
+                # an ordered walk of an index ("SCAN t USING INDEX") is allowed
+                if re.match(rf'SCAN (TABLE \w+ AS )?(TABLE )?{alias}\b(?!.*USING)', detail):
+                    problems.append(f'{name}: full scan of {alias} ({detail})')
+            if not check['allow_sort'] and 'TEMP B-TREE' in detail:
+                problems.append(f'{name}: sort not served by an index ({detail})')
+        for fragment in check.get('expect', []):
+            if not any(fragment in detail for detail in plan):
+                problems.append(f'{name}: expected "{fragment}" in plan {plan}')
+    return problems
+
+def main(argv: List[str] = None) -> int:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Apply SpaceTask database migrations')
+    parser.add_argument('--db', default=os.getenv('DATABASE_PATH', '/app/data/spacetask.db'),
+                        help='SQLite database path (default: $DATABASE_PATH)')
+    parser.add_argument('--check-plans', action='store_true',
+                        help='Fail if a hot query falls back to a full table scan')
+    args = parser.parse_args(argv)
+    
+    directory = os.path.dirname(args.db)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    
+    conn = sqlite3.connect(args.db)
+    try:
+        before = get_version(conn)
+        after = migrate(conn)
+        print(f'Database at {args.db}: schema version {before} -> {after}')
+        
+        if args.check_plans:
+            problems = check_query_plans(conn)
+            for problem in problems:
+                print(f'Query plan regression: {problem}', file=sys.stderr)
+            if problems:
+                return 1
+            print(f'Query plans OK ({len(QUERY_PLAN_CHECKS)} checked)')
+    finally:
+        conn.close()
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
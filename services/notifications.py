@@ -0,0 +1,210 @@
+"""
+Outgoing push notifications.
+
+Request handlers never talk to a push provider. Write events published by
+DatabaseService (see services.events) are turned into rows of the
+notification_outbox table, one per device of the recipient. A separate
+dispatcher process claims due rows in batches, sends each batch with one
+provider call and records the outcome: sent, retried later with exponential
+backoff, or given up on. Tokens the provider rejects are unregistered.
+
+Run the dispatcher with:
+    
+    python -m services.notifications [--db PATH] [--once]
+"""
+
+import argparse
+import json
+import os
+import random
+import signal
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Provider outcomes for one message
+SENT = 'sent'
+RETRY = 'retry'
+INVALID = 'invalid'
+
+# Notification queued for each write event: recipient user, title, body and data
+EVENT_NOTIFICATIONS: Dict[str, Callable[..., Tuple[Optional[int], str, str, Dict[str, Any]]]] = {
+    'submission.created': lambda submission_id, task_id, creator_id, **_: (
+        creator_id, 'New submission', 'Someone submitted a photo for your task',
+        {'type': 'submission.created', 'task_id': task_id, 'submission_id': submission_id}),
+    'submission.accepted': lambda submission_id, task_id, submitter_id, **_: (
+        submitter_id, 'Submission accepted', 'Your photo was accepted and the bounty is yours',
+        {'type': 'submission.accepted', 'task_id': task_id, 'submission_id': submission_id}),
+}
+
+class NotificationQueue:
+    """Event bus subscriber that queues the notification for each write event.
+    
+    Queueing goes through the write queue without waiting for the commit, so
+    it adds no latency to the request that caused the event.
+    """
+    
+    def __init__(self, db):
+        self.db = db
+    
+    def on_event(self, topic: str, **fields: Any):
+        """Queue the notification mapped to a write event, if any"""
+        template = EVENT_NOTIFICATIONS.get(topic)
+        if not template:
+            return
+        user_id, title, body, data = template(**fields)
+        if user_id is not None:
+            self.db.queue_notification(user_id, f"{topic}:{fields.get('submission_id')}", title, body, data)
+
+class StubProvider:
+    """Local stand-in for a push provider, for development and tests.
+    
+    Accepts every message, except that tokens starting with 'invalid' are
+    rejected for good and tokens starting with 'fail' fail transiently. Sent
+    messages are kept in memory and, with log_path, appended there as JSON lines.
+    """
+    
+    def __init__(self, log_path: str = None, latency: float = 0.0):
+        self.log_path = log_path
+        self.latency = latency
+        self.sent: List[Dict[str, Any]] = []
+        self.calls = 0
+    
+    def send(self, messages: List[Dict[str, Any]]) -> Dict[int, Tuple[str, Optional[str]]]:
+        """Send a batch; returns {message id: (outcome, error)}"""
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        
+        results = {}
+        delivered = []
+        for message in messages:
+            token = message['device_token']
+            if token.startswith('invalid'):
+                results[message['id']] = (INVALID, 'Unregistered device token')
+            elif token.startswith('fail'):
+                results[message['id']] = (RETRY, 'Provider unavailable')
+            else:
+                results[message['id']] = (SENT, None)
+                delivered.append(message)
+        
+        self.sent.extend(delivered)
+        if self.log_path and delivered:
+            with open(self.log_path, 'a') as f:
+                for message in delivered:
+                    f.write(json.dumps(message) + '\n')
+        return results
+
+PROVIDERS: Dict[str, Callable[[], Any]] = {
+    'stub': lambda: StubProvider(os.getenv('NOTIFICATION_STUB_LOG') or None,
+                                 float(os.getenv('NOTIFICATION_STUB_LATENCY_MS', 0)) / 1000),
+}
+
+def get_provider(name: str = None):
+    """Build the provider named by NOTIFICATION_PROVIDER (default: stub)"""
+    name = name or os.getenv('NOTIFICATION_PROVIDER', 'stub')
+    if name not in PROVIDERS:
+        raise ValueError(f"Unknown notification provider '{name}'; expected one of: {', '.join(PROVIDERS)}")
+    return PROVIDERS[name]()
+
+class NotificationDispatcher:
+    """Sends queued notifications in batches with retry and exponential backoff"""
+    
+    def __init__(self, db, provider, batch_size: int = None, max_attempts: int = None,
+                 backoff_base: float = None, backoff_max: float = None, lease: float = None):
+        self.db = db
+        self.provider = provider
+        self.batch_size = batch_size or int(os.getenv('NOTIFICATION_BATCH_SIZE', 100))
+        self.max_attempts = max_attempts or int(os.getenv('NOTIFICATION_MAX_ATTEMPTS', 6))
+        self.backoff_base = backoff_base if backoff_base is not None else float(os.getenv('NOTIFICATION_BACKOFF_BASE', 2))
+        self.backoff_max = backoff_max if backoff_max is not None else float(os.getenv('NOTIFICATION_BACKOFF_MAX', 900))
+        self.lease = lease if lease is not None else float(os.getenv('NOTIFICATION_LEASE', 60))
+        self.sent = 0
+        self.retried = 0
+        self.failed = 0
+    
+    def backoff(self, attempts: int) -> float:
+        """Delay before the next attempt: doubling per attempt, capped, with jitter"""
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (attempts - 1))
+        return delay * random.uniform(0.5, 1.0)
+    
+    def dispatch_once(self) -> int:
+        """Claim, send and record one batch; returns how many notifications it held"""
+        batch = self.db.claim_notifications(self.batch_size, self.lease)
+        if not batch:
+            return 0
+        
+        messages = [dict(row, data=json.loads(row['data']) if row['data'] else {}) for row in batch]
+        try:
+            results = self.provider.send(messages)
+        except Exception as e:
+            results = {message['id']: (RETRY, f'{type(e).__name__}: {e}') for message in messages}
+        
+        now = time.time()
+        sent, retry, failed, invalid_tokens = [], [], [], []
+        for message in messages:
+            outcome, error = results.get(message['id'], (RETRY, 'No result from provider'))
+            if outcome == SENT:
+                sent.append(message['id'])
+            elif outcome == INVALID:
+                failed.append((message['id'], error))
+                invalid_tokens.append(message['device_token'])
+            elif message['attempts'] >= self.max_attempts:
+                failed.append((message['id'], error))
+            else:
+                retry.append((message['id'], now + self.backoff(message['attempts']), error))
+        
+        self.db.finish_notifications(sent, retry, failed, invalid_tokens)
+        self.sent += len(sent)
+        self.retried += len(retry)
+        self.failed += len(failed)
+        return len(batch)
+    
+    def run(self, stop: threading.Event, poll_interval: float = None, retention: float = None):
+        """Dispatch until stop is set, pruning finished notifications about once an hour"""
+        poll_interval = poll_interval if poll_interval is not None else float(os.getenv('NOTIFICATION_POLL_INTERVAL', 1))
+        retention = retention if retention is not None else float(os.getenv('NOTIFICATION_RETENTION_DAYS', 7)) * 86400
+        next_prune = 0.0
+        while not stop.is_set():
+            if time.monotonic() >= next_prune:
+                self.db.prune_notifications(retention)
+                next_prune = time.monotonic() + 3600
+            
+            # Keep draining while batches come back full
+            if self.dispatch_once() < self.batch_size:
+                stop.wait(poll_interval)
+    
+    def stats(self) -> Dict[str, int]:
+        """Dispatch counters"""
+        return {'sent': self.sent, 'retried': self.retried, 'failed': self.failed}
+
+def main(argv: List[str] = None) -> int:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Send queued SpaceTask push notifications')
+    parser.add_argument('--db', default=os.getenv('DATABASE_PATH', '/app/data/spacetask.db'),
+                        help='SQLite database path (default: $DATABASE_PATH)')
+    parser.add_argument('--provider', default=None, help='Push provider (default: $NOTIFICATION_PROVIDER or stub)')
+    parser.add_argument('--once', action='store_true', help='Send everything that is due, then exit')
+    args = parser.parse_args(argv)
+    
+    from services.database import DatabaseService
+    
+    db = DatabaseService(args.db)
+    dispatcher = NotificationDispatcher(db, get_provider(args.provider))
+    
+    if args.once:
+        while dispatcher.dispatch_once():
+            pass
+    else:
+        stop = threading.Event()
+        signal.signal(signal.SIGTERM, lambda *_: stop.set())
+        signal.signal(signal.SIGINT, lambda *_: stop.set())
+        print(f'Dispatching notifications from {args.db}')
+        dispatcher.run(stop)
+    
+    print(json.dumps(dispatcher.stats()))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
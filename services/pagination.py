@@ -0,0 +1,46 @@
+import base64
+import json
+from typing import Any, List, Optional, Sequence, Tuple
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 100
+
+def encode_cursor(key: Sequence[Any]) -> str:
+    """Encode a (sort value, id) key as an opaque URL-safe cursor"""
+    raw = json.dumps(list(key), separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor: Optional[str]) -> Optional[Tuple[Any, int]]:
+    """Decode a cursor produced by encode_cursor; raises ValueError if it is malformed"""
+    if not cursor:
+        return None
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        key = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(key, list) or len(key) != 2 or not _bindable(key[0], (str, int, float)) \
+            or not _bindable(key[1], (int,)):
+        raise ValueError('Invalid cursor')
+    return key[0], key[1]
+
+def _bindable(value: Any, types: tuple) -> bool:
+    """Check a decoded cursor value is one of types and fits a SQLite parameter (bools and huge ints don't)"""
+    if isinstance(value, bool) or not isinstance(value, types):
+        return False
+    return not isinstance(value, int) or -2 ** 63 <= value < 2 ** 63
+
+def parse_page_args(args, default: int = DEFAULT_PAGE_SIZE, maximum: int = MAX_PAGE_SIZE) -> Tuple[int, Optional[Tuple[Any, int]]]:
+    """Read ?limit= and ?cursor= from request args, clamping limit to [1, maximum]"""
+    limit = args.get('limit', default=default, type=int)
+    limit = max(1, min(limit, maximum))
+    cursor = decode_cursor(args.get('cursor'))
+    return limit, cursor
+
+def paginate(rows: List[dict], limit: int, sort_column: str, id_column: str = 'id') -> Tuple[List[dict], Optional[str]]:
+    """Trim a limit + 1 fetch to one page and build the cursor for the next one"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    last = rows[-1]
+    return rows, encode_cursor((last[sort_column], last[id_column]))
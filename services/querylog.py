@@ -0,0 +1,237 @@
+"""
+Per-statement SQL timing and a slow-query log.
+
+Connections opened by ConnectionPool.connect are InstrumentedConnections,
+whose cursors time every statement: the execute call plus the fetch that
+follows it, which is where SQLite does the rest of a query's work. Timings
+are aggregated per normalized statement (literals and IN lists folded into
+placeholders). Statements slower than SLOW_QUERY_MS are logged as warnings
+with their parameter shape, and the first time a statement is slow its
+EXPLAIN QUERY PLAN is captured and kept with the aggregate.
+
+Each worker's aggregates ship with its metrics snapshot, and
+GET /api/admin/queries merges them into a top-N list.
+"""
+
+import functools
+import logging
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List
+
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+# Statements EXPLAIN QUERY PLAN is meaningful for
+EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE', 'WITH')
+
+# Sort keys accepted by top_statements
+SORT_KEYS = ('total_ms', 'max_ms', 'avg_ms', 'count', 'slow')
+
+_WHITESPACE = re.compile(r'\s+')
+_LITERALS = re.compile(r"'(?:[^']|'')*'|(?<![\w.])\d+(?:\.\d+)?\b")
+_IN_LISTS = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+
+@functools.lru_cache(maxsize=2048)
+def normalize(sql: str) -> str:
+    """Collapse whitespace and replace literals and placeholder lists, so one query shape has one key"""
+    sql = _LITERALS.sub('?', _WHITESPACE.sub(' ', sql).strip())
+    return _IN_LISTS.sub('(?, ...)', sql)
+
+def shape_key(params: Any) -> tuple:
+    """Cheap hashable key of the bound parameters' types (names too, for named parameters)"""
+    if not params:
+        return ()
+    if isinstance(params, dict):
+        return tuple((key, type(value)) for key, value in params.items())
+    return tuple(map(type, params))
+
+def param_shape(key: tuple) -> str:
+    """Readable form of a shape_key, with runs compressed ('int, float x 4')"""
+    if key and isinstance(key[0], tuple):
+        return ', '.join(f'{name}: {_type_name(kind)}' for name, kind in key)
+    runs = []
+    for kind in key:
+        name = _type_name(kind)
+        if runs and runs[-1][0] == name:
+            runs[-1][1] += 1
+        else:
+            runs.append([name, 1])
+    return ', '.join(name if count == 1 else f'{name} x {count}' for name, count in runs)
+
+def _type_name(kind: type) -> str:
+    return 'null' if kind is type(None) else kind.__name__
+
+class QueryLog:
+    """Aggregated statement timings for this process"""
+    
+    def __init__(self, threshold_ms: float = None, max_statements: int = None, enabled: bool = None):
+        self.threshold = (threshold_ms if threshold_ms is not None else float(os.getenv('SLOW_QUERY_MS', 100))) / 1000
+        self.max_statements = max_statements or int(os.getenv('QUERY_LOG_MAX_STATEMENTS', 500))
+        self.enabled = enabled if enabled is not None else os.getenv('QUERY_LOG', 'true').lower() != 'false'
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+    
+    def _reset(self):
+        """Start empty; used at startup and in a forked child"""
+        self._lock = threading.Lock()
+        self._statements: Dict[str, Dict[str, Any]] = {}
+        self.dropped = 0
+    
+    def record(self, conn: sqlite3.Connection, sql: str, params: Any, elapsed: float, rows: int = 1):
+        """Add one statement execution (rows is the parameter sets of an executemany); log it and capture its plan if it was slow"""
+        key = normalize(sql)
+        shape = shape_key(params)
+        slow = elapsed >= self.threshold
+        with self._lock:
+            entry = self._statements.get(key)
+            if entry is None:
+                if len(self._statements) >= self.max_statements:
+                    self.dropped += 1
+                    return
+                entry = self._statements[key] = {'sql': key, 'count': 0, 'rows': 0, 'total_ms': 0.0,
+                                                 'max_ms': 0.0, 'slow': 0, 'param_shapes': {}, 'plan': None}
+            entry['count'] += 1
+            entry['rows'] += rows
+            entry['total_ms'] += elapsed * 1000
+            entry['max_ms'] = max(entry['max_ms'], elapsed * 1000)
+            if shape not in entry['param_shapes'] and len(entry['param_shapes']) < 5:
+                entry['param_shapes'][shape] = None
+            capture_plan = False
+            if slow:
+                entry['slow'] += 1
+                capture_plan = entry['plan'] is None and key.split(' ', 1)[0].upper() in EXPLAINABLE
+                if capture_plan:
+                    entry['plan'] = []  # Claimed; filled in below, outside the lock
+        
+        if not slow:
+            return
+        logger.warning('Slow query (%.1f ms, params: %s): %s', elapsed * 1000, param_shape(shape) or 'none', key)
+        if capture_plan:
+            entry['plan'] = explain(conn, sql, params)
+            logger.warning('Query plan for %s: %s', key, '; '.join(entry['plan']))
+    
+    def snapshot(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """The statements with the most total time, for the metrics snapshot"""
+        with self._lock:
+            entries = sorted(self._statements.values(), key=lambda e: e['total_ms'], reverse=True)[:limit]
+            return [dict(entry, param_shapes=[param_shape(shape) for shape in entry['param_shapes']])
+                    for entry in entries]
+    
+    def clear(self):
+        """Drop every aggregate"""
+        with self._lock:
+            self._statements.clear()
+            self.dropped = 0
+
+def explain(conn: sqlite3.Connection, sql: str, params: Any) -> List[str]:
+    """EXPLAIN QUERY PLAN detail lines for a statement, run uninstrumented on the same connection"""
+    try:
+        cursor = sqlite3.Cursor(conn)
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params or ())
+        return [row[3] for row in cursor.fetchall()]
+    except sqlite3.Error as e:
+        return [f'unavailable: {e}']
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """Cursor that times each statement together with the fetch that follows it"""
+    
+    _pending = None
+    
+    def execute(self, sql: str, parameters: Any = ()):
+        self._finish()
+        started = time.perf_counter()
+        super().execute(sql, parameters)
+        self._pending = (sql, parameters, time.perf_counter() - started, 1)
+        if self.description is None:
+            self._finish()  # No rows to fetch
+        return self
+    
+    def executemany(self, sql: str, seq_of_parameters: Iterable[Any]):
+        self._finish()
+        rows = list(seq_of_parameters)
+        started = time.perf_counter()
+        super().executemany(sql, rows)
+        self._pending = (sql, rows[0] if rows else (), time.perf_counter() - started, max(1, len(rows)))
+        self._finish()
+        return self
+    
+    def fetchone(self):
+        started = time.perf_counter()
+        row = super().fetchone()
+        self._finish(time.perf_counter() - started)
+        return row
+    
+    def fetchmany(self, *args, **kwargs):
+        started = time.perf_counter()
+        rows = super().fetchmany(*args, **kwargs)
+        self._finish(time.perf_counter() - started)
+        return rows
+    
+    def fetchall(self):
+        started = time.perf_counter()
+        rows = super().fetchall()
+        self._finish(time.perf_counter() - started)
+        return rows
+    
+    def close(self):
+        self._finish()
+        super().close()
+    
+    def _finish(self, fetch_time: float = 0.0):
+        """Record the pending statement, if any"""
+        pending = self._pending
+        if pending is not None:
+            self._pending = None
+            sql, params, elapsed, rows = pending
+            query_log.record(self.connection, sql, params, elapsed + fetch_time, rows)
+
+class InstrumentedConnection(sqlite3.Connection):
+    """Connection whose cursors, including those behind execute shortcuts, are InstrumentedCursors"""
+    
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+    
+    def execute(self, sql: str, parameters: Any = ()):
+        return self.cursor().execute(sql, parameters)
+    
+    def executemany(self, sql: str, seq_of_parameters: Iterable[Any]):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+def connection_factory() -> type:
+    """Connection class for ConnectionPool.connect"""
+    return InstrumentedConnection if query_log.enabled else sqlite3.Connection
+
+def top_statements(limit: int = 20, sort: str = 'total_ms') -> List[Dict[str, Any]]:
+    """Statement aggregates merged across every live worker, ordered by sort (see SORT_KEYS)"""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for report in metrics.reports('queries'):
+        for entry in report:
+            current = merged.get(entry['sql'])
+            if current is None:
+                merged[entry['sql']] = dict(entry, param_shapes=list(entry['param_shapes']),
+                                            rows=entry.get('rows', entry['count']))
+                continue
+            current['count'] += entry['count']
+            current['rows'] += entry.get('rows', entry['count'])
+            current['total_ms'] += entry['total_ms']
+            current['max_ms'] = max(current['max_ms'], entry['max_ms'])
+            current['slow'] += entry['slow']
+            current['plan'] = current['plan'] or entry['plan']
+            for shape in entry['param_shapes']:
+                if shape not in current['param_shapes'] and len(current['param_shapes']) < 5:
+                    current['param_shapes'].append(shape)
+    
+    for entry in merged.values():
+        entry['avg_ms'] = entry['total_ms'] / entry['count'] if entry['count'] else 0.0
+        for key in ('total_ms', 'max_ms', 'avg_ms'):
+            entry[key] = round(entry[key], 3)
+    return sorted(merged.values(), key=lambda e: e[sort], reverse=True)[:limit]
+
+# One query log per process
+query_log = QueryLog()
+metrics.register_report('queries', query_log.snapshot)
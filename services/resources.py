@@ -0,0 +1,46 @@
+"""
+CPU limits as seen from inside a container.
+
+os.cpu_count() and the affinity mask report the host's cores, but Docker's
+``cpus:`` limit is a CFS quota in the process's cgroup. Sizing worker pools
+from the host count oversubscribes a container limited to a fraction of it.
+"""
+
+import math
+import os
+from typing import Optional
+
+# cgroup v2 exposes "<quota> <period>" (quota "max" when unlimited); v1 has two files
+CGROUP_V2_CPU_MAX = '/sys/fs/cgroup/cpu.max'
+CGROUP_V1_CPU_DIRS = ('/sys/fs/cgroup/cpu', '/sys/fs/cgroup/cpu,cpuacct')
+
+def _read(path: str) -> Optional[str]:
+    try:
+        with open(path) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def cgroup_cpu_quota() -> Optional[float]:
+    """CPUs allowed by the cgroup quota (0.5 for cpus: '0.5'), or None when unlimited"""
+    cpu_max = _read(CGROUP_V2_CPU_MAX)
+    if cpu_max:
+        quota, _, period = cpu_max.partition(' ')
+        if quota != 'max' and period:
+            return int(quota) / int(period)
+        return None
+    
+    for directory in CGROUP_V1_CPU_DIRS:
+        quota = _read(os.path.join(directory, 'cpu.cfs_quota_us'))
+        period = _read(os.path.join(directory, 'cpu.cfs_period_us'))
+        if quota and period and int(quota) > 0:
+            return int(quota) / int(period)
+    return None
+
+def available_cpus() -> int:
+    """Whole CPUs this process may use: the affinity mask capped by the cgroup quota, rounded up"""
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else (os.cpu_count() or 1)
+    quota = cgroup_cpu_quota()
+    if quota is not None:
+        cores = min(cores, math.ceil(quota))
+    return max(1, cores)
@@ -0,0 +1,364 @@
+"""
+Server-sent event stream of per-user and per-area updates.
+
+Web workers append stream-worthy write events to the event_log table (see
+EventLog, subscribed to services.events). A separate asyncio server tails that
+table and pushes each event to the connected clients it concerns, so thousands
+of idle EventSource connections cost one coroutine each instead of a worker
+thread each:
+    
+    GET /api/events?token=<jwt>[&lat=..&lng=..&radius=km]
+
+streams the user's own events (a new submission on their task, their
+submission accepted, their balance changed) and, with lat/lng, new tasks
+within radius km. A reconnect with Last-Event-ID replays what was missed;
+if those events have already been dropped from the log, the stream starts with
+a ``reset`` event telling the client to refetch its state.
+
+Run the server with:
+    
+    python -m services.sse [--db PATH] [--host HOST] [--port PORT]
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import signal
+import sys
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from services.geo import bounding_boxes, haversine_km
+
+MAX_RADIUS_KM = 50.0
+
+# Stream entries for each write event: (recipient user or None for an area event, latitude, longitude, data)
+STREAM_EVENTS: Dict[str, Callable[..., List[Tuple[Optional[int], Optional[float], Optional[float], Dict[str, Any]]]]] = {
+    'submission.created': lambda submission_id, task_id, creator_id, **_: [
+        (creator_id, None, None, {'task_id': task_id, 'submission_id': submission_id})],
+    'submission.accepted': lambda submission_id, task_id, submitter_id, **_: [
+        (submitter_id, None, None, {'task_id': task_id, 'submission_id': submission_id})],
+    'user.balance_changed': lambda user_id, **_: [
+        (user_id, None, None, {'user_id': user_id})],
+    'task.created': lambda task_id, latitude, longitude, **_: [
+        (None, latitude, longitude, {'task_id': task_id, 'latitude': latitude, 'longitude': longitude})],
+}
+
+class EventLog:
+    """Event bus subscriber that appends stream events to the event_log table.
+    
+    Appends go through the write queue without waiting for the commit. Only the
+    newest EVENT_LOG_MAX_ROWS events are kept for Last-Event-ID replay.
+    """
+    
+    def __init__(self, db, max_rows: int = None):
+        self.db = db
+        self.max_rows = max_rows or int(os.getenv('EVENT_LOG_MAX_ROWS', 100000))
+    
+    def on_event(self, topic: str, **fields: Any):
+        """Log the stream entries mapped to a write event, if any"""
+        entries = STREAM_EVENTS.get(topic)
+        if entries:
+            self.db.log_events([(topic, *entry) for entry in entries(**fields)], self.max_rows)
+
+def format_event(event: Dict[str, Any]) -> bytes:
+    """Encode a logged event as an SSE frame"""
+    return f"id: {event['id']}\nevent: {event['topic']}\ndata: {event['data']}\n\n".encode('utf-8')
+
+def grid_cell(latitude: float, longitude: float) -> Tuple[int, int]:
+    """One-degree grid cell containing a point"""
+    return math.floor(latitude), math.floor(longitude)
+
+class Client:
+    """One connected stream and what it subscribed to"""
+    
+    __slots__ = ('user_id', 'area', 'cells', 'queue')
+    
+    def __init__(self, user_id: int, area: Optional[Tuple[float, float, float]], max_queue: int):
+        self.user_id = user_id
+        self.area = area
+        self.cells: Set[Tuple[int, int]] = set()
+        if area:
+            for min_lat, max_lat, min_lng, max_lng in bounding_boxes(*area):
+                for lat in range(math.floor(min_lat), math.floor(max_lat) + 1):
+                    for lng in range(math.floor(min_lng), math.floor(max_lng) + 1):
+                        self.cells.add((lat, lng))
+        self.queue: 'asyncio.Queue[Optional[bytes]]' = asyncio.Queue(max_queue)
+    
+    def wants(self, event: Dict[str, Any]) -> bool:
+        """Whether an event from the log concerns this client"""
+        if event['user_id'] is not None:
+            return event['user_id'] == self.user_id
+        if self.area is None or event['latitude'] is None:
+            return False
+        latitude, longitude, radius_km = self.area
+        return haversine_km(latitude, longitude, event['latitude'], event['longitude']) <= radius_km
+    
+    def send(self, frame: bytes) -> bool:
+        """Queue a frame; returns False (and asks the stream to close) if the client has fallen behind"""
+        try:
+            self.queue.put_nowait(frame)
+            return True
+        except asyncio.QueueFull:
+            # A slow reader reconnects with Last-Event-ID and catches up from the log
+            self.close()
+            return False
+    
+    def close(self):
+        """Drop pending frames and end the stream"""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(None)
+
+class EventStreamServer:
+    """Tails event_log and fans events out to connected clients.
+    
+    Clients are indexed by user and by one-degree grid cell, so each event only
+    touches the connections it concerns. Each frame is encoded once.
+    """
+    
+    def __init__(self, db, auth, poll_interval: float = None, heartbeat: float = None,
+                 max_clients: int = None, max_queue: int = None):
+        self.db = db
+        self.auth = auth
+        self.poll_interval = poll_interval if poll_interval is not None else float(os.getenv('EVENTS_POLL_INTERVAL', 0.25))
+        self.heartbeat = heartbeat if heartbeat is not None else float(os.getenv('EVENTS_HEARTBEAT', 15))
+        self.max_clients = max_clients or int(os.getenv('EVENTS_MAX_CLIENTS', 10000))
+        self.max_queue = max_queue or int(os.getenv('EVENTS_CLIENT_QUEUE', 256))
+        self.by_user: Dict[int, Set[Client]] = {}
+        self.by_cell: Dict[Tuple[int, int], Set[Client]] = {}
+        self.clients = 0
+        self.last_id = 0
+        self.delivered = 0
+        self.dropped = 0
+    
+    # Subscriptions
+    def add(self, client: Client):
+        """Start delivering events to a client"""
+        self.by_user.setdefault(client.user_id, set()).add(client)
+        for cell in client.cells:
+            self.by_cell.setdefault(cell, set()).add(client)
+        self.clients += 1
+    
+    def remove(self, client: Client):
+        """Stop delivering events to a client"""
+        self._discard(self.by_user, client.user_id, client)
+        for cell in client.cells:
+            self._discard(self.by_cell, cell, client)
+        self.clients -= 1
+    
+    @staticmethod
+    def _discard(index: Dict[Any, Set[Client]], key: Any, client: Client):
+        clients = index.get(key)
+        if clients is not None:
+            clients.discard(client)
+            if not clients:
+                del index[key]
+    
+    def dispatch(self, event: Dict[str, Any]):
+        """Deliver one logged event to every client it concerns"""
+        if event['user_id'] is not None:
+            candidates = self.by_user.get(event['user_id'], ())
+        elif event['latitude'] is not None:
+            candidates = self.by_cell.get(grid_cell(event['latitude'], event['longitude']), ())
+        else:
+            candidates = ()
+        
+        frame = None
+        for client in list(candidates):
+            if not client.wants(event):
+                continue
+            frame = frame or format_event(event)
+            if client.send(frame):
+                self.delivered += 1
+            else:
+                self.dropped += 1
+    
+    async def tail(self):
+        """Poll the log for new events forever"""
+        _, self.last_id = await asyncio.to_thread(self.db.get_event_bounds)
+        while True:
+            try:
+                events = await asyncio.to_thread(self.db.get_events, self.last_id)
+            except Exception as e:
+                print(f'Reading the event log failed: {e}', file=sys.stderr)
+                await asyncio.sleep(self.poll_interval)
+                continue
+            for event in events:
+                self.dispatch(event)
+                self.last_id = event['id']
+            if len(events) < 1000:
+                await asyncio.sleep(self.poll_interval)
+    
+    # HTTP
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Serve one HTTP connection"""
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 10)
+            headers = {}
+            while True:
+                line = await asyncio.wait_for(reader.readline(), 10)
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            
+            method, target, _ = request_line.decode('latin-1').split(' ', 2)
+            url = urlsplit(target)
+            if method == 'OPTIONS':
+                await self._respond(writer, 204, None)
+            elif method != 'GET':
+                await self._respond(writer, 405, {'error': 'Method not allowed'})
+            elif url.path == '/health':
+                await self._respond(writer, 200, self.stats())
+            elif url.path == '/api/events':
+                await self._stream(reader, writer, headers, parse_qs(url.query))
+            else:
+                await self._respond(writer, 404, {'error': 'Not found'})
+        except (asyncio.TimeoutError, asyncio.CancelledError, ConnectionError, ValueError):
+            # CancelledError: the server is shutting down
+            pass
+        finally:
+            writer.close()
+    
+    async def _respond(self, writer: asyncio.StreamWriter, status: int, body: Optional[Dict[str, Any]]):
+        """Send a small JSON response and end the connection"""
+        reasons = {200: 'OK', 204: 'No Content', 400: 'Bad Request', 401: 'Unauthorized',
+                   404: 'Not Found', 405: 'Method Not Allowed', 503: 'Service Unavailable'}
+        payload = json.dumps(body).encode('utf-8') if body is not None else b''
+        writer.write((f'HTTP/1.1 {status} {reasons[status]}\r\n'
+                      f'Content-Type: application/json\r\n'
+                      f'Content-Length: {len(payload)}\r\n'
+                      f'Access-Control-Allow-Origin: *\r\n'
+                      f'Access-Control-Allow-Headers: Authorization, Last-Event-ID\r\n'
+                      f'Connection: close\r\n\r\n').encode('latin-1') + payload)
+        await writer.drain()
+    
+    async def _stream(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, headers: Dict[str, str], query: Dict[str, List[str]]):
+        """Authenticate, subscribe and stream until the client goes away"""
+        auth_header = headers.get('authorization', '')
+        token = auth_header[7:] if auth_header.startswith('Bearer ') else query.get('token', [None])[0]
+        payload = self.auth.verify_token(token) if token else None
+        if not payload:
+            await self._respond(writer, 401, {'error': 'Authentication required'})
+            return
+        
+        area = None
+        if 'lat' in query or 'lng' in query:
+            try:
+                latitude = float(query['lat'][0])
+                longitude = float(query['lng'][0])
+                radius_km = float(query.get('radius', ['5'])[0])
+            except (KeyError, ValueError):
+                await self._respond(writer, 400, {'error': 'lat and lng must both be numbers'})
+                return
+            if not (-90 <= latitude <= 90 and -180 <= longitude <= 180 and 0 < radius_km <= MAX_RADIUS_KM):
+                await self._respond(writer, 400, {'error': f'Invalid location or radius (max {MAX_RADIUS_KM:g} km)'})
+                return
+            area = (latitude, longitude, radius_km)
+        
+        if self.clients >= self.max_clients:
+            await self._respond(writer, 503, {'error': 'Too many open streams, retry later'})
+            return
+        
+        last_event_id = headers.get('last-event-id') or query.get('last_event_id', [None])[0]
+        
+        # Subscribe before reading the backlog, so nothing falls between replay and live events
+        client = Client(payload['user_id'], area, self.max_queue)
+        self.add(client)
+        replay_up_to = self.last_id
+        watcher = asyncio.create_task(self._watch(reader, client))
+        try:
+            writer.write(b'HTTP/1.1 200 OK\r\n'
+                         b'Content-Type: text/event-stream\r\n'
+                         b'Cache-Control: no-cache\r\n'
+                         b'Connection: keep-alive\r\n'
+                         b'X-Accel-Buffering: no\r\n'
+                         b'Access-Control-Allow-Origin: *\r\n\r\n'
+                         b'retry: 3000\n\n')
+            if last_event_id and last_event_id.isdigit():
+                await self._replay(writer, client, int(last_event_id), replay_up_to)
+            await writer.drain()
+            
+            while True:
+                try:
+                    frame = await asyncio.wait_for(client.queue.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    frame = b': ping\n\n'
+                if frame is None:
+                    break
+                writer.write(frame)
+                await writer.drain()
+        finally:
+            watcher.cancel()
+            self.remove(client)
+    
+    async def _watch(self, reader: asyncio.StreamReader, client: Client):
+        """End an idle stream as soon as the client disconnects, instead of at the next write"""
+        try:
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        client.close()
+    
+    async def _replay(self, writer: asyncio.StreamWriter, client: Client, after_id: int, up_to_id: int):
+        """Send the client's events logged after after_id, up to where live delivery starts"""
+        oldest, _ = await asyncio.to_thread(self.db.get_event_bounds)
+        if oldest and after_id + 1 < oldest:
+            writer.write(f'event: reset\ndata: {{"oldest_id": {oldest}}}\n\n'.encode('utf-8'))
+        while after_id < up_to_id:
+            events = await asyncio.to_thread(self.db.get_events, after_id, up_to_id, client.user_id)
+            if not events:
+                break
+            for event in events:
+                if client.wants(event):
+                    writer.write(format_event(event))
+            after_id = events[-1]['id']
+            await writer.drain()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Connection and delivery counters"""
+        return {
+            'clients': self.clients,
+            'users': len(self.by_user),
+            'area_cells': len(self.by_cell),
+            'last_event_id': self.last_id,
+            'delivered': self.delivered,
+            'dropped_slow_clients': self.dropped
+        }
+
+async def serve(server: EventStreamServer, host: str, port: int):
+    """Run the HTTP listener and the log tailer until cancelled"""
+    listener = await asyncio.start_server(server.handle, host, port, limit=16 * 1024, backlog=1024)
+    tailer = asyncio.create_task(server.tail())
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stop.set)
+    
+    print(f'Streaming events on {host}:{port}')
+    async with listener:
+        await stop.wait()
+    tailer.cancel()
+
+def main(argv: List[str] = None) -> int:
+    """Command line entry point"""
+    parser = argparse.ArgumentParser(description='Serve the SpaceTask server-sent event stream')
+    parser.add_argument('--db', default=os.getenv('DATABASE_PATH', '/app/data/spacetask.db'),
+                        help='SQLite database path (default: $DATABASE_PATH)')
+    parser.add_argument('--host', default=os.getenv('EVENTS_HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.getenv('EVENTS_PORT', 8001)))
+    args = parser.parse_args(argv)
+    
+    from services.auth import AuthService
+    from services.database import DatabaseService
+    
+    server = EventStreamServer(DatabaseService(args.db), AuthService(os.getenv('JWT_SECRET', 'your-secret-key')))
+    asyncio.run(serve(server, args.host, args.port))
+    return 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,18 +1,153 @@
 import os
+import re
 import uuid
+import hashlib
+import threading
+import multiprocessing
+import time
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from werkzeug.utils import secure_filename
-from PIL import Image
 import io
-from typing import Optional, Tuple
+import logging
+from typing import BinaryIO, Callable, Optional, Tuple
+
+from services.metrics import metrics
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 64 * 1024
+
+# Pillow format names accepted for upload (MPO is how Pillow reports many camera JPEGs)
+ALLOWED_FORMATS = {'JPEG', 'MPO', 'PNG', 'GIF', 'WEBP'}
+
+# Longest side in pixels of each stored variant, largest first
+IMAGE_VARIANTS = {'full': 1200, 'medium': 640, 'thumb': 240}
+
+# Encoder settings per variant file extension
+VARIANT_FORMATS = {
+    'jpg': {'format': 'JPEG', 'quality': 85, 'optimize': True, 'progressive': True},
+    'webp': {'format': 'WEBP', 'quality': 80, 'method': 4}
+}
+
+# Content-addressed filenames start with a SHA-256 hex digest
+CONTENT_HASH = re.compile(r'^[0-9a-f]{64}')
+
+def variant_name(upload_id: str, size: str, extension: str) -> str:
+    """Filename of one variant; the full-size JPEG keeps the plain <id>.jpg name"""
+    suffix = '' if size == 'full' else f"_{size}"
+    return f"{upload_id}{suffix}.{extension}"
+
+def shard_path(filename: str) -> str:
+    """Path of a stored file relative to the upload folder.
+    
+    Content-addressed files live two directory levels down, keyed by the first
+    four hex digits (ab/cd/abcd....jpg), so no directory grows past a few
+    thousand entries. Older uuid-named files stay flat in the upload folder.
+    """
+    if CONTENT_HASH.match(filename):
+        return f"{filename[:2]}/{filename[2:4]}/{filename}"
+    return filename
+
+def resolve_variant(upload_folder: str, filename: str, size: str = 'full', webp: bool = False) -> str:
+    """Pick the stored file to serve for a requested size and format.
+    
+    Returns a path relative to upload_folder. Falls back to the JPEG variant
+    and then to the requested file itself, so uploads saved before variants
+    existed keep working.
+    """
+    upload_id = filename.rsplit('.', 1)[0]
+    candidates = [variant_name(upload_id, size, 'webp')] if webp else []
+    candidates.append(variant_name(upload_id, size, 'jpg'))
+    for candidate in candidates:
+        path = shard_path(candidate)
+        if candidate == filename or os.path.isfile(os.path.join(upload_folder, path)):
+            return path
+    return shard_path(filename)
+
+class UploadRejected(Exception):
+    """Raised when an upload fails validation; status_code is the HTTP status to return"""
+    
+    def __init__(self, message: str, status_code: int = 400):
+        super().__init__(message)
+        self.status_code = status_code
+
+def _process_in_worker(upload_folder: str, max_file_size: int, max_pixels: int, raw_name: str) -> Tuple[str, float]:
+    """Entry point run inside the image process pool; returns the filename and the seconds spent"""
+    started = time.perf_counter()
+    filename = UploadService(upload_folder, max_file_size, max_pixels).process_raw(raw_name)
+    return filename, time.perf_counter() - started
+
+class ImageProcessingPool:
+    """Lazily started process pool for CPU-bound Pillow work, one per web worker.
+    
+    Processes are spawned rather than forked so they never inherit the web
+    worker's threads, sockets or SQLite connections.
+    
+    Done-callbacks run on the pool's result thread, which must never block, so
+    completion work (database writes) goes to one separate thread instead.
+    """
+    
+    def __init__(self, workers: int = None):
+        self.workers = workers or int(os.getenv('IMAGE_WORKERS', 2))
+        self._lock = threading.Lock()
+        self._pid = None
+        self._executor = None
+        self._completions = None
+    
+    def _get_executor(self) -> ProcessPoolExecutor:
+        """Create the pool lazily, and again after a fork"""
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                if self._pid != os.getpid():
+                    self._completions = None
+                self._pid = os.getpid()
+                self._executor = ProcessPoolExecutor(max_workers=self.workers,
+                                                     mp_context=multiprocessing.get_context('spawn'))
+            return self._executor
+    
+    def complete(self, fn, *args) -> Future:
+        """Run fn(*args) on the completion thread"""
+        with self._lock:
+            if self._completions is None or self._pid != os.getpid():
+                self._completions = ThreadPoolExecutor(max_workers=1, thread_name_prefix='upload-completion')
+            return self._completions.submit(fn, *args)
+    
+    def _discard(self, broken: ProcessPoolExecutor):
+        """Drop a broken pool so the next submit starts a fresh one (unless another thread already did)"""
+        with self._lock:
+            if self._executor is broken:
+                self._executor = None
+        broken.shutdown(wait=False, cancel_futures=True)
+    
+    def submit(self, fn, *args) -> Future:
+        """Schedule fn(*args) on the pool.
+        
+        A pool whose child process died (an OOM kill, say) rejects every later
+        job, so it is replaced and the job retried once; a second failure raises.
+        """
+        executor = self._get_executor()
+        try:
+            return executor.submit(fn, *args)
+        except BrokenProcessPool:
+            self._discard(executor)
+        return self._get_executor().submit(fn, *args)
+
+# One image pool per process, shared by every UploadService
+_image_pool = ImageProcessingPool()
 
 class UploadService:
-    def __init__(self, upload_folder: str = "uploads", max_file_size: int = 5 * 1024 * 1024):
+    def __init__(self, upload_folder: str = "uploads", max_file_size: int = 5 * 1024 * 1024,
+                 max_pixels: int = None):
         self.upload_folder = upload_folder
         self.max_file_size = max_file_size
+        self.max_pixels = max_pixels or int(os.getenv('MAX_IMAGE_PIXELS', 40_000_000))
         self.allowed_extensions = {'png', 'jpg', 'jpeg', 'gif', 'webp'}
+        self.incoming_folder = os.path.join(upload_folder, 'incoming')
         
-        # Create upload directory if it doesn't exist
+        # Create upload directories if they don't exist
         os.makedirs(upload_folder, exist_ok=True)
+        os.makedirs(self.incoming_folder, exist_ok=True)
     
     def allowed_file(self, filename: str) -> bool:
         """Check if file extension is allowed"""
@@ -21,6 +156,8 @@ class UploadService:
     
     def validate_image(self, file_data: bytes) -> bool:
         """Validate that the file is actually an image"""
+        from PIL import Image
+        
         try:
             image = Image.open(io.BytesIO(file_data))
             image.verify()
@@ -30,6 +167,8 @@ class UploadService:
     
     def resize_image(self, file_data: bytes, max_width: int = 1200, max_height: int = 1200) -> bytes:
         """Resize image to maximum dimensions while maintaining aspect ratio"""
+        from PIL import Image
+        
         try:
             image = Image.open(io.BytesIO(file_data))
             
@@ -57,33 +196,256 @@ class UploadService:
         if len(file_data) > self.max_file_size:
             return None
         
-        # Generate unique filename
-        file_extension = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else 'jpg'
-        unique_filename = f"{uuid.uuid4().hex}.{file_extension}"
-        
         # Resize image
         resized_data = self.resize_image(file_data)
         
+        # Name the file by its content so re-uploads are stored once
+        file_extension = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else 'jpg'
+        unique_filename = f"{hashlib.sha256(resized_data).hexdigest()}.{file_extension}"
+        
         # Save file
-        file_path = os.path.join(self.upload_folder, unique_filename)
+        file_path = self.content_path(unique_filename)
+        if os.path.exists(file_path):
+            return unique_filename
         try:
-            with open(file_path, 'wb') as f:
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            tmp_path = f"{file_path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'wb') as f:
                 f.write(resized_data)
+            os.replace(tmp_path, file_path)
             return unique_filename
         except Exception:
             return None
     
+    def store_stream(self, stream: BinaryIO, original_filename: str) -> Tuple[str, str]:
+        """Copy an upload to disk in chunks and check its header; returns (upload ID, raw filename).
+        
+        The size limit is enforced while reading, so an oversized body is never
+        fully buffered, and only the image header is parsed before accepting it.
+        Raises UploadRejected if the file is too large or not a supported image.
+        """
+        file_extension = original_filename.rsplit('.', 1)[1].lower() if '.' in original_filename else 'jpg'
+        if file_extension not in self.allowed_extensions:
+            raise UploadRejected('File type not allowed')
+        
+        upload_id = uuid.uuid4().hex
+        raw_path = os.path.join(self.incoming_folder, f"{upload_id}.{file_extension}")
+        part_path = f"{raw_path}.part"
+        
+        try:
+            size = 0
+            with open(part_path, 'wb') as f:
+                while True:
+                    chunk = stream.read(CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    size += len(chunk)
+                    if size > self.max_file_size:
+                        raise UploadRejected('File too large', status_code=413)
+                    f.write(chunk)
+            
+            self.inspect_image(part_path)
+            os.replace(part_path, raw_path)
+            return upload_id, os.path.basename(raw_path)
+        except Exception:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+            raise
+    
+    def inspect_image(self, path: str) -> Tuple[str, Tuple[int, int]]:
+        """Check format and dimensions from the image header only; returns (format, size)"""
+        from PIL import Image
+        
+        try:
+            # Image.open only parses the header; pixel data is decoded lazily
+            with Image.open(path) as image:
+                image_format, size = image.format, image.size
+        except Exception:
+            raise UploadRejected('File is not a valid image')
+        
+        if image_format not in ALLOWED_FORMATS:
+            raise UploadRejected('Image format not supported')
+        if size[0] * size[1] > self.max_pixels:
+            raise UploadRejected('Image dimensions too large')
+        return image_format, size
+    
+    def process_raw(self, raw_name: str) -> str:
+        """Decode a stored upload and write its size variants; returns the full-size JPEG filename.
+        
+        Runs in the image process pool. The file is decoded once (JPEGs at a
+        reduced scale via draft()) and each smaller variant is derived from the
+        previous one. Files are named by the hash of the full-size JPEG, so a
+        duplicate upload is detected with one stat and nothing more is written.
+        Every variant is written atomically and the full-size JPEG last, so once
+        it exists the whole set is complete.
+        
+        Failing to decode the upload raises UploadRejected. Failing to write the
+        variants (a full disk, an encoder missing from Pillow) is a server-side
+        error and is raised as is, after the partial temporary files are removed.
+        """
+        from PIL import Image
+        
+        raw_path = os.path.join(self.incoming_folder, raw_name)
+        largest = IMAGE_VARIANTS['full']
+        # Temporary names are per process so identical uploads processed at once cannot collide
+        tmp_suffix = f".{os.getpid()}.tmp"
+        written = []
+        decoded = False
+        try:
+            self.inspect_image(raw_path)
+            
+            with Image.open(raw_path) as image:
+                if image.format == 'JPEG':
+                    # Let libjpeg decode at 1/2, 1/4 or 1/8 scale when that is still large enough
+                    image.draft('RGB', (largest, largest))
+                
+                # Convert to RGB if necessary
+                if image.mode not in ('RGB', 'L'):
+                    image = image.convert('RGB')
+                
+                # reducing_gap does a cheap integer reduce() before the final LANCZOS pass
+                image.thumbnail((largest, largest), Image.Resampling.LANCZOS, reducing_gap=2.0)
+                
+                full = io.BytesIO()
+                image.save(full, **VARIANT_FORMATS['jpg'])
+                decoded = True
+                content_hash = hashlib.sha256(full.getvalue()).hexdigest()
+                filename = variant_name(content_hash, 'full', 'jpg')
+                
+                # Same processed bytes already stored
+                if os.path.exists(self.content_path(filename)):
+                    os.remove(raw_path)
+                    return filename
+                
+                os.makedirs(os.path.dirname(self.content_path(filename)), exist_ok=True)
+                
+                written.append(self.content_path(filename) + tmp_suffix)
+                with open(written[0], 'wb') as f:
+                    f.write(full.getvalue())
+                
+                for size, max_dimension in IMAGE_VARIANTS.items():
+                    if size != 'full':
+                        image = image.copy()
+                        image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS)
+                    for extension, options in VARIANT_FORMATS.items():
+                        if size == 'full' and extension == 'jpg':
+                            continue
+                        tmp_path = self.content_path(variant_name(content_hash, size, extension)) + tmp_suffix
+                        written.append(tmp_path)
+                        image.save(tmp_path, **options)
+        except UploadRejected:
+            os.remove(raw_path)
+            raise
+        except Exception:
+            for tmp_path in written:
+                try:
+                    os.remove(tmp_path)
+                except FileNotFoundError:
+                    pass
+            os.remove(raw_path)
+            if decoded:
+                raise
+            raise UploadRejected('Image could not be decoded')
+        
+        # The first entry is the full-size JPEG, which is renamed last
+        for tmp_path in reversed(written):
+            os.replace(tmp_path, tmp_path[:-len(tmp_suffix)])
+        os.remove(raw_path)
+        return filename
+    
+    def content_path(self, filename: str) -> str:
+        """Absolute path of a stored file (see shard_path)"""
+        return os.path.join(self.upload_folder, shard_path(filename))
+    
+    def is_stored(self, filename: str) -> bool:
+        """Check that a processed file is present in the store"""
+        return os.path.exists(self.content_path(filename))
+    
+    def process_async(self, raw_name: str, on_done: Callable[[Optional[str], Optional[str]], None]) -> Future:
+        """Process a stored upload in the background.
+        
+        on_done(filename, error) is called on the pool's completion thread when the
+        job finishes (so it may block on database writes); exactly one of
+        filename and error is set.
+        """
+        future = _image_pool.submit(_process_in_worker, self.upload_folder, self.max_file_size,
+                                    self.max_pixels, raw_name)
+        
+        def callback(done: Future):
+            # Pillow runs in another process, so its timing is recorded here
+            try:
+                filename, seconds = done.result()
+            except UploadRejected as e:
+                metrics.inc('image_processing_failures_total')
+                on_done(None, str(e))
+                return
+            except Exception:
+                # Our fault, not the image's: keep the details in the log
+                logger.exception('Processing upload %s failed', raw_name)
+                metrics.inc('image_processing_failures_total')
+                # A worker that died mid-job never got to remove the raw file
+                self.discard_raw(raw_name)
+                on_done(None, 'Image processing failed, please try again')
+                return
+            metrics.observe('image_processing_seconds', seconds)
+            on_done(filename, None)
+        
+        def finish(done: Future):
+            try:
+                callback(done)
+            except Exception:
+                logger.exception('Completing upload %s failed', raw_name)
+        
+        # Only hand off here: this runs on the process pool's result thread
+        future.add_done_callback(lambda done: _image_pool.complete(finish, done))
+        return future
+    
+    def discard_raw(self, raw_name: str):
+        """Remove a raw upload from the incoming folder, if it is still there"""
+        try:
+            os.remove(os.path.join(self.incoming_folder, raw_name))
+        except FileNotFoundError:
+            pass
+    
+    def sweep_incoming(self, older_than_seconds: float) -> int:
+        """Remove raw and partial uploads left in the incoming folder by a crash; returns how many"""
+        cutoff = time.time() - older_than_seconds
+        removed = 0
+        for entry in os.scandir(self.incoming_folder):
+            try:
+                if entry.is_file() and entry.stat().st_mtime < cutoff:
+                    os.remove(entry.path)
+                    removed += 1
+            except FileNotFoundError:
+                pass  # Finished processing meanwhile
+        return removed
+    
     def get_file_url(self, filename: str, base_url: str = "") -> str:
         """Get full URL for uploaded file"""
         return f"{base_url}/uploads/{filename}"
     
+    def get_variant_urls(self, filename: str, base_url: str = "") -> dict:
+        """Get the URL of each size variant of an uploaded file"""
+        url = self.get_file_url(filename, base_url)
+        return {size: f"{url}?size={size}" for size in IMAGE_VARIANTS}
+    
     def delete_file(self, filename: str) -> bool:
-        """Delete uploaded file"""
+        """Delete a stored file and any size variants.
+        
+        Content-addressed files may be shared by several uploads, so callers must
+        only delete once DatabaseService.release_upload reports no references left.
+        """
         try:
-            file_path = os.path.join(self.upload_folder, filename)
-            if os.path.exists(file_path):
-                os.remove(file_path)
-                return True
-            return False
+            upload_id = filename.rsplit('.', 1)[0]
+            names = {filename}
+            names.update(variant_name(upload_id, size, extension)
+                         for size in IMAGE_VARIANTS for extension in VARIANT_FORMATS)
+            deleted = False
+            for name in names:
+                file_path = self.content_path(name)
+                if os.path.exists(file_path):
+                    os.remove(file_path)
+                    deleted = True
+            return deleted
         except Exception:
             return False 
\ No newline at end of file
@@ -0,0 +1,200 @@
+"""
+Single-writer queue for SQLite mutations.
+
+SQLite allows one writer at a time. Instead of every request thread opening its
+own write transaction (and queueing on the database lock with busy_timeout),
+each process funnels its writes through one thread that owns the process's only
+write connection. Whatever jobs are queued when the writer becomes free are run
+in one transaction and committed together (group commit); each job runs inside
+its own SAVEPOINT so one failing job does not undo the others.
+
+The queue serializes writes within one process only. Each web worker and the
+notification dispatcher has its own writer thread, so writers in different
+processes still wait on each other through SQLite's lock and busy_timeout
+(DB_BUSY_TIMEOUT_MS). What the queue removes is the contention between threads
+of the same process.
+
+A job is a function taking a cursor. It may raise WriteAborted(result) to undo
+its own statements and resolve its future with ``result`` (for example False
+when a conditional debit fails). Futures resolve only after the commit.
+"""
+
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from services.database import ConnectionPool
+
+class WriteAborted(Exception):
+    """Raised by a write job to roll back its own statements and return a result"""
+    
+    def __init__(self, result: Any = None):
+        super().__init__(result)
+        self.result = result
+
+class WriteQueue:
+    """Per-process writer thread with group commit.
+    
+    The writer opens its own connection from the pool's settings, outside the
+    pool. With enabled=False (DB_WRITE_QUEUE=false) every job instead runs
+    immediately in its own BEGIN IMMEDIATE transaction on a pooled connection
+    in the calling thread.
+    """
+    
+    def __init__(self, pool: 'ConnectionPool', max_batch: int = None, enabled: bool = None):
+        self.pool = pool
+        self.max_batch = max_batch or int(os.getenv('DB_WRITE_BATCH', 64))
+        if enabled is None:
+            enabled = os.getenv('DB_WRITE_QUEUE', 'true').lower() not in ('0', 'false', 'no')
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self._reset()
+    
+    def _reset(self):
+        """Forget the writer thread; used at startup and after a fork"""
+        self._pid = os.getpid()
+        self._jobs: 'queue.Queue[Tuple[Callable, Future]]' = queue.Queue()
+        self._thread = None
+        self.batches = 0
+        self.jobs = 0
+    
+    def submit(self, job: Callable[[sqlite3.Cursor], Any]) -> Future:
+        """Queue a write job; the future resolves with its return value once committed"""
+        future = Future()
+        with self._lock:
+            # The writer thread does not survive a fork; start a new one in the child
+            if self._pid != os.getpid():
+                self._reset()
+        if not self.enabled:
+            self._run_direct(job, future)
+            return future
+        
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='sqlite-writer', daemon=True)
+                self._thread.start()
+            elif threading.current_thread() is self._thread:
+                raise RuntimeError('Write jobs cannot submit further writes')
+        self._jobs.put((job, future))
+        return future
+    
+    def close(self, timeout: float = 10):
+        """Finish the queued jobs, then stop the writer thread and close its connection.
+        
+        Call before forking (the server's master does), so no child inherits an
+        open SQLite connection; a later submit starts a fresh writer.
+        """
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None or self._pid != os.getpid():
+                return
+            self._jobs.put(None)
+        thread.join(timeout)
+    
+    def run(self, job: Callable[[sqlite3.Cursor], Any]) -> Any:
+        """Submit a job and wait for its result"""
+        return self.submit(job).result()
+    
+    def stats(self) -> Dict[str, Any]:
+        """Batching counters"""
+        return {
+            'enabled': self.enabled,
+            'queued': self._jobs.qsize(),
+            'batches': self.batches,
+            'jobs': self.jobs,
+            'jobs_per_batch': round(self.jobs / self.batches, 2) if self.batches else None
+        }
+    
+    def _run_direct(self, job: Callable, future: Future):
+        """Run one job in its own transaction on the calling thread"""
+        with self.pool.connection() as conn:
+            try:
+                cursor = conn.cursor()
+                cursor.execute('BEGIN IMMEDIATE')
+                try:
+                    result = job(cursor)
+                except WriteAborted as e:
+                    conn.rollback()
+                    future.set_result(e.result)
+                    return
+                conn.commit()
+                with self._lock:
+                    self.batches += 1
+                    self.jobs += 1
+                future.set_result(result)
+            except Exception as e:
+                if conn.in_transaction:
+                    conn.rollback()
+                future.set_exception(e)
+    
+    def _run(self):
+        """Writer thread: take every queued job, run them in one transaction, commit once"""
+        conn = None
+        stopping = False
+        while not stopping:
+            batch = [self._jobs.get()]
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._jobs.get_nowait())
+                except queue.Empty:
+                    break
+            
+            # None is the stop signal from close(); jobs queued before it still run
+            if None in batch:
+                stopping = True
+                batch = batch[:batch.index(None)]
+                if not batch:
+                    break
+            
+            results: List[Tuple[Future, bool, Any]] = []
+            try:
+                if conn is None:
+                    conn = self.pool.connect()
+                    conn.isolation_level = None  # Transactions are managed explicitly below
+                cursor = conn.cursor()
+                cursor.execute('BEGIN IMMEDIATE')
+                for job, future in batch:
+                    results.append((future, *self._run_job(cursor, job)))
+                cursor.execute('COMMIT')
+            except BaseException as e:
+                try:
+                    if conn is not None and conn.in_transaction:
+                        conn.execute('ROLLBACK')
+                except sqlite3.Error:
+                    # Broken connection; open a fresh one for the next batch
+                    conn.close()
+                    conn = None
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            
+            self.batches += 1
+            self.jobs += len(batch)
+            for future, ok, value in results:
+                if ok:
+                    future.set_result(value)
+                else:
+                    future.set_exception(value)
+        
+        if conn is not None:
+            conn.close()
+    
+    def _run_job(self, cursor: sqlite3.Cursor, job: Callable) -> Tuple[bool, Any]:
+        """Run one job inside a savepoint; returns (succeeded, result or exception)"""
+        cursor.execute('SAVEPOINT job')
+        try:
+            result = job(cursor)
+        except WriteAborted as e:
+            cursor.execute('ROLLBACK TO job')
+            cursor.execute('RELEASE job')
+            return True, e.result
+        except Exception as e:
+            cursor.execute('ROLLBACK TO job')
+            cursor.execute('RELEASE job')
+            return False, e
+        cursor.execute('RELEASE job')
+        return True, result